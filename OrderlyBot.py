@@ -1,13 +1,14 @@
+import asyncio
 import os
-import time
 import telegram.error
 import threading
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
 )
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -16,11 +17,29 @@ from telegram.ext import (
     ContextTypes,
     filters,
 )
-import psycopg
-from psycopg.rows import dict_row
+
+from db_engine import AsyncDatabaseEngine, DatabaseEngine, primary_unavailable
+from order_writer import OrderWriter
+from stats_cache import StatsCache
+from timezones import TIMESTAMP_FORMAT, MerchantTimezones, day_range
+from export import EXPORT_ARCHIVE_SELECT, EXPORT_CHUNK_SIZE, EXPORT_FORMATS, EXPORT_SELECT
+from counters import STATUSES, counters_to_stats
+from queries import QUERIES, compile_sql, cursor_dialect
+from migrations import migrate
+from archive import OrderArchiver
+from journal import JournalReconciler, journal_orders
+from leader import LeaderElection
+from rollups import OrderRollups
+from sessions import Session, SessionPersistence
+from outbox import OUTBOX_INSERT_SQL, OutboxDispatcher, enqueue_notifications, outbox_rows
+from scheduler import ADMIN_PRIORITY, REPORT_PRIORITY, SendScheduler
+from processor import ChatOrderedUpdateProcessor
+from conversation import CATEGORIES, LANGUAGES, ORDER_FLOW, PROMPTS, quantity_field
+from webhook import BOT_MODE, SECRET_HEADER, WEBHOOK_PATH, UpdateReceiver, run_webhook
+from search import POSTGRES_SEARCH_FILTER, SQLITE_SEARCH_FILTER, register_sqlite_functions, search_pattern
 
 # ================= IMPORT FLASK FOR ADMIN PANEL =================
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -53,144 +72,142 @@ def load_user(user_id):
         return User(1, "admin")
     return None
 
+# ================= SHARED QUERIES =================
+def order_params(order_data, merchant_id=1):
+    """ترتيب قيم الطلب حسب الاستعلام insert_order"""
+    return (
+        order_data['category'],
+        order_data['product'],
+        order_data['name'],
+        order_data['phone'],
+        order_data['address'],
+        order_data['quantity'],
+        order_data.get('size', ''),
+        order_data['lang'],
+        merchant_id
+    )
+
+# التحديدات الأكبر من هذا تُمرر عبر جدول مؤقت بدلاً من مصفوفة/قائمة معاملات
+BULK_TEMP_TABLE_MIN = int(os.getenv("BULK_TEMP_TABLE_MIN", 1000))
+
+# فترات صفحة التقارير بالأيام
+REPORT_PERIODS = (7, 30, 90, 365)
+
+ORDER_COLUMNS = 'category, product, customer_name, phone, address, quantity, size, language, merchant_id'
+
+def batch_insert_sql(orders, dialect):
+    """INSERT متعدد الصفوف لدفعة طلبات؛ ترتيب الأرقام المرجعة تصاعدياً يطابق ترتيب الدفعة"""
+    params = []
+    if dialect == 'postgresql':
+        # ORDER BY ord يضمن توليد أرقام SERIAL بنفس ترتيب الدفعة
+        rows = []
+        for ord_, order_data in enumerate(orders):
+            rows.append('(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)')
+            params.extend(order_params(order_data))
+            params.append(ord_)
+        query = f'''
+            INSERT INTO orders ({ORDER_COLUMNS})
+            SELECT {ORDER_COLUMNS} FROM (VALUES {', '.join(rows)})
+                AS v({ORDER_COLUMNS}, ord)
+            ORDER BY ord
+            RETURNING id
+        '''
+    else:
+        rows = []
+        for order_data in orders:
+            rows.append('(?, ?, ?, ?, ?, ?, ?, ?, ?)')
+            params.extend(order_params(order_data))
+        query = f'''
+            INSERT INTO orders ({ORDER_COLUMNS})
+            VALUES {', '.join(rows)}
+            RETURNING id
+        '''
+    return query, params
+
+def encode_page_cursor(order):
+    """مؤشر صفحة من مفتاح الترتيب (created_at, id)"""
+    return f"{order['created_at'].isoformat()}|{order['id']}"
+
+def decode_page_cursor(token):
+    """تحويل مؤشر الصفحة إلى (created_at, id) أو None إذا كان غير صالح"""
+    if not token:
+        return None
+    try:
+        created_at, order_id = token.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        return None
+
 # ================= DATABASE CLASS =================
 class Database:
-    def __init__(self):
-        self.conn = None
-        self.cursor = None
+    def __init__(self, engine=None):
+        self.engine = engine or DatabaseEngine(sqlite_configure=register_sqlite_functions)
+        self.cache = StatsCache()
+        self.timezones = MerchantTimezones(self.get_merchant)
+        self.rollups = OrderRollups(self.engine, self.timezones)
     
     def connect(self):
-        """الاتصال بقاعدة البيانات PostgreSQL"""
-        try:
-            DATABASE_URL = os.getenv('DATABASE_URL')
-            if not DATABASE_URL:
-                raise ValueError("DATABASE_URL not found in environment variables")
-            
-            # استخدم psycopg بدل psycopg2
-            self.conn = psycopg.connect(DATABASE_URL, sslmode='require')
-            self.cursor = self.conn.cursor(row_factory=dict_row)  # تغيير هنا
-            print("✅ Connected to PostgreSQL successfully")
-            
-            # اختبر الاتصال
-            self.cursor.execute("SELECT 1")
-            test = self.cursor.fetchone()
-            print(f"✅ Database test result: {test}")
-            
-            self.create_tables()
-        except Exception as e:
-            print(f"❌ Database connection error: {e}")
-            import traceback
-            traceback.print_exc()  # طباعة تفاصيل الخطأ
-            self.use_sqlite_as_fallback()
+        """فتح مجمع الاتصالات وإنشاء الجداول"""
+        self.engine.open()
+        self.create_tables()
     
-    def use_sqlite_as_fallback(self):
-        """استخدام SQLite كخيار احتياطي"""
-        import sqlite3
-        try:
-            self.conn = sqlite3.connect("orders.db", check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row
-            self.cursor = self.conn.cursor()
-            print("⚠️ Using SQLite as fallback")
-            self.create_sqlite_tables()
-        except Exception as e:
-            print(f"❌ SQLite fallback also failed: {e}")
+    def _sql(self, query):
+        """تحويل العلامات %s إلى ? عند العمل على SQLite"""
+        return compile_sql(query, self.engine.dialect)
     
     def create_tables(self):
-        """إنشاء الجداول في PostgreSQL"""
+        """إنشاء الجداول والفهارس عبر الترحيلات"""
         try:
-            # جدول الطلبات
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id SERIAL PRIMARY KEY,
-                    category VARCHAR(20) NOT NULL,
-                    product TEXT NOT NULL,
-                    customer_name TEXT NOT NULL,
-                    phone TEXT NOT NULL,
-                    address TEXT NOT NULL,
-                    quantity TEXT NOT NULL,
-                    size TEXT,
-                    language VARCHAR(5) DEFAULT 'ar',
-                    status VARCHAR(20) DEFAULT 'new',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    merchant_id INTEGER DEFAULT 1
-                )
-            ''')
-            
-            # جدول التجار
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS merchants (
-                    id SERIAL PRIMARY KEY,
-                    telegram_id BIGINT UNIQUE,
-                    username VARCHAR(100),
-                    business_name TEXT,
-                    plan VARCHAR(20) DEFAULT 'trial',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # إضافة بعض البيانات الافتراضية
-            self.cursor.execute('''
-                INSERT INTO merchants (id, telegram_id, username, business_name, plan)
-                VALUES (1, 5812937391, 'admin', 'OrderlyBot Admin', 'pro')
-                ON CONFLICT (id) DO NOTHING
-            ''')
-            
-            self.conn.commit()
-            print("✅ PostgreSQL tables created successfully")
+            migrate(self.engine)
         except Exception as e:
             print(f"❌ Error creating tables: {e}")
-            self.conn.rollback()
     
-    def create_sqlite_tables(self):
-        """إنشاء الجداول في SQLite"""
+    def _journaled(self, cursor):
+        """الكتابة ذهبت إلى SQLite بينما PostgreSQL مضبوط: تُسجل لإعادتها لاحقاً
+
+        يُحدد من المؤشر المستخدم فعلاً لا من المحرك (قد يتبدل المجمع أثناء الاستدعاء).
+        """
+        return bool(self.engine.dsn) and cursor_dialect(cursor) == 'sqlite'
+    
+    def _write_with_journal(self, write):
+        """write(open_cursor) على القاعدة الحالية؛ إذا انقطع PostgreSQL أثناء العمل
+        (قاطع مفتوح، خطأ اتصال، أو PoolTimeout والخادم لا يرد) تُكتب الطلبات في SQLite
+        المحلي مع السجل؛ المجمع الممتلئ والخادم يعمل ليس انقطاعاً فيصل الخطأ كما هو"""
         try:
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    category TEXT,
-                    product TEXT,
-                    customer_name TEXT,
-                    phone TEXT,
-                    address TEXT,
-                    quantity TEXT,
-                    size TEXT,
-                    language TEXT DEFAULT 'ar',
-                    status TEXT DEFAULT 'new',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            self.conn.commit()
-            print("✅ SQLite tables created as fallback")
+            return write(self.engine.cursor)
         except Exception as e:
-            print(f"❌ Error creating SQLite tables: {e}")
+            if self.engine.dialect != 'postgresql' or not primary_unavailable(e):
+                raise
+            print(f"⚠️ PostgreSQL unavailable, journaling orders locally: {e}")
+            self.engine.open_local(prepare=migrate)
+            return write(self.engine.local_cursor)
+    
+    def _insert_order(self, open_cursor, order_data):
+        with open_cursor() as cursor:
+            QUERIES.execute(cursor, 'insert_order', order_params(order_data))
+            order_id = cursor.fetchone()['id']
+            enqueue_notifications(cursor, [order_data], [order_id])
+            if self._journaled(cursor):
+                journal_orders(cursor, [order_id])
+        return order_id
+    
+    def _insert_orders(self, open_cursor, orders):
+        with open_cursor() as cursor:
+            # SQL بلهجة المؤشر الذي أُخذ فعلاً
+            query, params = batch_insert_sql(orders, cursor_dialect(cursor))
+            cursor.execute(query, params)
+            ids = sorted(row['id'] for row in cursor.fetchall())
+            enqueue_notifications(cursor, orders, ids)
+            if self._journaled(cursor):
+                journal_orders(cursor, ids)
+        return ids
     
     def add_order(self, order_data):
         """إضافة طلب جديد"""
         try:
-            query = '''
-                INSERT INTO orders 
-                (category, product, customer_name, phone, address, quantity, size, language, merchant_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            '''
-            
-            self.cursor.execute(query, (
-                order_data['category'],
-                order_data['product'],
-                order_data['name'],
-                order_data['phone'],
-                order_data['address'],
-                order_data['quantity'],
-                order_data.get('size', ''),
-                order_data['lang'],
-                1
-            ))
+            order_id = self._write_with_journal(lambda open_cursor: self._insert_order(open_cursor, order_data))
+            self.cache.invalidate()
             
-            # تغيير هنا لأن psycopg يرجع tuple
-            result = self.cursor.fetchone()
-            order_id = result['id'] if isinstance(result, dict) else result[0]
-            
-            self.conn.commit()
             print(f"✅ Order #{order_id} saved to database")
             return order_id
             
@@ -198,56 +215,93 @@ class Database:
             print(f"❌ Error saving order: {e}")
             import traceback
             traceback.print_exc()
-            self.conn.rollback()
             return None
     
+    def add_orders(self, orders):
+        """إضافة دفعة طلبات في INSERT واحد و commit واحد"""
+        ids = self._write_with_journal(lambda open_cursor: self._insert_orders(open_cursor, orders))
+        self.cache.invalidate()
+        return ids
+    
     def get_orders_by_merchant(self, merchant_id, limit=50):
         """جلب طلبات تاجر معين"""
         try:
-            query = '''
-                SELECT * FROM orders 
-                WHERE merchant_id = %s 
-                ORDER BY created_at DESC 
-                LIMIT %s
-            '''
-            self.cursor.execute(query, (merchant_id, limit))
-            return self.cursor.fetchall()
+            with self.engine.cursor() as cursor:
+                QUERIES.execute(cursor, 'orders_by_merchant', (merchant_id, limit))
+                return cursor.fetchall()
         except Exception as e:
             print(f"❌ Error fetching orders: {e}")
             return []
     
+    def order_stats_params(self, merchant_id):
+        """معاملات order_stats: "اليوم" حسب توقيت التاجر كنطاق على created_at"""
+        return (merchant_id, merchant_id, *day_range(self.timezones.get(merchant_id)))
+    
+    def _load_order_stats(self, merchant_id):
+        params = self.order_stats_params(merchant_id)
+        with self.engine.cursor() as cursor:
+            QUERIES.execute(cursor, 'order_stats', params)
+            return counters_to_stats(cursor.fetchall())
+    
     def get_order_stats(self, merchant_id):
-        """الحصول على إحصائيات الطلبات"""
+        """الحصول على إحصائيات الطلبات (من الكاش إذا كانت حديثة)"""
         try:
-            stats = {}
-            
-            self.cursor.execute('SELECT COUNT(*) FROM orders WHERE merchant_id = %s', (merchant_id,))
-            stats['total'] = self.cursor.fetchone()['count']
-            
-            self.cursor.execute('SELECT COUNT(*) FROM orders WHERE merchant_id = %s AND status = %s', 
-                              (merchant_id, 'new'))
-            stats['new'] = self.cursor.fetchone()['count']
-            
-            self.cursor.execute('SELECT COUNT(*) FROM orders WHERE merchant_id = %s AND status = %s', 
-                              (merchant_id, 'completed'))
-            stats['completed'] = self.cursor.fetchone()['count']
-            
-            self.cursor.execute('''
-                SELECT COUNT(*) FROM orders 
-                WHERE merchant_id = %s AND DATE(created_at) = CURRENT_DATE
-            ''', (merchant_id,))
-            stats['today'] = self.cursor.fetchone()['count']
-            
-            return stats
+            return self.cache.get_or_load(('order_stats', merchant_id),
+                                          lambda: self._load_order_stats(merchant_id))
             
         except Exception as e:
             print(f"❌ Error getting stats: {e}")
-            return {'total': 0, 'new': 0, 'completed': 0, 'today': 0}
+            return {'total': 0, 'new': 0, 'completed': 0, 'today': 0, 'by_status': {}, 'archived': 0,
+                    'active': {}, 'by_category': {}}
+    
+    def get_report(self, merchant_id, days=30):
+        """تقرير الفترة من جداول التجميع (بدون مسح جدول الطلبات)"""
+        try:
+            self.rollups.refresh_if_stale()
+            daily = self.rollups.daily(merchant_id, days)
+            return {
+                'daily': daily,
+                'total_orders': sum(day['total_orders'] for day in daily),
+                'completed_orders': sum(day['completed_orders'] for day in daily),
+                'by_status': self.rollups.top(merchant_id, 'status', days),
+                'top_categories': self.rollups.top(merchant_id, 'category', days),
+                'top_products': self.rollups.top(merchant_id, 'product', days),
+            }
+        except Exception as e:
+            print(f"❌ Error building report: {e}")
+            return {'daily': [], 'total_orders': 0, 'completed_orders': 0,
+                    'by_status': [], 'top_categories': [], 'top_products': []}
     
     # ===== FUNCTIONS FOR ADMIN PANEL =====
     
-    def get_orders_with_filters(self, status_filter='all', category_filter='all', limit=50):
-        """جلب الطلبات مع التصفية"""
+    def _load_listing_window(self, merchant_id):
+        with self.engine.cursor() as cursor:
+            cursor.execute(self._sql('SELECT MIN(created_at) AS first FROM orders WHERE merchant_id = %s'),
+                           (merchant_id,))
+            first = cursor.fetchone()['first']
+        if isinstance(first, str):
+            first = datetime.strptime(first[:19], TIMESTAMP_FORMAT)
+        return first
+    
+    def listing_window(self, merchant_id):
+        """حدود created_at للقوائم: من أقدم طلب في orders حتى الغد (UTC)
+        
+        القوائم لا تستبعد أي طلب، لكن النطاق الصريح يسمح لـ PostgreSQL بتقليم الأقسام:
+        أقسام الأشهر القادمة الفارغة والقسم الافتراضي لا تُقرأ (مقارنة (created_at, id)
+        وحدها لا تكفي للتقليم).
+        """
+        first = self.cache.get_or_load(('listing_window', merchant_id),
+                                       lambda: self._load_listing_window(merchant_id))
+        until = (datetime.now(timezone.utc) + timedelta(days=1)).strftime(TIMESTAMP_FORMAT)
+        return (first.strftime(TIMESTAMP_FORMAT) if first else None), until
+    
+    def get_orders_with_filters(self, status_filter='all', category_filter='all', limit=50,
+                                older_than=None, newer_than=None, search_term=''):
+        """جلب الطلبات مع التصفية (الأحدث أولاً)
+        
+        older_than / newer_than: مفتاح (created_at, id) للترقيم بدون OFFSET
+        search_term: بحث بالاسم أو الهاتف أو المنتج عبر فهرس البحث
+        """
         try:
             query = '''
                 SELECT * FROM orders 
@@ -255,6 +309,13 @@ class Database:
             '''
             params = []
             
+            first, until = self.listing_window(1)
+            if first:
+                query += ' AND created_at >= %s'
+                params.append(first)
+            query += ' AND created_at < %s'
+            params.append(until)
+            
             if status_filter != 'all':
                 query += ' AND status = %s'
                 params.append(status_filter)
@@ -263,105 +324,343 @@ class Database:
                 query += ' AND category = %s'
                 params.append(category_filter)
             
-            query += ' ORDER BY created_at DESC LIMIT %s'
+            if search_term.strip():
+                query += POSTGRES_SEARCH_FILTER if self.engine.dialect == 'postgresql' else SQLITE_SEARCH_FILTER
+                params.append(search_pattern(search_term))
+            
+            if older_than:
+                query += ' AND created_at <= %s AND (created_at, id) < (%s, %s)'
+                params.extend((older_than[0], *older_than))
+            
+            # الصفحة الأحدث تُقرأ تصاعدياً من المفتاح ثم تُعكس
+            direction = 'ASC' if newer_than else 'DESC'
+            if newer_than:
+                query += ' AND created_at >= %s AND (created_at, id) > (%s, %s)'
+                params.extend((newer_than[0], *newer_than))
+            
+            query += f' ORDER BY created_at {direction}, id {direction} LIMIT %s'
             params.append(limit)
             
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
+            with self.engine.cursor() as cursor:
+                cursor.execute(self._sql(query), params)
+                orders = cursor.fetchall()
+            return orders[::-1] if newer_than else orders
         except Exception as e:
             print(f"❌ Error in get_orders_with_filters: {e}")
             return []
     
+    def iter_orders(self, status_filter='all', date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE,
+                    include_archived=False):
+        """قراءة الطلبات دفعة بدفعة عبر مؤشر على الخادم للتصدير بذاكرة ثابتة
+        
+        date_from / date_to: تاريخان (شاملان) بصيغة YYYY-MM-DD
+        include_archived: القراءة من orders_all (الطلبات + الأرشيف)
+        """
+        query = (EXPORT_ARCHIVE_SELECT if include_archived else EXPORT_SELECT) + ' WHERE merchant_id = 1'
+        params = []
+        
+        if status_filter != 'all':
+            query += ' AND status = %s'
+            params.append(status_filter)
+        
+        # نطاق نصف مفتوح [من، إلى + يوم) حتى يُستخدم فهرس created_at
+        if date_from:
+            query += ' AND created_at >= %s'
+            params.append(date_from.isoformat())
+        if date_to:
+            query += ' AND created_at < %s'
+            params.append((date_to + timedelta(days=1)).isoformat())
+        
+        query += ' ORDER BY created_at, id'
+        
+        with self.engine.connection() as conn:
+            # المؤشر المسمى في PostgreSQL يبقى على الخادم ويُقرأ على دفعات؛
+            # مؤشر SQLite يقرأ الصفوف تدريجياً أصلاً
+            if self.engine.dialect == 'postgresql':
+                cursor = conn.cursor(name='orders_export')
+                cursor.itersize = chunk_size
+            else:
+                cursor = conn.cursor()
+            try:
+                cursor.execute(self._sql(query), params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+                conn.rollback()
+    
+    def get_orders_page(self, status_filter='all', per_page=20, next_cursor=None, prev_cursor=None,
+                        search_term=''):
+        """صفحة طلبات بترقيم keyset مع مؤشرات الصفحة التالية والسابقة"""
+        older_than = decode_page_cursor(next_cursor)
+        newer_than = None if older_than else decode_page_cursor(prev_cursor)
+        
+        orders = self.get_orders_with_filters(status_filter=status_filter, limit=per_page + 1,
+                                              older_than=older_than, newer_than=newer_than,
+                                              search_term=search_term)
+        more = len(orders) > per_page
+        if newer_than:
+            orders = orders[-per_page:]
+            has_newer, has_older = more, True
+        else:
+            orders = orders[:per_page]
+            has_newer, has_older = older_than is not None, more
+        
+        return {
+            'orders': orders,
+            'next_cursor': encode_page_cursor(orders[-1]) if orders and has_older else None,
+            'prev_cursor': encode_page_cursor(orders[0]) if orders and has_newer else None,
+        }
+    
+    def count_orders(self, status_filter='all'):
+        """عدد الطلبات في القوائم من العدادات (بدون COUNT(*) وبدون المؤرشف)"""
+        active = self.get_order_stats(1)['active']
+        if status_filter == 'all':
+            return sum(active.values())
+        return active.get(status_filter, 0)
+    
     def get_advanced_stats(self):
-        """جلب إحصائيات متقدمة"""
+        """جلب إحصائيات متقدمة من العدادات"""
+        stats = self.get_order_stats(1)
+        return {
+            'total_orders': stats['total'],
+            'new_orders': stats['new'],
+            'completed_orders': stats['completed'],
+            'today_orders': stats['today'],
+            # أعداد أزرار الفلترة في صفحة الطلبات: ما تعرضه القائمة فعلاً
+            'active_orders': sum(stats['active'].values()),
+            'active_completed_orders': stats['active'].get('completed', 0),
+            'category_stats': [{'category': category, 'count': count}
+                               for category, count in stats['by_category'].items()],
+        }
+    
+    def get_order(self, order_id):
+        """جلب طلب واحد"""
+        with self.engine.cursor() as cursor:
+            QUERIES.execute(cursor, 'get_order', (order_id, 1))
+            return cursor.fetchone()
+    
+    def get_merchant(self, merchant_id):
+        """جلب بيانات التاجر"""
+        with self.engine.cursor() as cursor:
+            QUERIES.execute(cursor, 'get_merchant', (merchant_id,))
+            return cursor.fetchone()
+    
+    def count_new_orders(self):
+        """عدد الطلبات الجديدة"""
+        return self.get_order_stats(1)['new']
+    
+    def update_order_status(self, order_id, status):
+        """تحديث حالة الطلب"""
+        with self.engine.cursor() as cursor:
+            QUERIES.execute(cursor, 'update_order_status', (status, order_id, 1))
+            updated = cursor.rowcount
+        self.cache.invalidate()
+        return updated
+    
+    def _bulk_ids_filter(self, cursor, order_ids):
+        """شرط id لدفعة طلبات: مصفوفة واحدة، أو جدول مؤقت للتحديدات الكبيرة"""
+        if len(order_ids) < BULK_TEMP_TABLE_MIN:
+            if self.engine.dialect == 'postgresql':
+                return 'id = ANY(%s)', [order_ids]
+            return f"id IN ({', '.join(['%s'] * len(order_ids))})", list(order_ids)
+        
+        if self.engine.dialect == 'postgresql':
+            cursor.execute('CREATE TEMP TABLE bulk_ids (id INTEGER PRIMARY KEY) ON COMMIT DROP')
+            with cursor.copy('COPY bulk_ids (id) FROM STDIN') as copy:
+                for order_id in order_ids:
+                    copy.write_row((order_id,))
+        else:
+            cursor.execute('CREATE TEMP TABLE IF NOT EXISTS bulk_ids (id INTEGER PRIMARY KEY)')
+            cursor.execute('DELETE FROM bulk_ids')
+            cursor.executemany('INSERT INTO bulk_ids (id) VALUES (?)', [(order_id,) for order_id in order_ids])
+        return 'id IN (SELECT id FROM bulk_ids)', []
+    
+    def update_orders_status(self, order_ids, status):
+        """تحديث حالة عدة طلبات بجملة واحدة؛ يرجع أرقام الطلبات التي تغيرت فعلاً"""
+        order_ids = sorted({int(order_id) for order_id in order_ids})
+        if not order_ids:
+            return []
+        with self.engine.cursor() as cursor:
+            id_filter, params = self._bulk_ids_filter(cursor, order_ids)
+            cursor.execute(self._sql(f'''
+                UPDATE orders 
+                SET status = %s 
+                WHERE merchant_id = 1 AND status <> %s AND {id_filter}
+                RETURNING id
+            '''), [status, status, *params])
+            updated_ids = sorted(row['id'] for row in cursor.fetchall())
+        if updated_ids:
+            self.cache.invalidate()
+        return updated_ids
+    
+    def delete_orders(self, order_ids):
+        """حذف عدة طلبات بجملة واحدة؛ يرجع أرقام الطلبات المحذوفة فعلاً"""
+        order_ids = sorted({int(order_id) for order_id in order_ids})
+        if not order_ids:
+            return []
+        with self.engine.cursor() as cursor:
+            id_filter, params = self._bulk_ids_filter(cursor, order_ids)
+            cursor.execute(self._sql(f'DELETE FROM orders WHERE merchant_id = 1 AND {id_filter} RETURNING id'), params)
+            deleted_ids = sorted(row['id'] for row in cursor.fetchall())
+        if deleted_ids:
+            self.cache.invalidate()
+        return deleted_ids
+    
+    def delete_order(self, order_id):
+        """حذف طلب"""
+        with self.engine.cursor() as cursor:
+            QUERIES.execute(cursor, 'delete_order', (order_id, 1))
+            deleted = cursor.rowcount
+        self.cache.invalidate()
+        return deleted
+
+# ================= ASYNC DATABASE CLASS =================
+class AsyncDatabase:
+    """نسخة غير متزامنة من Database لمعالجات البوت"""
+    
+    def __init__(self, sync_db):
+        self.sync_db = sync_db
+        self.engine = AsyncDatabaseEngine(sync_db.engine)
+    
+    async def open(self):
+        await self.engine.open()
+    
+    async def close(self):
+        await self.engine.close()
+    
+    async def add_order(self, order_data):
+        """إضافة طلب جديد"""
+        if not self.engine.native:
+            return await self.engine.run_sync(self.sync_db.add_order, order_data)
         try:
-            stats = {}
-            
-            self.cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_orders,
-                    SUM(CASE WHEN status = 'new' THEN 1 ELSE 0 END) as new_orders,
-                    SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed_orders,
-                    SUM(CASE WHEN DATE(created_at) = CURRENT_DATE THEN 1 ELSE 0 END) as today_orders
-                FROM orders 
-                WHERE merchant_id = 1
-            ''')
-            basic_stats = self.cursor.fetchone()
+            async with self.engine.cursor() as cursor:
+                await QUERIES.execute_async(cursor, 'insert_order', order_params(order_data))
+                order_id = (await cursor.fetchone())['id']
+                notifications = outbox_rows([order_data], [order_id])
+                if notifications:
+                    await cursor.executemany(OUTBOX_INSERT_SQL, notifications)
+            self.sync_db.cache.invalidate()
             
-            stats.update(basic_stats)
+            print(f"✅ Order #{order_id} saved to database")
+            return order_id
             
+        except Exception as e:
+            if primary_unavailable(e):
+                # المسار المتزامن يكتب في السجل المحلي
+                return await self.engine.run_sync(self.sync_db.add_order, order_data)
+            print(f"❌ Error saving order: {e}")
+            return None
+    
+    async def add_orders(self, orders):
+        """إضافة دفعة طلبات في INSERT واحد و commit واحد"""
+        if not self.engine.native:
+            return await self.engine.run_sync(self.sync_db.add_orders, orders)
+        query, params = batch_insert_sql(orders, 'postgresql')
+        try:
+            async with self.engine.cursor() as cursor:
+                await cursor.execute(query, params)
+                ids = sorted(row['id'] for row in await cursor.fetchall())
+                notifications = outbox_rows(orders, ids)
+                if notifications:
+                    await cursor.executemany(OUTBOX_INSERT_SQL, notifications)
+        except Exception as e:
+            if not primary_unavailable(e):
+                raise
+            return await self.engine.run_sync(self.sync_db.add_orders, orders)
+        self.sync_db.cache.invalidate()
+        return ids
+    
+    async def get_orders_by_merchant(self, merchant_id, limit=50):
+        """جلب طلبات تاجر معين"""
+        if not self.engine.native:
+            return await self.engine.run_sync(self.sync_db.get_orders_by_merchant, merchant_id, limit)
+        try:
+            async with self.engine.cursor() as cursor:
+                await QUERIES.execute_async(cursor, 'orders_by_merchant', (merchant_id, limit))
+                return await cursor.fetchall()
+        except Exception as e:
+            print(f"❌ Error fetching orders: {e}")
+            return []
+    
+    async def get_orders_page(self, status_filter='all', per_page=20, next_cursor=None, prev_cursor=None):
+        """صفحة طلبات بترقيم keyset (نفس استعلام لوحة التحكم في خيط منفصل)"""
+        return await self.engine.run_sync(self.sync_db.get_orders_page, status_filter, per_page,
+                                          next_cursor, prev_cursor)
+    
+    async def get_order_stats(self, merchant_id):
+        """الحصول على إحصائيات الطلبات"""
+        if not self.engine.native:
+            return await self.engine.run_sync(self.sync_db.get_order_stats, merchant_id)
+        cache = self.sync_db.cache
+        key = ('order_stats', merchant_id)
+        hit, stats = cache.get(key)
+        if hit:
+            return stats
+        try:
+            generation = cache.generation()
+            params = await self.engine.run_sync(self.sync_db.order_stats_params, merchant_id)
+            async with self.engine.cursor() as cursor:
+                await QUERIES.execute_async(cursor, 'order_stats', params)
+                stats = counters_to_stats(await cursor.fetchall())
+            cache.set(key, stats, generation=generation)
             return stats
-            
         except Exception as e:
-            print(f"❌ Error getting advanced stats: {e}")
-            return {}
+            print(f"❌ Error getting stats: {e}")
+            return {'total': 0, 'new': 0, 'completed': 0, 'today': 0, 'by_status': {}, 'archived': 0,
+                    'active': {}, 'by_category': {}}
 
 # ================= INITIALIZE DATABASE =================
 db = Database()
 db.connect()
+adb = AsyncDatabase(db)
+order_writer = OrderWriter(adb.add_orders)
+# إعادة الطلبات المكتوبة محلياً إلى PostgreSQL عند عودته
+reconciler = JournalReconciler(db.engine, prepare=migrate, on_primary=db.cache.invalidate)
+archiver = OrderArchiver(db.engine, on_archived=db.cache.invalidate)
+receiver = UpdateReceiver()
+leader = LeaderElection(db.engine)
+persistence = SessionPersistence(db.engine)
+outbox = OutboxDispatcher(db.engine, render=lambda order: admin_order_message(order),
+                          render_digest=lambda orders: admin_digest_message(orders))
+# كل رسائل البوت الصادرة تمر بحدود الإرسال والأولويات
+scheduler = SendScheduler()
+# تحديثات المحادثات المختلفة بالتوازي، وتحديثات المحادثة الواحدة بالترتيب
+update_processor = ChatOrderedUpdateProcessor()
 
 # ================= TELEGRAM BOT CONFIGURATION =================
 TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = 5812937391
+MYORDERS_PAGE_SIZE = int(os.getenv("MYORDERS_PAGE_SIZE", 5))
+MYORDERS_CACHE_TTL = float(os.getenv("MYORDERS_CACHE_TTL", 60))
+MYORDERS_CACHE_MAX = int(os.getenv("MYORDERS_CACHE_MAX", 200))
+
+# صفحات /myorders المعروضة لكل رسالة: التنقل ذهاباً وإياباً لا يعيد الاستعلام
+myorders_pages = StatsCache(ttl=MYORDERS_CACHE_TTL, max_entries=MYORDERS_CACHE_MAX)
 
 # ================= TEXTS =================
+# أسئلة خطوات الطلب ولوحات الأزرار في conversation.py
 TEXT = {
-    "lang": {
-        "ar": "اختر نوع النشاط:",
-        "en": "Choose business type:"
-    },
-    "category": {
-        "ar": ["🍔 طعام", "👕 ملابس"],
-        "en": ["🍔 Food", "👕 Clothing"]
-    },
-    "ask_product": {
-        "ar": "اختر المنتج:",
-        "en": "Choose product:"
-    },
-    "ask_name": {
-        "ar": "اكتب اسمك:",
-        "en": "Enter your name:"
-    },
-    "ask_phone": {
-        "ar": "اكتب رقم الهاتف:",
-        "en": "Enter phone number:"
-    },
-    "ask_address": {
-        "ar": "اكتب العنوان:",
-        "en": "Enter address:"
-    },
-    "ask_quantity": {
-        "ar": "اكتب الكمية:",
-        "en": "Enter quantity:"
-    },
-    "ask_size": {
-        "ar": "اكتب المقاس:",
-        "en": "Enter size:"
-    },
     "confirm": {
         "ar": "✅ تم استلام طلبك، سنتواصل معك قريبًا",
         "en": "✅ Order received, we will contact you soon"
     }
 }
 
-PRODUCTS = {
-    "food": ["🍕 Pizza", "🍔 Burger", "🥗 Salad"],
-    "clothing": ["👕 T-Shirt", "👖 Jeans", "🧥 Jacket"]
-}
+STATUS_EMOJI = {'all': "📋", 'new': "🆕", 'processing': "⏳", 'completed': "✅", 'cancelled': "❌"}
+STATUS_LABELS = {'all': "كل الطلبات", 'new': "الطلبات الجديدة", 'processing': "قيد التنفيذ",
+                 'completed': "الطلبات المكتملة", 'cancelled': "الطلبات الملغاة"}
 
 # ================= TELEGRAM BOT HANDLERS =================
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """بدء المحادثة"""
-    keyboard = [
-        [
-            InlineKeyboardButton("🇸🇦 العربية", callback_data="lang_ar"),
-            InlineKeyboardButton("🇺🇸 English", callback_data="lang_en")
-        ]
-    ]
     await update.message.reply_text(
-        "اختر اللغة / Choose language:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        PROMPTS["language"],
+        reply_markup=ORDER_FLOW.language_keyboard
     )
 
 async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -373,76 +672,117 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if data.startswith("lang_"):
         lang = data.split("_")[1]
+        if lang not in LANGUAGES:
+            return
         context.user_data["lang"] = lang
 
-        keyboard = [
-            [
-                InlineKeyboardButton(TEXT["category"][lang][0], callback_data="cat_food"),
-                InlineKeyboardButton(TEXT["category"][lang][1], callback_data="cat_clothing")
-            ]
-        ]
         await query.edit_message_text(
-            TEXT["lang"][lang],
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            PROMPTS["category"][lang],
+            reply_markup=ORDER_FLOW.category_keyboards[lang]
         )
 
     elif data.startswith("cat_"):
-        category = data.split("_")[1]
+        category = data.split("_", 1)[1]
+        if category not in CATEGORIES:
+            return
         context.user_data["category"] = category
-        lang = context.user_data["lang"]
-
-        keyboard = [
-            [InlineKeyboardButton(p, callback_data=f"prod_{p}")]
-            for p in PRODUCTS[category]
-        ]
+        lang = context.user_data.get("lang", "ar")
 
         await query.edit_message_text(
-            TEXT["ask_product"][lang],
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            PROMPTS["product"][lang],
+            reply_markup=ORDER_FLOW.product_keyboards[category]
         )
 
     elif data.startswith("prod_"):
-        product = data.replace("prod_", "")
-        context.user_data["product"] = product
-        lang = context.user_data["lang"]
-
-        await query.edit_message_text(TEXT["ask_name"][lang])
-        context.user_data["step"] = "name"
+        prompt = ORDER_FLOW.choose_product(context.user_data, data.replace("prod_", "", 1))
+        if prompt:
+            await query.edit_message_text(prompt)
 
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """معالجة الرسائل النصية"""
-    step = context.user_data.get("step")
-    lang = context.user_data.get("lang")
-
-    if step == "name":
-        context.user_data["name"] = update.message.text
-        await update.message.reply_text(TEXT["ask_phone"][lang])
-        context.user_data["step"] = "phone"
-
-    elif step == "phone":
-        context.user_data["phone"] = update.message.text
-        await update.message.reply_text(TEXT["ask_address"][lang])
-        context.user_data["step"] = "address"
-
-    elif step == "address":
-        context.user_data["address"] = update.message.text
-        await update.message.reply_text(TEXT["ask_quantity"][lang])
-        context.user_data["step"] = "quantity"
-
-    elif step == "quantity":
-        context.user_data["quantity"] = update.message.text
-        if context.user_data["category"] == "clothing":
-            await update.message.reply_text(TEXT["ask_size"][lang])
-            context.user_data["step"] = "size"
-        else:
-            await save_order(update, context)
+    """معالجة الرسائل النصية: خطوة واحدة في محادثة الطلب"""
+    result = ORDER_FLOW.advance(context.user_data, update.message.text)
+    if result is None:
+        return
 
-    elif step == "size":
-        context.user_data["size"] = update.message.text
+    reply, done = result
+    if done:
         await save_order(update, context)
+    else:
+        await update.message.reply_text(reply)
+
+async def send_report(update, context, text, reply_markup=None):
+    """رسائل التقارير تأتي بعد ردود العملاء وإشعارات الطلبات في طابور الإرسال"""
+    chat_id = update.effective_chat.id
+    try:
+        return await context.bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown',
+                                              reply_markup=reply_markup, rate_limit_args=REPORT_PRIORITY)
+    except telegram.error.BadRequest:
+        return await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup,
+                                              rate_limit_args=REPORT_PRIORITY)
+
+def admin_order_message(order):
+    """نص إشعار الأدمن بطلب جديد (يُبنى عند الإرسال من صف الطلب)"""
+    return f"""
+📦 **طلب جديد #{order['id']}**
+
+**التفاصيل:**
+- النوع: {ORDER_FLOW.label(order['category'])}
+- المنتج: {order['product']}
+- الاسم: {order['customer_name']}
+- الهاتف: {order['phone']}
+- العنوان: {order['address']}
+- الكمية: {order['quantity']}
+- المقاس: {order['size'] or 'غير محدد'}
+- اللغة: {'عربي' if order['language'] == 'ar' else 'English'}
+
+⏰ {order['created_at'].strftime('%Y-%m-%d %I:%M %p')}
+    """
+
+def admin_digest_message(orders):
+    """ملخص طلبات في وقت الذروة: أعداد مجمعة ثم سطر لكل طلب"""
+    by_category, by_product, unparsed = {}, {}, {}
+    for order in orders:
+        by_category[order['category']] = by_category.get(order['category'], 0) + 1
+        # العمود نصي وقد يحوي كميات قديمة غير رقمية ("نصف كيلو")؛ تُعرض كما هي
+        quantity = quantity_field(str(order['quantity'] or ''))
+        if quantity is not None:
+            by_product[order['product']] = by_product.get(order['product'], 0) + int(quantity)
+        elif order['quantity']:
+            unparsed.setdefault(order['product'], []).append(str(order['quantity']))
+
+    def quantities(product):
+        parts = ([str(by_product[product])] if product in by_product else []) + unparsed.get(product, [])
+        return escape_markdown(' + '.join(parts))
+
+    products = sorted(set(by_product) | set(unparsed), key=lambda product: -by_product.get(product, 0))
+    summary = f"""📦 **{len(orders)} طلبات جديدة** (#{orders[0]['id']} - #{orders[-1]['id']})
+
+**حسب النوع:** """ + " | ".join(f"{ORDER_FLOW.label(category)}: {count}"
+                                  for category, count in by_category.items()) + """
+**الكميات:** """ + " | ".join(f"{escape_markdown(product)} × {quantities(product)}"
+                             for product in products) + """
+────────────────────"""
+
+    # بيانات العميل تُهرب حتى لا يكسر حرف مثل _ أو * تنسيق الملخص كله
+    lines = [
+        escape_markdown(
+            f"#{order['id']} {order['product']} × {order['quantity']}"
+            f"{' (' + order['size'] + ')' if order['size'] else ''} - {order['customer_name']} - {order['phone']}"
+            f" - {order['address']}"
+        )
+        for order in orders
+    ]
+    return summary, lines
+
+async def send_admin_notification(bot, chat_id, text):
+    """إرسال إشعار؛ إذا كسرت بيانات العميل تنسيق Markdown يُرسل كنص عادي"""
+    try:
+        await bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown', rate_limit_args=ADMIN_PRIORITY)
+    except telegram.error.BadRequest:
+        await bot.send_message(chat_id=chat_id, text=text, rate_limit_args=ADMIN_PRIORITY)
 
 async def save_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """حفظ الطلب في قاعدة البيانات"""
+    """حفظ الطلب في قاعدة البيانات؛ إشعار الأدمن يُكتب في admin_outbox بنفس المعاملة"""
     data = context.user_data
     lang = data["lang"]
 
@@ -455,36 +795,15 @@ async def save_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
             'address': data["address"],
             'quantity': data["quantity"],
             'size': data.get("size", ""),
-            'lang': lang
+            'lang': lang,
+            'notify_chat_id': ADMIN_ID
         }
 
-        order_id = db.add_order(order_data)
+        order_id = await order_writer.submit(order_data)
 
         if order_id:
             await update.message.reply_text(TEXT["confirm"][lang])
-
-            order_msg = f"""
-📦 **طلب جديد #{order_id}**
-
-**التفاصيل:**
-- النوع: {'🍔 طعام' if data['category'] == 'food' else '👕 ملابس'}
-- المنتج: {data['product']}
-- الاسم: {data['name']}
-- الهاتف: {data['phone']}
-- العنوان: {data['address']}
-- الكمية: {data['quantity']}
-- المقاس: {data.get('size', 'غير محدد')}
-- اللغة: {'عربي' if lang == 'ar' else 'English'}
-
-⏰ {datetime.now().strftime('%Y-%m-%d %I:%M %p')}
-            """
-            
-            await context.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=order_msg,
-                parse_mode='Markdown'
-            )
-            
+            outbox.wake()
             print(f"✅ Order #{order_id} processed successfully")
         else:
             await update.message.reply_text("❌ حدث خطأ في حفظ الطلب، يرجى المحاولة لاحقاً")
@@ -496,46 +815,66 @@ async def save_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     finally:
         context.user_data.clear()
 
-async def myorders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """عرض الطلبات للتاجر"""
-    user_id = update.effective_user.id
+def myorders_button(text, status, page, direction='', cursor=''):
+    """زر تنقل؛ المؤشر في callback_data (حد Telegram 64 بايت يكفي لمفتاح keyset)"""
+    return InlineKeyboardButton(text, callback_data=f"mo|{status}|{page}|{direction}|{cursor}")
+
+async def load_myorders_page(status, page, direction='', cursor=''):
+    """نص صفحة من /myorders ولوحة أزرارها (فلتر الحالة + السابق/التالي)"""
+    stats = await adb.get_order_stats(1)
+    page_data = await adb.get_orders_page(
+        status_filter=status, per_page=MYORDERS_PAGE_SIZE,
+        next_cursor=cursor if direction == 'n' else None,
+        prev_cursor=cursor if direction == 'p' else None,
+    )
+    # الصفحات من عدد ما في القائمة (بدون المؤرشف)؛ الإجمالي أعلاه يشمل الأرشيف
+    active = stats['active']
+    total = sum(active.values()) if status == 'all' else active.get(status, 0)
+    pages = max(1, -(-total // MYORDERS_PAGE_SIZE))
     
-    if user_id == ADMIN_ID:
-        try:
-            stats = db.get_order_stats(1)
-            orders = db.get_orders_by_merchant(1, limit=10)
-            
-            if not orders:
-                await update.message.reply_text("📭 لا توجد طلبات حتى الآن.")
-                return
-            
-            stats_msg = f"""
+    text = f"""
 📊 **إحصائيات الطلبات:**
+• الإجمالي مع الأرشيف: {stats['total']} | جديدة: {stats['new']} | مكتملة: {stats['completed']} | اليوم: {stats['today']}
 
-• إجمالي الطلبات: {stats['total']}
-• طلبات جديدة: {stats['new']}
-• طلبات مكتملة: {stats['completed']}
-• طلبات اليوم: {stats['today']}
+{STATUS_EMOJI[status]} **{STATUS_LABELS[status]}** ({total}) - صفحة {page}/{pages}
 ────────────────────
-            """
-            
-            orders_msg = "📋 **آخر الطلبات:**\n\n"
-            
-            for order in orders:
-                status_emoji = "🆕" if order['status'] == 'new' else "✅" if order['status'] == 'completed' else "⏳"
-                category_emoji = "🍔" if order['category'] == 'food' else "👕"
-                
-                orders_msg += f"""
-{status_emoji} **طلب #{order['id']}** ({category_emoji})
+    """
+    
+    if not page_data['orders']:
+        text += "\n📭 لا توجد طلبات حتى الآن."
+    
+    for order in page_data['orders']:
+        text += f"""
+{STATUS_EMOJI.get(order['status'], "⏳")} **طلب #{order['id']}** ({ORDER_FLOW.label(order['category'])})
 👤 {order['customer_name']} - 📞 {order['phone']}
 📍 {order['address']}
 📦 {order['product']} × {order['quantity']}
 ⏰ {order['created_at'].strftime('%d/%m %I:%M %p')}
 ────────────────────
-                """
-            
-            await update.message.reply_text(stats_msg, parse_mode='Markdown')
-            await update.message.reply_text(orders_msg, parse_mode='Markdown')
+        """
+    
+    filters_row = [
+        myorders_button(f"[{emoji}]" if key == status else emoji, key, 1)
+        for key, emoji in STATUS_EMOJI.items()
+    ]
+    nav_row = []
+    if page_data['prev_cursor']:
+        nav_row.append(myorders_button("⬅️ السابق", status, page - 1, 'p', page_data['prev_cursor']))
+    if page_data['next_cursor']:
+        nav_row.append(myorders_button("التالي ➡️", status, page + 1, 'n', page_data['next_cursor']))
+    
+    return text, InlineKeyboardMarkup([filters_row, nav_row] if nav_row else [filters_row])
+
+async def myorders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض الطلبات للتاجر: صفحة أولى بأزرار تنقل وفلترة"""
+    user_id = update.effective_user.id
+    
+    if user_id == ADMIN_ID:
+        try:
+            # الأمر يقرأ دائماً من القاعدة؛ الكاش للتنقل داخل الرسالة فقط
+            text, keyboard = await load_myorders_page('all', 1)
+            message = await send_report(update, context, text, reply_markup=keyboard)
+            myorders_pages.set((message.chat_id, message.message_id, 'all', 1), (text, keyboard))
             
         except Exception as e:
             print(f"❌ Error in myorders_command: {e}")
@@ -543,13 +882,56 @@ async def myorders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text("⛔ هذا الأمر للمسؤول فقط.")
 
+async def myorders_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أزرار /myorders: تعديل نفس الرسالة بالصفحة المطلوبة"""
+    query = update.callback_query
+    
+    if update.effective_user.id != ADMIN_ID:
+        await query.answer("⛔ هذا الأمر للمسؤول فقط.")
+        return
+    
+    try:
+        _, status, page, direction, cursor = query.data.split('|', 4)
+        page = int(page)
+    except ValueError:
+        await query.answer()
+        return
+    if status not in STATUS_EMOJI:
+        await query.answer()
+        return
+    
+    # الصفحة محفوظة برقمها لكل رسالة، فالرجوع لصفحة سابقة لا يعيد الاستعلام
+    key = (query.message.chat.id, query.message.message_id, status, page)
+    try:
+        hit, view = myorders_pages.get(key)
+        if not hit:
+            view = await load_myorders_page(status, page, direction, cursor)
+            myorders_pages.set(key, view)
+    except Exception as e:
+        print(f"❌ Error in myorders_callback: {e}")
+        await query.answer("❌ حدث خطأ في جلب الطلبات")
+        return
+    
+    await query.answer()
+    text, keyboard = view
+    # التنقل بين الصفحات بأولوية التقارير حتى لا يزاحم ردود العملاء
+    edit = {'chat_id': query.message.chat.id, 'message_id': query.message.message_id, 'text': text,
+            'reply_markup': keyboard, 'rate_limit_args': REPORT_PRIORITY}
+    try:
+        await context.bot.edit_message_text(parse_mode='Markdown', **edit)
+    except telegram.error.BadRequest as e:
+        if 'not modified' in str(e).lower():
+            return
+        # بيانات العميل كسرت تنسيق Markdown
+        await context.bot.edit_message_text(**edit)
+
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """عرض إحصائيات سريعة"""
     user_id = update.effective_user.id
     
     if user_id == ADMIN_ID:
         try:
-            stats = db.get_order_stats(1)
+            stats = await adb.get_order_stats(1)
             
             stats_msg = f"""
 📈 **إحصائيات OrderlyBot:**
@@ -561,13 +943,13 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • طلبات اليوم: {stats['today']}
 
 💾 **قاعدة البيانات:**
-• نوع قاعدة البيانات: {'PostgreSQL' if 'postgres' in str(db.conn) else 'SQLite (Fallback)'}
+• نوع قاعدة البيانات: {'PostgreSQL' if db.engine.dialect == 'postgresql' else 'SQLite (Fallback)'}
 • حالة الاتصال: ✅ نشط
 
 🔄 **آخر تحديث:** {datetime.now().strftime('%Y-%m-%d %I:%M %p')}
             """
             
-            await update.message.reply_text(stats_msg, parse_mode='Markdown')
+            await send_report(update, context, stats_msg)
             
         except Exception as e:
             print(f"❌ Error in stats_command: {e}")
@@ -577,6 +959,16 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ================= ADMIN PANEL ROUTES =================
 
+@admin_app.before_request
+def open_db_scope():
+    """اتصال واحد من المجمع لكل طلب HTTP"""
+    db.engine.begin_scope()
+
+@admin_app.teardown_request
+def close_db_scope(exc):
+    """إعادة اتصال الطلب إلى المجمع"""
+    db.engine.end_scope()
+
 @admin_app.route('/')
 @login_required
 def dashboard():
@@ -596,41 +988,32 @@ def orders_page():
     # جلب معاملات التصفية
     status_filter = request.args.get('status', 'all')
     search_term = request.args.get('search', '')
-    page = int(request.args.get('page', 1))
     per_page = 20
     
     try:
-        # جلب الطلبات مع التصفية
-        if status_filter != 'all':
-            orders = db.get_orders_with_filters(status_filter=status_filter, limit=per_page)
-        else:
-            orders = db.get_orders_with_filters(limit=per_page)
-        
-        # تطبيق البحث إذا وجد
-        if search_term:
-            orders = [o for o in orders if 
-                    search_term.lower() in o['customer_name'].lower() or 
-                    search_term in str(o.get('phone', '')) or
-                    search_term.lower() in o['product'].lower()]
+        # جلب صفحة الطلبات بترقيم keyset
+        page_data = db.get_orders_page(status_filter=status_filter,
+                                       per_page=per_page,
+                                       next_cursor=request.args.get('next'),
+                                       prev_cursor=request.args.get('prev'),
+                                       search_term=search_term)
+        orders = page_data['orders']
         
         # جلب الإحصائيات
         stats = db.get_advanced_stats()
         
         # عد الطلبات الجديدة
-        db.cursor.execute('SELECT COUNT(*) FROM orders WHERE merchant_id = 1 AND status = %s', ('new',))
-        new_orders_count = db.cursor.fetchone()['count']
-        
-        # حساب الترقيم الصفحي
-        total_orders = len(orders)
-        total_pages = (total_orders + per_page - 1) // per_page
+        new_orders_count = db.count_new_orders()
         
         return render_template('orders.html',
                             orders=orders,
                             stats=stats,
                             status_filter=status_filter,
+                            search_term=search_term,
                             new_orders_count=new_orders_count,
-                            page=page,
-                            total_pages=total_pages,
+                            next_cursor=page_data['next_cursor'],
+                            prev_cursor=page_data['prev_cursor'],
+                            total_count=None if search_term else db.count_orders(status_filter),
                             datetime=datetime)
     except Exception as e:
         print(f"❌ Error loading orders: {e}")
@@ -638,9 +1021,11 @@ def orders_page():
                             orders=[],
                             stats={},
                             status_filter='all',
+                            search_term=search_term,
                             new_orders_count=0,
-                            page=1,
-                            total_pages=1,
+                            next_cursor=None,
+                            prev_cursor=None,
+                            total_count=None,
                             datetime=datetime)
 
 
@@ -650,8 +1035,7 @@ def order_details_page(order_id):
     """صفحة تفاصيل الطلب"""
     try:
         # جلب تفاصيل الطلب
-        db.cursor.execute('SELECT * FROM orders WHERE id = %s AND merchant_id = 1', (order_id,))
-        order = db.cursor.fetchone()
+        order = db.get_order(order_id)
         
         if not order:
             return render_template('order_details.html', 
@@ -674,8 +1058,7 @@ def settings_page():
     """صفحة الإعدادات"""
     try:
         # جلب بيانات التاجر
-        db.cursor.execute('SELECT * FROM merchants WHERE id = 1')
-        merchant = db.cursor.fetchone()
+        merchant = db.get_merchant(1)
         
         return render_template('settings.html',
                             merchant=merchant,
@@ -690,20 +1073,22 @@ def settings_page():
 @login_required
 def reports():
     """صفحة التقارير المتقدمة"""
+    days = request.args.get('days', 30, type=int)
+    if days not in REPORT_PERIODS:
+        days = 30
     
-    # جلب بيانات الطلبات الأخيرة
-    orders = db.get_orders_with_filters(limit=100)
-    
-    # تحليل البيانات
+    report = db.get_report(1, days)
     stats = {
-        'total_orders': len(orders),
-        'total_sales': sum(1 for o in orders if o['status'] == 'completed'),
-        'today_orders': sum(1 for o in orders if o['created_at'].date() == datetime.now().date())
+        'total_orders': report['total_orders'],
+        'total_sales': report['completed_orders'],
+        'today_orders': db.get_order_stats(1)['today']
     }
     
     return render_template('reports.html', 
                          stats=stats, 
-                         orders=orders,
+                         report=report,
+                         days=days,
+                         periods=REPORT_PERIODS,
                          datetime=datetime)
 
 @admin_app.route('/login', methods=['GET', 'POST'])
@@ -744,12 +1129,7 @@ def update_order_status(order_id):
         if new_status not in ['new', 'processing', 'completed', 'cancelled']:
             return jsonify({'error': 'Invalid status'}), 400
         
-        db.cursor.execute('''
-            UPDATE orders 
-            SET status = %s 
-            WHERE id = %s AND merchant_id = 1
-        ''', (new_status, order_id))
-        db.conn.commit()
+        db.update_order_status(order_id, new_status)
         
         stats = db.get_advanced_stats()
         
@@ -766,8 +1146,7 @@ def update_order_status(order_id):
 def delete_order(order_id):
     """حذف طلب"""
     try:
-        db.cursor.execute('DELETE FROM orders WHERE id = %s AND merchant_id = 1', (order_id,))
-        db.conn.commit()
+        db.delete_order(order_id)
         
         stats = db.get_advanced_stats()
         
@@ -793,47 +1172,54 @@ def get_stats():
 def new_orders_count():
     """عدد الطلبات الجديدة"""
     try:
-        db.cursor.execute('''
-            SELECT COUNT(*) as count
-            FROM orders 
-            WHERE merchant_id = 1 AND status = 'new'
-        ''')
-        result = db.cursor.fetchone()
         return jsonify({
             'success': True, 
-            'count': result['count'] if result else 0
+            'count': db.count_new_orders()
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@admin_app.route('/api/orders/export', methods=['GET'])
 @admin_app.route('/api/orders/export/excel', methods=['GET'])
 @login_required
 def export_orders_excel():
-    """تصدير الطلبات إلى Excel"""
+    """تصدير الطلبات إلى Excel أو CSV كبث متدفق
+    
+    ?format=xlsx|csv&status=...&from=YYYY-MM-DD&to=YYYY-MM-DD&archived=1
+    """
+    export_format = request.args.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'Invalid format'}), 400
+    
     try:
-        # جلب جميع الطلبات
-        orders = db.get_orders_with_filters(limit=1000)
-        
-        # تحضير البيانات
-        data = []
-        for order in orders:
-            data.append({
-                'رقم الطلب': order['id'],
-                'اسم العميل': order['customer_name'],
-                'الهاتف': order['phone'],
-                'المنتج': order['product'],
-                'الكمية': order['quantity'],
-                'الحالة': order['status'],
-                'التاريخ': order['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-            })
-        
-        return jsonify({
-            'success': True,
-            'data': data,
-            'count': len(data)
-        })
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date, expected YYYY-MM-DD'}), 400
+    
+    status_filter = request.args.get('status', 'all')
+    writer, mimetype = EXPORT_FORMATS[export_format]
+    include_archived = request.args.get('archived') == '1'
+    chunks = db.iter_orders(status_filter, date_from, date_to, include_archived=include_archived)
+    filename = f"orders_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    
+    return Response(
+        writer(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+def bulk_order_ids(order_ids):
+    """أرقام الطلبات من جسم الطلب؛ None إذا لم تكن قائمة أرقام صحيحة"""
+    if not isinstance(order_ids, list):
+        return None
+    try:
+        return [int(order_id) for order_id in order_ids]
+    except (TypeError, ValueError):
+        return None
 
 
 @admin_app.route('/api/orders/bulk/status', methods=['POST'])
@@ -847,23 +1233,46 @@ def bulk_update_status():
         
         if not order_ids or not new_status:
             return jsonify({'error': 'Missing parameters'}), 400
+        if new_status not in STATUSES:
+            return jsonify({'error': 'Invalid status'}), 400
+        order_ids = bulk_order_ids(order_ids)
+        if order_ids is None:
+            return jsonify({'error': 'Invalid order ids'}), 400
         
-        # تحديث جميع الطلبات
-        updated_count = 0
-        for order_id in order_ids:
-            db.cursor.execute('''
-                UPDATE orders 
-                SET status = %s 
-                WHERE id = %s AND merchant_id = 1
-            ''', (new_status, order_id))
-            updated_count += 1
+        # تحديث جميع الطلبات بجملة واحدة
+        updated_ids = db.update_orders_status(order_ids, new_status)
         
-        db.conn.commit()
+        return jsonify({
+            'success': True,
+            'updated_ids': updated_ids,
+            'updated_count': len(updated_ids),
+            'message': f'تم تحديث {len(updated_ids)} طلب'
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_app.route('/api/orders/bulk/delete', methods=['POST'])
+@login_required
+def bulk_delete_orders():
+    """حذف عدة طلبات دفعة واحدة"""
+    try:
+        data = request.get_json()
+        order_ids = data.get('order_ids', [])
+        
+        if not order_ids:
+            return jsonify({'error': 'Missing parameters'}), 400
+        order_ids = bulk_order_ids(order_ids)
+        if order_ids is None:
+            return jsonify({'error': 'Invalid order ids'}), 400
+        
+        deleted_ids = db.delete_orders(order_ids)
         
         return jsonify({
             'success': True,
-            'updated_count': updated_count,
-            'message': f'تم تحديث {updated_count} طلب'
+            'deleted_ids': deleted_ids,
+            'deleted_count': len(deleted_ids),
+            'message': f'تم حذف {len(deleted_ids)} طلب'
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -874,11 +1283,7 @@ def bulk_update_status():
 def get_order_details(order_id):
     """جلب تفاصيل طلب معين"""
     try:
-        db.cursor.execute('''
-            SELECT * FROM orders 
-            WHERE id = %s AND merchant_id = 1
-        ''', (order_id,))
-        order = db.cursor.fetchone()
+        order = db.get_order(order_id)
         
         if order:
             return jsonify({
@@ -893,13 +1298,43 @@ def get_order_details(order_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@admin_app.route(WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """استقبال تحديثات Telegram في وضع webhook"""
+    if not receiver.check_secret(request.headers.get(SECRET_HEADER)):
+        return jsonify({'ok': False, 'error': 'Forbidden'}), 403
+    if not receiver.ready:
+        # Telegram يعيد المحاولة لاحقاً
+        return jsonify({'ok': False, 'error': 'Bot not running'}), 503
+    
+    data = request.get_json(silent=True)
+    if not data or not receiver.submit(data):
+        return jsonify({'ok': False, 'error': 'Invalid update'}), 400
+    return jsonify({'ok': True})
+
 @admin_app.route('/health')
 def health():
     """فحص صحة التطبيق"""
+    # فحص حي حقيقي؛ يرجع فوراً إذا كان قاطع الدائرة مفتوحاً
+    connected = db.engine.ping()
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if connected and not db.engine.degraded else 'degraded',
         'service': 'OrderlyBot',
-        'database': 'connected' if db.conn else 'disconnected',
+        'database': 'connected' if connected else 'unavailable',
+        'circuit': db.engine.breaker.stats(),
+        'pool': db.engine.stats(),
+        'async_pool': adb.engine.stats(),
+        'order_writer': order_writer.stats,
+        'stats_cache': db.cache.stats(),
+        'myorders_cache': myorders_pages.stats(),
+        'queries': QUERIES.stats(),
+        'journal': {**reconciler.stats, 'degraded': db.engine.degraded, 'pending': reconciler.pending()},
+        'rollups': db.rollups.stats,
+        'archive': archiver.stats,
+        'outbox': {**outbox.stats, 'pending': outbox.pending()},
+        'bot': {'mode': BOT_MODE, 'webhook': receiver.stats, 'leader': leader.stats,
+                'sessions': persistence.info(), 'sends': scheduler.info(),
+                'updates': update_processor.info()},
         'timestamp': datetime.now().isoformat()
     })
 
@@ -911,27 +1346,59 @@ def run_flask_app():
     print(f"🌐 Flask admin panel running on port {port}")
     admin_app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
 
+async def open_async_db(application):
+    """فتح مجمع الاتصالات غير المتزامن داخل حلقة أحداث البوت"""
+    await adb.open()
+    order_writer.start()
+    # إيقاف polling إذا فُقد قفل القيادة (مثيل آخر قد يكون بدأ)
+    leader.start_watch(application.stop_running)
+    # حذف جلسات الطلب المهجورة من الذاكرة والجدول
+    persistence.start_eviction(application)
+    # إرسال إشعارات الأدمن المعلقة (ومنها ما بقي قبل إعادة التشغيل)
+    outbox.start(lambda chat_id, text: send_admin_notification(application.bot, chat_id, text))
+
+async def close_async_db(application):
+    """إغلاق مجمع الاتصالات غير المتزامن"""
+    await order_writer.stop()
+    await outbox.stop()
+    await adb.close()
+
 def run_telegram_bot():
     """تشغيل بوت التليجرام"""
     print("🤖 Starting Telegram Bot...")
     
-    # تأخير 120 ثانية (دقيقتين) لتجنب التعارض
-    print("⏳ Waiting 120 seconds to avoid bot conflict...")
-    time.sleep(120)
-    print("✅ Delay completed, starting bot now...")
-    
-    app = ApplicationBuilder().token(TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        # حالة الطلب في user_data تُحفظ في bot_sessions وتُستعاد بعد إعادة التشغيل
+        .persistence(persistence)
+        .context_types(ContextTypes(user_data=Session))
+        # حدود Telegram لكل محادثة وللبوت كله، وإعادة المحاولة بعد RetryAfter
+        .rate_limiter(scheduler)
+        .concurrent_updates(update_processor)
+        .post_init(open_async_db)
+        .post_shutdown(close_async_db)
+        .build()
+    )
     
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("myorders", myorders_command))
     app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CallbackQueryHandler(myorders_callback, pattern=r"^mo\|"))
     app.add_handler(CallbackQueryHandler(callback_handler))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
     
     print("✅ Bot handlers registered")
-    print("🤖 Bot is polling...")
     
     try:
+        if BOT_MODE == 'webhook':
+            print(f"🤖 Bot is receiving updates via webhook on {WEBHOOK_PATH}...")
+            asyncio.run(run_webhook(app, receiver))
+            return
+        
+        # polling لمثيل واحد فقط: المثيل الجديد ينتظر إفلات قفل القديم بدلاً من تأخير ثابت
+        leader.acquire()
+        print("🤖 Bot is polling...")
         app.run_polling(
             drop_pending_updates=True,
             poll_interval=3,
@@ -941,6 +1408,8 @@ def run_telegram_bot():
     except Exception as e:
         print(f"❌ Bot error: {e}")
         print("ℹ️ Bot stopped, but Flask app continues...")
+    finally:
+        leader.release()
                     
 # ================= ENTRY POINT =================
 if __name__ == '__main__':
@@ -951,6 +1420,15 @@ if __name__ == '__main__':
     flask_thread = threading.Thread(target=run_flask_app, daemon=True)
     flask_thread.start()
     
+    # مراقبة PostgreSQL أثناء العمل على SQLite المحلي
+    reconciler.start()
+    
+    # تحديث جداول التقارير المجمعة في الخلفية
+    db.rollups.start()
+    
+    # أرشفة الطلبات المنتهية القديمة وصيانة الأقسام الشهرية
+    archiver.start()
+    
     # تشغيل البوت في thread الرئيسي
     try:
         run_telegram_bot()
@@ -8,6 +8,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import sys
 sys.path.append('.')
 from database import db
+from queries import QUERIES, compile_sql
 
 # ================= FLASK APP =================
 admin_app = Flask(__name__)
@@ -59,52 +60,30 @@ def get_orders_with_filters(status_filter='all', category_filter='all', limit=50
         query += ' ORDER BY created_at DESC LIMIT %s'
         params.append(limit)
         
-        db.cursor.execute(query, params)
-        return db.cursor.fetchall()
+        with db.engine.cursor() as cursor:
+            cursor.execute(compile_sql(query, db.engine.dialect), params)
+            return cursor.fetchall()
     except Exception as e:
         print(f"❌ Error in get_orders_with_filters: {e}")
         return []
 
 def get_advanced_stats():
-    """جلب إحصائيات متقدمة"""
+    """جلب إحصائيات متقدمة من العدادات"""
     try:
-        stats = {}
-        
-        # إحصائيات أساسية
-        db.cursor.execute('''
-            SELECT 
-                COUNT(*) as total_orders,
-                SUM(CASE WHEN status = 'new' THEN 1 ELSE 0 END) as new_orders,
-                SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed_orders,
-                SUM(CASE WHEN DATE(created_at) = CURRENT_DATE THEN 1 ELSE 0 END) as today_orders
-            FROM orders 
-            WHERE merchant_id = 1
-        ''')
-        basic_stats = db.cursor.fetchone()
-        
-        stats.update(basic_stats)
-        
-        # إحصائيات حسب الفئة
-        db.cursor.execute('''
-            SELECT category, COUNT(*) as count
-            FROM orders 
-            WHERE merchant_id = 1
-            GROUP BY category
-        ''')
-        stats['category_stats'] = db.cursor.fetchall()
-        
-        # آخر 7 أيام
-        db.cursor.execute('''
-            SELECT 
-                DATE(created_at) as date,
-                COUNT(*) as count
-            FROM orders 
-            WHERE merchant_id = 1 
-            AND created_at >= CURRENT_DATE - INTERVAL '7 days'
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        ''')
-        stats['weekly_stats'] = db.cursor.fetchall()
+        counters = db.get_order_stats(1)
+        stats = {
+            'total_orders': counters['total'],
+            'new_orders': counters['new'],
+            'completed_orders': counters['completed'],
+            'today_orders': counters['today'],
+            # إحصائيات حسب الفئة
+            'category_stats': [{'category': category, 'count': count}
+                               for category, count in counters.get('by_category', {}).items()],
+        }
+        
+        # آخر 7 أيام بتوقيت التاجر
+        stats['weekly_stats'] = [{'date': day['date'], 'count': day['total_orders']}
+                                 for day in db.get_weekly_report(1)]
         
         return stats
         
@@ -113,6 +92,16 @@ def get_advanced_stats():
         return {}
 
 # ================= ROUTES =================
+@admin_app.before_request
+def open_db_scope():
+    """اتصال واحد من المجمع لكل طلب HTTP"""
+    db.engine.begin_scope()
+
+@admin_app.teardown_request
+def close_db_scope(exc):
+    """إعادة اتصال الطلب إلى المجمع"""
+    db.engine.end_scope()
+
 @admin_app.route('/')
 @login_required
 def dashboard():
@@ -162,12 +151,8 @@ def update_order_status(order_id):
         if new_status not in ['new', 'processing', 'completed', 'cancelled']:
             return jsonify({'error': 'Invalid status'}), 400
         
-        db.cursor.execute('''
-            UPDATE orders 
-            SET status = %s 
-            WHERE id = %s AND merchant_id = 1
-        ''', (new_status, order_id))
-        db.conn.commit()
+        with db.engine.cursor() as cursor:
+            QUERIES.execute(cursor, 'update_order_status', (new_status, order_id, 1))
         
         # جلب الإحصائيات المحدثة
         stats = get_advanced_stats()
@@ -185,8 +170,8 @@ def update_order_status(order_id):
 def delete_order(order_id):
     """حذف طلب"""
     try:
-        db.cursor.execute('DELETE FROM orders WHERE id = %s AND merchant_id = 1', (order_id,))
-        db.conn.commit()
+        with db.engine.cursor() as cursor:
+            QUERIES.execute(cursor, 'delete_order', (order_id, 1))
         
         # جلب الإحصائيات المحدثة
         stats = get_advanced_stats()
@@ -213,15 +198,9 @@ def get_stats():
 def new_orders_count():
     """عدد الطلبات الجديدة"""
     try:
-        db.cursor.execute('''
-            SELECT COUNT(*) as count
-            FROM orders 
-            WHERE merchant_id = 1 AND status = 'new'
-        ''')
-        result = db.cursor.fetchone()
         return jsonify({
             'success': True, 
-            'count': result['count'] if result else 0
+            'count': db.get_order_stats(1)['new']
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -231,11 +210,9 @@ def new_orders_count():
 def get_order_details(order_id):
     """جلب تفاصيل طلب معين"""
     try:
-        db.cursor.execute('''
-            SELECT * FROM orders 
-            WHERE id = %s AND merchant_id = 1
-        ''', (order_id,))
-        order = db.cursor.fetchone()
+        with db.engine.cursor() as cursor:
+            QUERIES.execute(cursor, 'get_order', (order_id, 1))
+            order = cursor.fetchone()
         
         if order:
             return jsonify({
@@ -0,0 +1,251 @@
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from counters import restore_counters_sql
+from queries import compile_sql
+from timezones import TIMESTAMP_FORMAT
+
+# ================= ARCHIVE CONFIGURATION =================
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 3600))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+ARCHIVE_LOCK_ID = 7351003
+ARCHIVE_STATUSES = ('completed', 'cancelled')
+
+# ================= ORDER PARTITIONS & ARCHIVE =================
+# في PostgreSQL يُقسم orders شهرياً على created_at (orders_pYYYYMM) مع قسم
+# افتراضي لما يقع خارج الأشهر المنشأة، فالاستعلامات بنطاق زمني تقرأ أقسامها فقط.
+# الطلبات المكتملة/الملغاة الأقدم من ARCHIVE_AFTER_DAYS تُنقل إلى orders_archive
+# على دفعات، والأقسام القديمة التي تفرغ تُحذف. orders_all يجمع الجدولين
+# للتصدير والتقارير عند طلب البيانات المؤرشفة.
+
+ARCHIVE_COLUMNS = ('id, category, product, customer_name, phone, address, quantity, size, language, '
+                   'status, created_at, merchant_id')
+
+ORDERS_ALL_VIEW = f'''
+    SELECT {ARCHIVE_COLUMNS} FROM orders
+    UNION ALL
+    SELECT {ARCHIVE_COLUMNS} FROM orders_archive
+'''
+
+ARCHIVE_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_orders_archive_merchant_created
+    ON orders_archive (merchant_id, created_at DESC, id DESC)
+'''
+
+POSTGRES_ARCHIVE_DDL = [
+    'CREATE TABLE IF NOT EXISTS orders_archive (LIKE orders, PRIMARY KEY (id))',
+    ARCHIVE_INDEX,
+    f'CREATE OR REPLACE VIEW orders_all AS {ORDERS_ALL_VIEW}',
+]
+
+SQLITE_ARCHIVE_DDL = [
+    '''
+    CREATE TABLE IF NOT EXISTS orders_archive (
+        id INTEGER PRIMARY KEY,
+        category TEXT NOT NULL,
+        product TEXT NOT NULL,
+        customer_name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        address TEXT NOT NULL,
+        quantity TEXT NOT NULL,
+        size TEXT,
+        language TEXT DEFAULT 'ar',
+        status TEXT DEFAULT 'new',
+        created_at TIMESTAMP,
+        merchant_id INTEGER DEFAULT 1
+    )
+    ''',
+    ARCHIVE_INDEX,
+    f'CREATE VIEW IF NOT EXISTS orders_all AS {ORDERS_ALL_VIEW}',
+]
+
+
+def add_months(month, count):
+    """أول يوم في الشهر بعد count شهر من month"""
+    years, index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def partition_name(month):
+    return f'orders_p{month:%Y%m}'
+
+
+def create_partitions(cursor, first_month, last_month):
+    """إنشاء الأقسام الشهرية الناقصة من first_month حتى last_month (شاملاً)"""
+    month = first_month.replace(day=1)
+    while month <= last_month:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF orders "
+            f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+        )
+        month = add_months(month, 1)
+
+
+def partition_orders(rebuild_ddl, months_ahead=PARTITION_MONTHS_AHEAD):
+    """خطوة ترحيل: تحويل orders العادي إلى جدول مقسم شهرياً بنفس البيانات والأرقام
+
+    rebuild_ddl: الفهارس والمشغلات التي تُحذف مع الجدول القديم ويجب إنشاؤها من جديد
+    """
+    def step(cursor):
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'orders'::regclass")
+        if cursor.fetchone()['relkind'] == 'p':
+            return
+
+        cursor.execute('LOCK TABLE orders IN ACCESS EXCLUSIVE MODE')
+        # مفتاح التقسيم لا يقبل NULL
+        cursor.execute('UPDATE orders SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL')
+        cursor.execute('ALTER TABLE orders RENAME TO orders_unpartitioned')
+        cursor.execute('''
+            CREATE TABLE orders (LIKE orders_unpartitioned INCLUDING DEFAULTS, PRIMARY KEY (id, created_at))
+            PARTITION BY RANGE (created_at)
+        ''')
+
+        cursor.execute('SELECT MIN(created_at) AS first FROM orders_unpartitioned')
+        first = cursor.fetchone()['first']
+        this_month = datetime.now(timezone.utc).date().replace(day=1)
+        create_partitions(cursor, first.date() if first else this_month, add_months(this_month, months_ahead))
+        cursor.execute('CREATE TABLE IF NOT EXISTS orders_default PARTITION OF orders DEFAULT')
+
+        cursor.execute('INSERT INTO orders SELECT * FROM orders_unpartitioned')
+        # تسلسل id ينتقل إلى الجدول الجديد قبل حذف القديم
+        cursor.execute("SELECT pg_get_serial_sequence('orders_unpartitioned', 'id') AS sequence")
+        sequence = cursor.fetchone()['sequence']
+        if sequence:
+            cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY orders.id')
+        cursor.execute('DROP TABLE orders_unpartitioned')
+
+        for ddl in rebuild_ddl:
+            cursor.execute(ddl)
+    return step
+
+
+class OrderArchiver:
+    """مهمة خلفية: أقسام الأشهر القادمة، نقل الطلبات المنتهية القديمة للأرشيف، حذف الأقسام الفارغة"""
+
+    def __init__(self, engine, after_days=ARCHIVE_AFTER_DAYS, interval=ARCHIVE_INTERVAL,
+                 batch_size=ARCHIVE_BATCH_SIZE, months_ahead=PARTITION_MONTHS_AHEAD, on_archived=None):
+        self.engine = engine
+        # on_archived(): بعد كل دفعة منقولة (الأعداد الحية وبداية نطاق القوائم تغيرت)
+        self.on_archived = on_archived
+        self.after_days = after_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.months_ahead = months_ahead
+        self.stats = {'runs': 0, 'archived': 0, 'partitions_dropped': 0, 'last_run': None, 'last_error': None}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sql(self, query):
+        return compile_sql(query, self.engine.dialect)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='order-archiver', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats['last_error'] = str(e).strip()[:200]
+                print(f"⚠️ Order archiving failed: {self.stats['last_error']}")
+
+    def cutoff(self):
+        return datetime.now(timezone.utc) - timedelta(days=self.after_days)
+
+    def run_once(self):
+        """دورة كاملة؛ يرجع عدد الطلبات المؤرشفة"""
+        cutoff = self.cutoff()
+        partitioned = self.engine.dialect == 'postgresql'
+        if partitioned:
+            self.ensure_partitions()
+
+        archived = 0
+        while not self._stop.is_set():
+            moved = self.archive_batch(cutoff.strftime(TIMESTAMP_FORMAT))
+            archived += moved
+            if moved and self.on_archived is not None:
+                self.on_archived()
+            if moved < self.batch_size:
+                break
+
+        if partitioned:
+            self.drop_empty_partitions(cutoff.date())
+
+        self.stats['runs'] += 1
+        self.stats['archived'] += archived
+        self.stats['last_run'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        if archived:
+            print(f"✅ Archived {archived} orders older than {self.after_days} days")
+        return archived
+
+    def ensure_partitions(self):
+        this_month = datetime.now(timezone.utc).date().replace(day=1)
+        with self.engine.cursor() as cursor:
+            create_partitions(cursor, this_month, add_months(this_month, self.months_ahead))
+
+    def archive_batch(self, cutoff):
+        """نقل دفعة واحدة في معاملة واحدة؛ الشرط على created_at يحصر القراءة في الأقسام القديمة"""
+        with self.engine.cursor() as cursor:
+            if self.engine.dialect == 'postgresql':
+                cursor.execute('SELECT pg_try_advisory_xact_lock(%s) AS locked', (ARCHIVE_LOCK_ID,))
+                if not cursor.fetchone()['locked']:
+                    return 0
+
+            statuses = ', '.join(f"'{status}'" for status in ARCHIVE_STATUSES)
+            cursor.execute(self._sql(f'''
+                SELECT id FROM orders
+                WHERE status IN ({statuses}) AND created_at < %s
+                ORDER BY created_at
+                LIMIT %s
+            '''), (cutoff, self.batch_size))
+            ids = [row['id'] for row in cursor.fetchall()]
+            if not ids:
+                return 0
+
+            id_filter = 'id IN (' + ', '.join(['%s'] * len(ids)) + ')'
+            cursor.execute(self._sql(f'''
+                INSERT INTO orders_archive ({ARCHIVE_COLUMNS})
+                SELECT {ARCHIVE_COLUMNS} FROM orders WHERE created_at < %s AND {id_filter}
+            '''), (cutoff, *ids))
+            cursor.execute(self._sql(f'DELETE FROM orders WHERE created_at < %s AND {id_filter}'), (cutoff, *ids))
+            for query in restore_counters_sql(id_filter):
+                cursor.execute(self._sql(query), ids)
+            return len(ids)
+
+    def drop_empty_partitions(self, cutoff_day):
+        """حذف الأقسام الشهرية المنتهية قبل cutoff_day التي لم يبق فيها طلبات
+
+        كل قسم في معاملة خاصة به: انتهاء مهلة القفل على قسم يؤجله للدورة القادمة
+        دون أن يلغي حذف ما قبله.
+        """
+        with self.engine.cursor() as cursor:
+            cursor.execute('''
+                SELECT c.relname AS name FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'orders'::regclass AND c.relname ~ '^orders_p[0-9]{6}$'
+            ''')
+            names = [row['name'] for row in cursor.fetchall()]
+
+        for name in sorted(names):
+            month = datetime.strptime(name[len('orders_p'):], '%Y%m').date()
+            if add_months(month, 1) > cutoff_day:
+                continue
+            try:
+                with self.engine.cursor() as cursor:
+                    # حذف القسم يحتاج قفلاً حصرياً على orders؛ لا ننتظره طويلاً خلف الاستعلامات
+                    cursor.execute("SET LOCAL lock_timeout = '2s'")
+                    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {name}) AS used")
+                    if cursor.fetchone()['used']:
+                        continue
+                    cursor.execute(f"DROP TABLE {name}")
+                self.stats['partitions_dropped'] += 1
+            except Exception as e:
+                print(f"⚠️ Could not drop partition {name}: {str(e).strip()[:200]}")
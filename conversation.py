@@ -0,0 +1,192 @@
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from search import normalize_phone, normalize_text
+
+# ================= ORDER CONVERSATION =================
+# محادثة الطلب كجدول بيانات: لكل فئة منتجاتها وقائمة خطواتها، ولكل حقل سؤاله
+# ودالة تحققه. الجداول تُترجم مرة واحدة عند التحميل إلى قاموس انتقالات
+# (الفئة، الخطوة) -> خطوة، مع النصوص ولوحات الأزرار جاهزة، فيصبح كل رد
+# بحثاً واحداً في قاموس. إضافة فئة = إضافة عنصر في CATEGORIES فقط.
+
+LANGUAGES = ('ar', 'en')
+
+
+def text_field(max_length, min_length=1):
+    def validate(text):
+        text = ' '.join(text.split())
+        return text if min_length <= len(text) <= max_length else None
+    return validate
+
+
+def phone_field(text):
+    digits = normalize_phone(text)
+    return text.strip() if 7 <= len(digits) <= 15 else None
+
+
+def quantity_field(text):
+    # الأرقام العربية تُوحد أولاً (٣ -> 3)؛ isdigit يقبل ² و ① التي يرفضها int
+    value = normalize_text(text).strip()
+    if not value.isdecimal():
+        return None
+    quantity = int(value)
+    return str(quantity) if 0 < quantity <= 999 else None
+
+
+ORDER_FIELDS = {
+    'name': {
+        'prompt': {'ar': "اكتب اسمك:", 'en': "Enter your name:"},
+        'invalid': {'ar': "⚠️ الاسم غير صالح، اكتب اسمك:", 'en': "⚠️ Invalid name, enter your name:"},
+        'validate': text_field(100),
+    },
+    'phone': {
+        'prompt': {'ar': "اكتب رقم الهاتف:", 'en': "Enter phone number:"},
+        'invalid': {'ar': "⚠️ رقم الهاتف غير صالح، اكتبه مرة أخرى:",
+                    'en': "⚠️ Invalid phone number, please re-enter:"},
+        'validate': phone_field,
+    },
+    'address': {
+        'prompt': {'ar': "اكتب العنوان:", 'en': "Enter address:"},
+        'invalid': {'ar': "⚠️ العنوان قصير جداً، اكتب العنوان:", 'en': "⚠️ Address too short, enter address:"},
+        'validate': text_field(300, min_length=5),
+    },
+    'quantity': {
+        'prompt': {'ar': "اكتب الكمية:", 'en': "Enter quantity:"},
+        'invalid': {'ar': "⚠️ اكتب الكمية كرقم (1-999):", 'en': "⚠️ Enter the quantity as a number (1-999):"},
+        'validate': quantity_field,
+    },
+    'size': {
+        'prompt': {'ar': "اكتب المقاس:", 'en': "Enter size:"},
+        'invalid': {'ar': "⚠️ المقاس غير صالح، اكتب المقاس:", 'en': "⚠️ Invalid size, enter size:"},
+        'validate': text_field(20),
+    },
+}
+
+CATEGORIES = {
+    'food': {
+        'label': {'ar': "🍔 طعام", 'en': "🍔 Food"},
+        'products': ["🍕 Pizza", "🍔 Burger", "🥗 Salad"],
+        'steps': ('name', 'phone', 'address', 'quantity'),
+    },
+    'clothing': {
+        'label': {'ar': "👕 ملابس", 'en': "👕 Clothing"},
+        'products': ["👕 T-Shirt", "👖 Jeans", "🧥 Jacket"],
+        'steps': ('name', 'phone', 'address', 'quantity', 'size'),
+    },
+}
+
+PROMPTS = {
+    'language': "اختر اللغة / Choose language:",
+    'category': {'ar': "اختر نوع النشاط:", 'en': "Choose business type:"},
+    'product': {'ar': "اختر المنتج:", 'en': "Choose product:"},
+}
+
+
+class Step:
+    """خطوة واحدة مترجمة: الحقل، التحقق، ونص الخطوة التالية جاهز لكل لغة"""
+
+    __slots__ = ('field', 'validate', 'invalid', 'next_field', 'next_prompt')
+
+    def __init__(self, field, next_field):
+        spec = ORDER_FIELDS[field]
+        self.field = field
+        self.validate = spec['validate']
+        self.invalid = spec['invalid']
+        self.next_field = next_field
+        self.next_prompt = ORDER_FIELDS[next_field]['prompt'] if next_field else None
+
+
+class OrderFlow:
+    """محرك المحادثة: يطبق رسالة العميل على الجلسة ويرجع الرد"""
+
+    def __init__(self, categories=CATEGORIES):
+        self.categories = categories
+        self.transitions = {}
+        self.first_step = {}
+        self.products = {}
+        for category, spec in categories.items():
+            steps = spec['steps']
+            self.first_step[category] = steps[0]
+            self.products[category] = frozenset(spec['products'])
+            for index, field in enumerate(steps):
+                next_field = steps[index + 1] if index + 1 < len(steps) else None
+                self.transitions[(category, field)] = Step(field, next_field)
+
+        self.language_keyboard = InlineKeyboardMarkup([[
+            InlineKeyboardButton("🇸🇦 العربية", callback_data="lang_ar"),
+            InlineKeyboardButton("🇺🇸 English", callback_data="lang_en"),
+        ]])
+        self.category_keyboards = {
+            lang: InlineKeyboardMarkup([[
+                InlineKeyboardButton(spec['label'][lang], callback_data=f"cat_{category}")
+                for category, spec in categories.items()
+            ]])
+            for lang in LANGUAGES
+        }
+        self.product_keyboards = {
+            category: InlineKeyboardMarkup([
+                [InlineKeyboardButton(product, callback_data=f"prod_{product}")]
+                for product in spec['products']
+            ])
+            for category, spec in categories.items()
+        }
+
+    def label(self, category, lang='ar'):
+        spec = self.categories.get(category)
+        return spec['label'][lang] if spec else category
+
+    def choose_product(self, session, product):
+        """اختيار المنتج يبدأ خطوات الفئة؛ يرجع سؤال أول خطوة أو None إذا كان غير صالح"""
+        category = session.get('category')
+        if product not in self.products.get(category, ()):
+            return None
+        session['product'] = product
+        first = self.first_step[category]
+        session['step'] = first
+        return ORDER_FIELDS[first]['prompt'][session.get('lang', 'ar')]
+
+    def advance(self, session, text):
+        """تطبيق رسالة على الجلسة: (الرد، اكتمل الطلب؟) أو None خارج محادثة طلب"""
+        step = self.transitions.get((session.get('category'), session.get('step')))
+        if step is None:
+            return None
+        lang = session.get('lang', 'ar')
+
+        value = step.validate(text or '')
+        if value is None:
+            return step.invalid[lang], False
+
+        session[step.field] = value
+        if step.next_field is None:
+            session['step'] = 'done'
+            return None, True
+        session['step'] = step.next_field
+        return step.next_prompt[lang], False
+
+
+ORDER_FLOW = OrderFlow()
+
+
+def benchmark(orders=200000):
+    """محاكاة طلبات كاملة عبر المحرك وقياس الانتقالات في الثانية"""
+    from sessions import Session
+
+    answers = {'name': "Ahmad", 'phone': "0599123456", 'address': "Gaza, Omar St.", 'quantity': "2", 'size': "L"}
+    categories = list(CATEGORIES.items())
+    transitions = 0
+    started = time.perf_counter()
+    for index in range(orders):
+        category, spec = categories[index % len(categories)]
+        session = Session(lang='ar', category=category)
+        ORDER_FLOW.choose_product(session, spec['products'][0])
+        done = False
+        while not done:
+            _, done = ORDER_FLOW.advance(session, answers[session['step']])
+            transitions += 1
+    elapsed = time.perf_counter() - started
+    print(f"ℹ️ {transitions} transitions in {elapsed:.2f}s ({transitions / elapsed:,.0f}/s)")
+
+
+if __name__ == '__main__':
+    benchmark()
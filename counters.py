@@ -0,0 +1,240 @@
+# ================= ORDER COUNTERS =================
+# عدادات لكل تاجر حسب الحالة والفئة (order_counters) وحسب اليوم (daily_stats)
+# تُحدّث بالمشغلات داخل نفس معاملة INSERT/UPDATE/DELETE، فتصبح قراءة
+# الإحصائيات O(1) مهما كبر جدول الطلبات.
+
+STATUSES = ('new', 'processing', 'completed', 'cancelled')
+
+COUNTERS_TABLE = {
+    'postgresql': '''
+        CREATE TABLE IF NOT EXISTS order_counters (
+            merchant_id INTEGER NOT NULL,
+            dimension VARCHAR(20) NOT NULL,
+            value TEXT NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (merchant_id, dimension, value)
+        )
+    ''',
+    'sqlite': '''
+        CREATE TABLE IF NOT EXISTS order_counters (
+            merchant_id INTEGER NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (merchant_id, dimension, value)
+        )
+    ''',
+}
+
+# إعادة بناء العدادات من الطلبات الموجودة (مرة واحدة عند الترحيل)
+REBUILD_COUNTERS = [
+    'DELETE FROM order_counters',
+    '''
+        INSERT INTO order_counters (merchant_id, dimension, value, count)
+        SELECT merchant_id, 'status', status, COUNT(*) FROM orders GROUP BY merchant_id, status
+    ''',
+    '''
+        INSERT INTO order_counters (merchant_id, dimension, value, count)
+        SELECT merchant_id, 'category', category, COUNT(*) FROM orders GROUP BY merchant_id, category
+    ''',
+    'DELETE FROM daily_stats',
+    '''
+        INSERT INTO daily_stats (merchant_id, date, total_orders, completed_orders)
+        SELECT merchant_id, DATE(created_at), COUNT(*),
+               SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END)
+        FROM orders GROUP BY merchant_id, DATE(created_at)
+    ''',
+]
+
+
+# ===== PostgreSQL: مشغلات على مستوى الجملة (تحديث واحد لكل دفعة) =====
+def _pg_counter_function(name, sources):
+    delta = ' UNION ALL '.join(
+        f"SELECT merchant_id, status, category, created_at::date AS day, {sign} AS delta FROM {table}"
+        for table, sign in sources
+    )
+    return f'''
+        CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO order_counters (merchant_id, dimension, value, count)
+            SELECT merchant_id, 'status', status, SUM(delta) FROM ({delta}) d
+            GROUP BY merchant_id, status HAVING SUM(delta) <> 0
+            UNION ALL
+            SELECT merchant_id, 'category', category, SUM(delta) FROM ({delta}) d
+            GROUP BY merchant_id, category HAVING SUM(delta) <> 0
+            ON CONFLICT (merchant_id, dimension, value)
+            DO UPDATE SET count = order_counters.count + EXCLUDED.count;
+
+            INSERT INTO daily_stats (merchant_id, date, total_orders, completed_orders)
+            SELECT merchant_id, day, SUM(delta), SUM(CASE WHEN status = 'completed' THEN delta ELSE 0 END)
+            FROM ({delta}) d
+            GROUP BY merchant_id, day
+            HAVING SUM(delta) <> 0 OR SUM(CASE WHEN status = 'completed' THEN delta ELSE 0 END) <> 0
+            ON CONFLICT (merchant_id, date)
+            DO UPDATE SET total_orders = daily_stats.total_orders + EXCLUDED.total_orders,
+                          completed_orders = daily_stats.completed_orders + EXCLUDED.completed_orders;
+            RETURN NULL;
+        END
+        $$
+    '''
+
+
+# المشغلات وحدها (يُعاد إنشاؤها عند تحويل orders إلى جدول مقسم)
+POSTGRES_COUNTERS_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS orders_counters_insert ON orders',
+    'DROP TRIGGER IF EXISTS orders_counters_update ON orders',
+    'DROP TRIGGER IF EXISTS orders_counters_delete ON orders',
+    '''
+        CREATE TRIGGER orders_counters_insert AFTER INSERT ON orders
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION orderly_counters_insert()
+    ''',
+    '''
+        CREATE TRIGGER orders_counters_update AFTER UPDATE ON orders
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION orderly_counters_update()
+    ''',
+    '''
+        CREATE TRIGGER orders_counters_delete AFTER DELETE ON orders
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION orderly_counters_delete()
+    ''',
+]
+
+POSTGRES_COUNTERS_DDL = [
+    COUNTERS_TABLE['postgresql'],
+    # منع كتابات متزامنة أثناء إعادة البناء وتركيب المشغلات
+    'LOCK TABLE orders IN SHARE ROW EXCLUSIVE MODE',
+    _pg_counter_function('orderly_counters_insert', [('new_rows', 1)]),
+    _pg_counter_function('orderly_counters_update', [('old_rows', -1), ('new_rows', 1)]),
+    _pg_counter_function('orderly_counters_delete', [('old_rows', -1)]),
+    *POSTGRES_COUNTERS_TRIGGERS,
+    *REBUILD_COUNTERS,
+]
+
+
+# ===== SQLite: مشغلات على مستوى الصف =====
+def _sqlite_counter_statements(row, sign):
+    return f'''
+            INSERT INTO order_counters (merchant_id, dimension, value, count)
+            VALUES ({row}.merchant_id, 'status', {row}.status, {sign})
+            ON CONFLICT (merchant_id, dimension, value) DO UPDATE SET count = count + excluded.count;
+            INSERT INTO order_counters (merchant_id, dimension, value, count)
+            VALUES ({row}.merchant_id, 'category', {row}.category, {sign})
+            ON CONFLICT (merchant_id, dimension, value) DO UPDATE SET count = count + excluded.count;
+            INSERT INTO daily_stats (merchant_id, date, total_orders, completed_orders)
+            VALUES ({row}.merchant_id, DATE({row}.created_at), {sign}, ({row}.status = 'completed') * {sign})
+            ON CONFLICT (merchant_id, date) DO UPDATE SET
+                total_orders = total_orders + excluded.total_orders,
+                completed_orders = completed_orders + excluded.completed_orders;
+    '''
+
+
+SQLITE_COUNTERS_DDL = [
+    COUNTERS_TABLE['sqlite'],
+    f'''
+        CREATE TRIGGER IF NOT EXISTS orders_counters_insert AFTER INSERT ON orders BEGIN
+            {_sqlite_counter_statements('new', 1)}
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS orders_counters_update
+        AFTER UPDATE OF status, category, merchant_id, created_at ON orders BEGIN
+            {_sqlite_counter_statements('old', -1)}
+            {_sqlite_counter_statements('new', 1)}
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS orders_counters_delete AFTER DELETE ON orders BEGIN
+            {_sqlite_counter_statements('old', -1)}
+        END
+    ''',
+    *REBUILD_COUNTERS,
+]
+
+
+# ===== الأرشفة =====
+# نقل الطلب إلى orders_archive يحذفه من orders فينقصه مشغل الحذف من العدادات؛
+# هذه الجمل تعيده (بنفس معاملة النقل) حتى تبقى العدادات شاملة للأرشيف، وتعد
+# المؤرشف حسب الحالة (dimension = 'archived') حتى تطرحه القوائم التي تقرأ orders وحدها.
+def restore_counters_sql(id_filter):
+    """id_filter: شرط على orders_archive يحدد الطلبات المنقولة للتو"""
+    return [
+        f'''
+            INSERT INTO order_counters (merchant_id, dimension, value, count)
+            SELECT merchant_id, 'archived', status, COUNT(*) FROM orders_archive
+            WHERE {id_filter} GROUP BY merchant_id, status
+            ON CONFLICT (merchant_id, dimension, value) DO UPDATE SET count = order_counters.count + excluded.count
+        ''',
+        f'''
+            INSERT INTO order_counters (merchant_id, dimension, value, count)
+            SELECT merchant_id, 'status', status, COUNT(*) FROM orders_archive
+            WHERE {id_filter} GROUP BY merchant_id, status
+            ON CONFLICT (merchant_id, dimension, value) DO UPDATE SET count = order_counters.count + excluded.count
+        ''',
+        f'''
+            INSERT INTO order_counters (merchant_id, dimension, value, count)
+            SELECT merchant_id, 'category', category, COUNT(*) FROM orders_archive
+            WHERE {id_filter} GROUP BY merchant_id, category
+            ON CONFLICT (merchant_id, dimension, value) DO UPDATE SET count = order_counters.count + excluded.count
+        ''',
+        f'''
+            INSERT INTO daily_stats (merchant_id, date, total_orders, completed_orders)
+            SELECT merchant_id, DATE(created_at), COUNT(*),
+                   SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END)
+            FROM orders_archive WHERE {id_filter} GROUP BY merchant_id, DATE(created_at)
+            ON CONFLICT (merchant_id, date) DO UPDATE SET
+                total_orders = daily_stats.total_orders + excluded.total_orders,
+                completed_orders = daily_stats.completed_orders + excluded.completed_orders
+        ''',
+    ]
+
+
+# عد ما أُرشف قبل وجود بُعد 'archived' (مرة واحدة عند الترحيل)
+REBUILD_ARCHIVED_COUNTERS = [
+    "DELETE FROM order_counters WHERE dimension = 'archived'",
+    '''
+        INSERT INTO order_counters (merchant_id, dimension, value, count)
+        SELECT merchant_id, 'archived', status, COUNT(*) FROM orders_archive GROUP BY merchant_id, status
+    ''',
+]
+
+
+# ================= READS =================
+# params: (merchant_id, merchant_id, بداية اليوم المحلي UTC, بداية الغد المحلي UTC)
+# عدد اليوم يُقرأ بنطاق على created_at (فهرس idx_orders_merchant_created) لأن
+# daily_stats مجمع حسب تاريخ الخادم لا حسب يوم التاجر
+COUNTER_STATS_SQL = '''
+    SELECT dimension, value, count FROM order_counters WHERE merchant_id = %s
+    UNION ALL
+    SELECT 'today', 'total', COUNT(*) FROM orders
+    WHERE merchant_id = %s AND created_at >= %s AND created_at < %s
+'''
+
+
+def counters_to_stats(rows):
+    """تحويل صفوف COUNTER_STATS_SQL إلى قاموس الإحصائيات"""
+    by_status = {status: 0 for status in STATUSES}
+    archived = {status: 0 for status in STATUSES}
+    by_category = {}
+    today = 0
+    for row in rows:
+        if row['dimension'] == 'status':
+            by_status[row['value']] = row['count']
+        elif row['dimension'] == 'archived':
+            archived[row['value']] = row['count']
+        elif row['dimension'] == 'category':
+            by_category[row['value']] = row['count']
+        elif row['dimension'] == 'today':
+            today = row['count']
+    return {
+        'total': sum(by_status.values()),
+        'new': by_status['new'],
+        'completed': by_status['completed'],
+        'today': today,
+        'by_status': by_status,
+        # العدادات أعلاه تشمل الأرشيف؛ active ما في orders فقط (ما تعرضه القوائم)
+        'archived': sum(archived.values()),
+        'active': {status: count - archived.get(status, 0) for status, count in by_status.items()},
+        'by_category': {category: count for category, count in by_category.items() if count},
+    }
@@ -0,0 +1,531 @@
+import asyncio
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import psycopg
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout
+
+# ================= POOL CONFIGURATION =================
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", 2))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", 10))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+SQLITE_PATH = os.getenv("SQLITE_PATH", "orders.db")
+
+# ================= RECONNECT CONFIGURATION =================
+BREAKER_FAILURES = int(os.getenv("DB_BREAKER_FAILURES", 3))
+BACKOFF_BASE = float(os.getenv("DB_BACKOFF_BASE", 1))
+BACKOFF_MAX = float(os.getenv("DB_BACKOFF_MAX", 60))
+# فحص الخادم باتصال مستقل عند PoolTimeout؛ نتيجته تُستخدم لعدة ثوانٍ
+PROBE_TIMEOUT = float(os.getenv("DB_PROBE_TIMEOUT", 3))
+PROBE_CACHE_SECONDS = float(os.getenv("DB_PROBE_CACHE", 5))
+
+# created_at يُخزن بتوقيت UTC (مثل CURRENT_TIMESTAMP في SQLite) مهما كان توقيت الخادم
+PG_CONNECT_KWARGS = {'sslmode': 'require', 'options': '-c TimeZone=UTC'}
+
+# أخطاء الاتصال فقط تفتح القاطع؛ أخطاء البيانات (قيود، صياغة) لا تعني أن القاعدة متوقفة.
+# PoolTimeout (يرث OperationalError) يُصنف بفحص مستقل للخادم (DatabaseEngine.pool_timeout):
+# إن كان الخادم يرد فالمجمع ممتلئ، ضغط يصل إلى المستدعي كما هو دون فتح القاطع؛ وإلا
+# فهو انقطاع يُسجل فشلاً ويصل كـ DatabaseUnavailable (فتُكتب الطلبات في السجل المحلي).
+CONNECTION_ERRORS = (psycopg.OperationalError, psycopg.InterfaceError)
+
+
+class DatabaseUnavailable(Exception):
+    """القاطع مفتوح: القاعدة متوقفة فيُرفض الطلب فوراً بدل انتظار المهلة"""
+
+
+def pool_exhausted(error):
+    """هل الخطأ انتظار اتصال حر من المجمع حتى انتهاء المهلة؟"""
+    return isinstance(error, PoolTimeout)
+
+
+def primary_unavailable(error):
+    """هل الخطأ انقطاع للقاعدة (قاطع مفتوح أو خطأ اتصال) لا خطأ في البيانات أو مجمع ممتلئ؟"""
+    return isinstance(error, (DatabaseUnavailable,) + CONNECTION_ERRORS) and not pool_exhausted(error)
+
+
+class Backoff:
+    """تأخير أُسي مع عشوائية لمحاولات إعادة الاتصال"""
+
+    def __init__(self, base=BACKOFF_BASE, maximum=BACKOFF_MAX):
+        self.base = base
+        self.maximum = maximum
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = min(self.maximum, self.base * 2 ** self.attempts)
+        self.attempts += 1
+        return delay * random.uniform(0.5, 1)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class CircuitBreaker:
+    """قاطع دائرة: closed → open بعد عدة أخطاء اتصال، ثم half_open لمحاولة واحدة بعد التأخير"""
+
+    def __init__(self, failures=BREAKER_FAILURES, backoff=None):
+        self.failures = failures
+        self.backoff = backoff or Backoff()
+        self.state = 'closed'
+        self._consecutive = 0
+        self._retry_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'rejected': 0, 'last_error': None}
+
+    def before_call(self):
+        """يرفع DatabaseUnavailable إذا كان القاطع مفتوحاً؛ في half_open يمرر طلباً واحداً للفحص"""
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and time.monotonic() >= self._retry_at:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return
+            self._stats['rejected'] += 1
+            raise DatabaseUnavailable(self._stats['last_error'] or 'database unavailable')
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                print("✅ Database reachable again, circuit closed")
+            self.state = 'closed'
+            self._consecutive = 0
+            self._probing = False
+            self.backoff.reset()
+
+    def record_busy(self):
+        """المجمع ممتلئ والقاعدة ترد: لا نجاح ولا فشل، لكن طلب الفحص في half_open انتهى"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self._consecutive += 1
+            self._stats['last_error'] = str(error).strip()[:200]
+            if self.state == 'half_open' or self._consecutive >= self.failures:
+                delay = self.backoff.next_delay()
+                if self.state == 'closed':
+                    self._stats['opened'] += 1
+                    print(f"⚠️ Database circuit opened: {error}")
+                self.state = 'open'
+                self._probing = False
+                self._retry_at = time.monotonic() + delay
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self._consecutive,
+                'retry_in': round(max(0, self._retry_at - time.monotonic()), 2) if self.state == 'open' else 0,
+                **self._stats,
+            }
+
+
+def probe(dsn, timeout=POOL_TIMEOUT):
+    """فحص حي حقيقي لـ PostgreSQL باتصال مستقل و SELECT 1"""
+    with psycopg.connect(dsn, connect_timeout=max(1, int(timeout)), **PG_CONNECT_KWARGS) as conn:
+        conn.execute('SELECT 1')
+
+
+def dict_factory(cursor, row):
+    """تحويل صفوف SQLite إلى قواميس مثل dict_row في psycopg"""
+    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+
+
+class SQLitePool:
+    """مجمع اتصالات SQLite بنفس واجهة psycopg_pool"""
+
+    def __init__(self, path, min_size=1, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT, configure=None):
+        self.path = path
+        self.configure = configure
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._stats = {'requests_num': 0, 'requests_waiting': 0, 'requests_wait_ms': 0, 'requests_errors': 0}
+        for _ in range(min_size):
+            self._size += 1
+            self._idle.put(self._new_connection())
+
+    def _new_connection(self):
+        """اتصال جديد لمكان محجوز مسبقاً في _size"""
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=self.timeout,
+                               detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.row_factory = dict_factory
+        # WAL: commits محلية سريعة وقراءات لا تنتظر الكتابة
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        if self.configure is not None:
+            self.configure(conn)
+        return conn
+
+    def getconn(self, timeout=None):
+        """حجز اتصال من المجمع"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._lock:
+            self._stats['requests_num'] += 1
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        # المكان يُحجز داخل القفل حتى لا يتجاوز طالبون متزامنون max_size
+        with self._lock:
+            can_grow = self._size < self.max_size
+            if can_grow:
+                self._size += 1
+        if can_grow:
+            try:
+                return self._new_connection()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+
+        with self._lock:
+            self._stats['requests_waiting'] += 1
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._stats['requests_errors'] += 1
+            raise PoolTimeout(f"couldn't get a connection after {timeout:.2f} sec")
+        finally:
+            with self._lock:
+                self._stats['requests_waiting'] -= 1
+                self._stats['requests_wait_ms'] += int((time.monotonic() - started) * 1000)
+
+    def putconn(self, conn):
+        """إعادة الاتصال إلى المجمع"""
+        self._idle.put(conn)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'pool_min': self.min_size,
+                'pool_max': self.max_size,
+                'pool_size': self._size,
+                'pool_available': self._idle.qsize(),
+                **self._stats,
+            }
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class DatabaseEngine:
+    """محرك اتصالات مشترك وآمن بين الخيوط (بوت + لوحة التحكم)"""
+
+    def __init__(self, dsn=None, sqlite_path=SQLITE_PATH,
+                 min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 sqlite_configure=None):
+        self.dsn = dsn if dsn is not None else os.getenv('DATABASE_URL')
+        self.sqlite_path = sqlite_path
+        self.sqlite_configure = sqlite_configure
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pool = None
+        self.dialect = None
+        # مجمع SQLite المحلي يبقى متاحاً بعد العودة إلى PostgreSQL لتفريغ سجل الطلبات
+        self.local_pool = None
+        self.breaker = CircuitBreaker()
+        self._local = threading.local()
+        self._local_lock = threading.Lock()
+        self._probed = (float('-inf'), True)
+
+    def open(self):
+        """فتح مجمع PostgreSQL أو الرجوع إلى SQLite"""
+        try:
+            self.open_primary()
+        except Exception as e:
+            print(f"❌ PostgreSQL pool error: {e}")
+            self.pool = SQLitePool(self.sqlite_path, max_size=self.max_size, timeout=self.timeout,
+                                   configure=self.sqlite_configure)
+            self.local_pool = self.pool
+            self.dialect = 'sqlite'
+            print("⚠️ Using SQLite pool as fallback")
+        return self
+
+    def open_primary(self):
+        """فتح مجمع PostgreSQL فقط؛ يرفع استثناء بدلاً من الرجوع إلى SQLite"""
+        if not self.dsn:
+            raise ValueError("DATABASE_URL not found in environment variables")
+
+        pool = ConnectionPool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            timeout=self.timeout,
+            kwargs={**PG_CONNECT_KWARGS, 'row_factory': dict_row},
+            # فحص الاتصال قبل تسليمه حتى لا يُستخدم اتصال انقطع أثناء الخمول
+            check=ConnectionPool.check_connection,
+            open=True,
+        )
+        try:
+            pool.wait(timeout=self.timeout)
+        except Exception:
+            pool.close()
+            raise
+        self.pool = pool
+        self.dialect = 'postgresql'
+        print(f"✅ PostgreSQL pool ready ({self.min_size}-{self.max_size} connections)")
+        return self
+
+    def open_local(self, prepare=None):
+        """فتح SQLite المحلي بجانب PostgreSQL لكتابة الطلبات أثناء انقطاع مؤقت
+
+        prepare(engine): تجهيز مخطط القاعدة المحلية (الترحيلات) عند أول فتح.
+        """
+        with self._local_lock:
+            if self.local_pool is None:
+                local = DatabaseEngine(dsn='', sqlite_path=self.sqlite_path, max_size=self.max_size,
+                                       timeout=self.timeout, sqlite_configure=self.sqlite_configure)
+                local.pool = SQLitePool(self.sqlite_path, max_size=self.max_size, timeout=self.timeout,
+                                        configure=self.sqlite_configure)
+                local.dialect = 'sqlite'
+                if prepare is not None:
+                    prepare(local)
+                self.local_pool = local.pool
+                print(f"⚠️ Local SQLite journal opened at {self.sqlite_path}")
+        return self.local_pool
+
+    @property
+    def degraded(self):
+        """True عند العمل على SQLite مؤقتاً لأن PostgreSQL المضبوط غير متاح"""
+        return self.dialect == 'sqlite' and bool(self.dsn)
+
+    def adopt(self, other):
+        """التحويل إلى مجمع محرك آخر (PostgreSQL بعد عودته) بدون إعادة تشغيل"""
+        self.pool, self.dialect = other.pool, other.dialect
+        print(f"✅ Database engine switched to {self.dialect}")
+
+    @property
+    def placeholder(self):
+        return '%s' if self.dialect == 'postgresql' else '?'
+
+    # ===== CONNECTION SCOPING =====
+
+    def begin_scope(self):
+        """بدء نطاق: أول استعلام في الخيط الحالي يحجز اتصالاً يبقى حتى end_scope"""
+        self._local.scoped = True
+
+    def end_scope(self):
+        """إنهاء النطاق وإعادة اتصاله إلى المجمع"""
+        self._local.scoped = False
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        self._local.pool.putconn(conn)
+
+    def _primary_reachable(self):
+        checked_at, reachable = self._probed
+        if time.monotonic() - checked_at < PROBE_CACHE_SECONDS:
+            return reachable
+        try:
+            probe(self.dsn, PROBE_TIMEOUT)
+            reachable = True
+        except Exception:
+            reachable = False
+        self._probed = (time.monotonic(), reachable)
+        return reachable
+
+    def pool_timeout(self, error):
+        """تصنيف PoolTimeout: يرجع الاستثناء الذي يصل إلى المستدعي
+
+        psycopg_pool يرفع PoolTimeout في حالتين: كل الاتصالات مشغولة، أو الخادم متوقف
+        (الاتصالات الميتة تُحذف عند الفحص ولا ينجح إنشاء غيرها). اتصال مستقل يفرق بينهما.
+        """
+        if self._primary_reachable():
+            self.breaker.record_busy()
+            return error
+        self.breaker.record_failure(error)
+        return DatabaseUnavailable(f'primary unreachable: {error}')
+
+    @contextmanager
+    def _guard(self):
+        """تمرير الاستخدام عبر قاطع الدائرة (على PostgreSQL فقط)"""
+        if self.dialect != 'postgresql':
+            yield
+            return
+        self.breaker.before_call()
+        failed = False
+        try:
+            yield
+        except PoolTimeout as e:
+            failed = True
+            error = self.pool_timeout(e)
+            if error is e:
+                raise
+            raise error from e
+        except CONNECTION_ERRORS as e:
+            failed = True
+            self.breaker.record_failure(e)
+            raise
+        finally:
+            # أي نتيجة غير خطأ اتصال تعني أن القاعدة تستجيب
+            if not failed:
+                self.breaker.record_success()
+
+    @contextmanager
+    def connection(self):
+        """اتصال من المجمع (أو اتصال النطاق الحالي إن وجد)"""
+        with self._guard():
+            if getattr(self._local, 'scoped', False):
+                if getattr(self._local, 'conn', None) is None:
+                    self._local.pool = self.pool
+                    self._local.conn = self.pool.getconn(timeout=self.timeout)
+                yield self._local.conn
+                return
+
+            # الاتصال يعود إلى المجمع الذي أُخذ منه حتى لو تبدل المجمع أثناء الاستخدام
+            pool = self.pool
+            conn = pool.getconn(timeout=self.timeout)
+            try:
+                yield conn
+            finally:
+                pool.putconn(conn)
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn):
+        cur = conn.cursor()
+        try:
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    @contextmanager
+    def cursor(self):
+        """مؤشر داخل معاملة: commit عند النجاح و rollback عند الخطأ"""
+        with self.connection() as conn:
+            with self._transaction(conn) as cur:
+                yield cur
+
+    @contextmanager
+    def local_cursor(self):
+        """مؤشر على قاعدة SQLite المحلية مهما كان المجمع الحالي"""
+        conn = self.local_pool.getconn(timeout=self.timeout)
+        try:
+            with self._transaction(conn) as cur:
+                yield cur
+        finally:
+            self.local_pool.putconn(conn)
+
+    def ping(self):
+        """فحص حي (SELECT 1) عبر القاطع؛ يرجع فوراً False إذا كان القاطع مفتوحاً"""
+        try:
+            with self.cursor() as cur:
+                cur.execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    def stats(self):
+        """إحصائيات المجمع"""
+        if self.pool is None:
+            return {'dialect': None}
+        return {'dialect': self.dialect, **self.pool.get_stats()}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+        if self.local_pool is not None and self.local_pool is not self.pool:
+            self.local_pool.close()
+
+
+class AsyncDatabaseEngine:
+    """مجمع اتصالات غير متزامن (AsyncConnection) لمعالجات البوت"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.pool = None
+
+    @property
+    def native(self):
+        """True عندما يعمل المسار غير المتزامن فعلياً على PostgreSQL"""
+        return self.pool is not None
+
+    async def open(self):
+        """فتح المجمع داخل حلقة أحداث البوت"""
+        if self.engine.dialect != 'postgresql':
+            print("⚠️ Async database path uses SQLite through worker threads")
+            return
+        try:
+            self.pool = AsyncConnectionPool(
+                self.engine.dsn,
+                min_size=self.engine.min_size,
+                max_size=self.engine.max_size,
+                timeout=self.engine.timeout,
+                kwargs={**PG_CONNECT_KWARGS, 'row_factory': dict_row},
+                check=AsyncConnectionPool.check_connection,
+                open=False,
+            )
+            await self.pool.open(wait=True, timeout=self.engine.timeout)
+            print("✅ Async PostgreSQL pool ready")
+        except Exception as e:
+            print(f"❌ Async pool error, using worker threads: {e}")
+            self.pool = None
+
+    @asynccontextmanager
+    async def cursor(self):
+        """مؤشر غير متزامن داخل معاملة (يشارك قاطع الدائرة مع المحرك المتزامن)"""
+        breaker = self.engine.breaker
+        breaker.before_call()
+        failed = False
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    yield cur
+        except PoolTimeout as e:
+            failed = True
+            # الفحص يفتح اتصالاً متزامناً؛ خارج حلقة الأحداث
+            error = await asyncio.to_thread(self.engine.pool_timeout, e)
+            if error is e:
+                raise
+            raise error from e
+        except CONNECTION_ERRORS as e:
+            failed = True
+            breaker.record_failure(e)
+            raise
+        finally:
+            if not failed:
+                breaker.record_success()
+
+    async def run_sync(self, func, *args, **kwargs):
+        """تنفيذ دالة متزامنة في خيط منفصل حتى لا تتوقف حلقة الأحداث"""
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def stats(self):
+        if self.pool is None:
+            return {'native': False}
+        return {'native': True, **self.pool.get_stats()}
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
@@ -0,0 +1,168 @@
+import csv
+import io
+import os
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# ================= EXPORT CONFIGURATION =================
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
+# (العنوان، دالة القيمة) لكل عمود في ملف التصدير
+EXPORT_COLUMNS = [
+    ('رقم الطلب', lambda order: order['id']),
+    ('اسم العميل', lambda order: order['customer_name']),
+    ('الهاتف', lambda order: order['phone']),
+    ('المنتج', lambda order: order['product']),
+    ('الفئة', lambda order: order['category']),
+    ('الكمية', lambda order: order['quantity']),
+    ('العنوان', lambda order: order['address']),
+    ('الحالة', lambda order: order['status']),
+    ('التاريخ', lambda order: order['created_at'].strftime('%Y-%m-%d %H:%M:%S')),
+]
+
+EXPORT_FIELDS = 'id, customer_name, phone, product, category, quantity, address, status, created_at'
+EXPORT_SELECT = f'SELECT {EXPORT_FIELDS} FROM orders'
+# مع الطلبات المؤرشفة (archived=1)
+EXPORT_ARCHIVE_SELECT = f'SELECT {EXPORT_FIELDS} FROM orders_all'
+
+
+def export_row(order):
+    return [value(order) for _, value in EXPORT_COLUMNS]
+
+
+# ================= CSV =================
+# نص العميل الذي يبدأ بهذه المحارف يصبح معادلة عند فتح CSV في برنامج جداول
+# (حقن معادلات)؛ الفاصلة العليا تجعله نصاً. خلايا xlsx هنا inlineStr فلا تُحسب أصلاً.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(chunks):
+    """كتابة CSV دفعة بدفعة؛ كل دفعة صفوف تُرسل فور تجهيزها"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM حتى يفتح Excel النص العربي بترميز UTF-8
+    buffer.write('\ufeff')
+    writer.writerow([title for title, _ in EXPORT_COLUMNS])
+
+    for rows in chunks:
+        writer.writerows([csv_cell(value) for value in export_row(order)] for order in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+# ================= XLSX =================
+# ملف xlsx هو zip؛ يُكتب بدون seek (data descriptors) فيُرسل جزءاً جزءاً
+# بدلاً من بنائه كاملاً في الذاكرة. النصوص inline فلا حاجة لجدول sharedStrings.
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Orders" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+# محارف التحكم غير مسموحة في XML
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _ChunkSink:
+    """ملف للكتابة فقط يجمع ما يكتبه zipfile حتى يُسحب ويُرسل"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _xlsx_cell(value):
+    if isinstance(value, int):
+        return f'<c t="n"><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value if value is not None else '')))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return ('<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>').encode('utf-8')
+
+
+def stream_xlsx(chunks):
+    """كتابة ورقة xlsx دفعة بدفعة مع إرسال البايتات المضغوطة أولاً بأول"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetViews><sheetView rightToLeft="1" workbookViewId="0"/></sheetViews>'
+                b'<sheetData>'
+            )
+            sheet.write(_xlsx_row([title for title, _ in EXPORT_COLUMNS]))
+            for rows in chunks:
+                for order in rows:
+                    sheet.write(_xlsx_row(export_row(order)))
+                data = sink.drain()
+                if data:
+                    yield data
+            sheet.write(b'</sheetData></worksheet>')
+
+    yield sink.drain()
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+
+from db_engine import Backoff, DatabaseEngine, probe
+
+# ================= JOURNAL CONFIGURATION =================
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", 15))
+REPLAY_BATCH_SIZE = int(os.getenv("REPLAY_BATCH_SIZE", 200))
+
+# ================= ORDER JOURNAL =================
+# أثناء انقطاع PostgreSQL تُكتب الطلبات في SQLite المحلي (WAL) ويُسجل كل طلب
+# في order_journal بمفتاح فريد داخل نفس المعاملة. عند عودة PostgreSQL يُعاد
+# تشغيل السجل على دفعات، والمفتاح الفريد يمنع تكرار الطلب إذا أُعيدت دفعة.
+
+POSTGRES_JOURNAL_DDL = [
+    'ALTER TABLE orders ADD COLUMN IF NOT EXISTS idempotency_key TEXT',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key ON orders (idempotency_key)',
+]
+
+# orders المقسم شهرياً يشترط وجود مفتاح التقسيم في كل فهرس فريد
+POSTGRES_JOURNAL_INDEX = '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key ON orders (idempotency_key, created_at)
+'''
+
+SQLITE_JOURNAL_DDL = [
+    '''
+    CREATE TABLE IF NOT EXISTS order_journal (
+        order_id INTEGER PRIMARY KEY,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        primary_id INTEGER,
+        replayed_at TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_order_journal_pending ON order_journal (order_id) WHERE replayed_at IS NULL',
+]
+
+JOURNAL_INSERT_SQL = '''
+    INSERT INTO order_journal (order_id, idempotency_key)
+    VALUES (?, lower(hex(randomblob(16))))
+'''
+
+PENDING_SQL = '''
+    SELECT j.order_id, j.idempotency_key, o.category, o.product, o.customer_name, o.phone,
+           o.address, o.quantity, o.size, o.language, o.status, o.created_at, o.merchant_id
+    FROM order_journal j LEFT JOIN orders o ON o.id = j.order_id
+    WHERE j.replayed_at IS NULL
+    ORDER BY j.order_id
+    LIMIT ?
+'''
+
+REPLAY_COLUMNS = ('category', 'product', 'customer_name', 'phone', 'address', 'quantity', 'size',
+                  'language', 'status', 'created_at', 'merchant_id', 'idempotency_key')
+
+
+def journal_orders(cursor, order_ids):
+    """تسجيل طلبات SQLite في السجل داخل معاملة الإدخال نفسها"""
+    cursor.executemany(JOURNAL_INSERT_SQL, [(order_id,) for order_id in order_ids])
+
+
+def replay_sql(rows):
+    """INSERT واحد لدفعة من السجل؛ الطلبات المعادة سابقاً تُتجاهل بمفتاحها ووقتها"""
+    row_sql = '(' + ', '.join(['%s'] * len(REPLAY_COLUMNS)) + ')'
+    query = (
+        f"INSERT INTO orders ({', '.join(REPLAY_COLUMNS)}) VALUES "
+        + ', '.join([row_sql] * len(rows))
+        + ' ON CONFLICT (idempotency_key, created_at) DO NOTHING RETURNING id, idempotency_key'
+    )
+    params = [row[column] for row in rows for column in REPLAY_COLUMNS]
+    return query, params
+
+
+class JournalReconciler:
+    """خيط خلفي يفحص PostgreSQL، يعيد تشغيل السجل المحلي، ثم يعيد المحرك إلى القاعدة الأساسية"""
+
+    def __init__(self, engine, prepare=None, on_primary=None,
+                 interval=RECONCILE_INTERVAL, batch_size=REPLAY_BATCH_SIZE):
+        self.engine = engine
+        # prepare(engine): تجهيز مخطط PostgreSQL (الترحيلات) قبل إعادة التشغيل
+        self.prepare = prepare
+        self.on_primary = on_primary
+        self.interval = interval
+        self.batch_size = batch_size
+        # الفحوص الفاشلة تتباعد أُسياً بدءاً من interval
+        self.backoff = Backoff(base=interval)
+        self.stats = {'checks': 0, 'replayed': 0, 'duplicates': 0, 'switched_at': None, 'last_error': None}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.engine.dsn:
+            self._thread = threading.Thread(target=self._run, name='journal-reconciler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def pending(self):
+        """عدد الطلبات التي لم تُنقل بعد إلى PostgreSQL"""
+        if self.engine.local_pool is None:
+            return 0
+        with self.engine.local_cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) AS count FROM order_journal WHERE replayed_at IS NULL')
+            return cursor.fetchone()['count']
+
+    def _run(self):
+        delay = self.interval
+        while not self._stop.wait(delay):
+            try:
+                self.reconcile()
+                self.backoff.reset()
+                delay = self.interval
+            except Exception as e:
+                self.stats['last_error'] = str(e).strip()[:200]
+                delay = max(self.interval, self.backoff.next_delay())
+                print(f"⚠️ Journal reconcile failed, next check in {delay:.0f}s: {self.stats['last_error']}")
+
+    def reconcile(self):
+        """محاولة واحدة: العودة إلى PostgreSQL إن أمكن ثم تفريغ السجل"""
+        self.stats['checks'] += 1
+        if self.engine.degraded:
+            # فحص خفيف باتصال واحد قبل فتح مجمع كامل
+            probe(self.engine.dsn, self.engine.timeout)
+            primary = DatabaseEngine(dsn=self.engine.dsn, min_size=self.engine.min_size,
+                                     max_size=self.engine.max_size, timeout=self.engine.timeout)
+            primary.open_primary()
+            try:
+                if self.prepare is not None:
+                    self.prepare(primary)
+                self.replay(primary)
+            except Exception:
+                primary.close()
+                raise
+            self.engine.adopt(primary)
+            self.stats['switched_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            if self.on_primary is not None:
+                self.on_primary()
+
+        # طلبات كُتبت محلياً أثناء لحظة التحويل
+        if self.engine.local_pool is not None and not self.engine.degraded:
+            self.replay(self.engine)
+
+    def replay(self, target):
+        """نقل السجل المحلي إلى target على دفعات؛ يرجع عدد الطلبات المنقولة"""
+        total = 0
+        while True:
+            with self.engine.local_cursor() as cursor:
+                cursor.execute(PENDING_SQL, (self.batch_size,))
+                rows = cursor.fetchall()
+            if not rows:
+                return total
+
+            # الطلبات المحذوفة محلياً قبل إعادة التشغيل لا تُنقل
+            live = [row for row in rows if row['category'] is not None]
+            inserted = {}
+            if live:
+                query, params = replay_sql(live)
+                with target.cursor() as cursor:
+                    cursor.execute(query, params)
+                    inserted = {row['idempotency_key']: row['id'] for row in cursor.fetchall()}
+
+            with self.engine.local_cursor() as cursor:
+                cursor.executemany(
+                    'UPDATE order_journal SET replayed_at = CURRENT_TIMESTAMP, primary_id = ? WHERE order_id = ?',
+                    [(inserted.get(row['idempotency_key']), row['order_id']) for row in rows]
+                )
+
+            self.stats['replayed'] += len(inserted)
+            self.stats['duplicates'] += len(live) - len(inserted)
+            total += len(inserted)
+            if inserted:
+                print(f"✅ Replayed {len(inserted)} journaled orders to {target.dialect}")
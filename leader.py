@@ -0,0 +1,208 @@
+import asyncio
+import os
+import threading
+import time
+
+import psycopg
+
+from db_engine import PG_CONNECT_KWARGS, Backoff
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ================= LEADER ELECTION =================
+# مثيل واحد فقط يستقبل التحديثات بـ polling (وإلا يرد Telegram بخطأ Conflict).
+# على PostgreSQL القائد يحمل قفلاً استشارياً على مستوى الجلسة باتصال مخصص؛
+# المثيل الجديد ينتظر القفل على الخادم ويأخذه فور إفلاته أو انقطاع جلسة القديم.
+# على SQLite يقوم مقامه قفل ملف (يكفي لمثيلات على نفس الجهاز فقط).
+
+LEADER_LOCK_ID = 7351004
+LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE", "orderlybot.leader.lock")
+LEADER_CHECK_INTERVAL = float(os.getenv("LEADER_CHECK_INTERVAL", 10))
+
+# اكتشاف جلسة ميتة بسرعة حتى لا يحمل اتصال معلق القفل طويلاً
+LEADER_CONNECT_KWARGS = {
+    'autocommit': True,
+    'connect_timeout': 10,
+    'keepalives': 1,
+    'keepalives_idle': 10,
+    'keepalives_interval': 5,
+    'keepalives_count': 3,
+}
+
+
+class LeaderElection:
+    """انتخاب قائد واحد بين مثيلات البوت عبر قفل استشاري أو قفل ملف"""
+
+    def __init__(self, engine, lock_id=LEADER_LOCK_ID, lock_file=LEADER_LOCK_FILE,
+                 check_interval=LEADER_CHECK_INTERVAL):
+        self.engine = engine
+        self.lock_id = lock_id
+        self.lock_file = lock_file
+        self.check_interval = check_interval
+        self.backoff = Backoff()
+        self.stats = {'is_leader': False, 'method': None, 'since': None, 'waited_seconds': None}
+        self._conn = None
+        # جلسة الخادم التي أخذت القفل (للتمييز بين جلستنا القديمة ومثيل آخر)
+        self._pid = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    @property
+    def is_leader(self):
+        return self.stats['is_leader']
+
+    def acquire(self):
+        """الانتظار حتى يصبح هذا المثيل القائد"""
+        started = time.monotonic()
+        if self.engine.dialect == 'postgresql':
+            self._acquire_advisory()
+            self.stats['method'] = 'advisory_lock'
+        else:
+            self._acquire_file()
+            self.stats['method'] = 'lock_file'
+
+        waited = time.monotonic() - started
+        self.stats.update(is_leader=True, since=time.strftime('%Y-%m-%d %H:%M:%S'),
+                          waited_seconds=round(waited, 1))
+        print(f"✅ Leader lock acquired ({self.stats['method']}) after {waited:.1f}s")
+
+    def _connect(self):
+        return psycopg.connect(self.engine.dsn, **LEADER_CONNECT_KWARGS, **PG_CONNECT_KWARGS)
+
+    def _try_advisory(self):
+        with self._lock:
+            if self._conn is None or self._conn.closed:
+                self._conn = self._connect()
+            held = self._conn.execute('SELECT pg_try_advisory_lock(%s)', (self.lock_id,)).fetchone()[0]
+            if held:
+                self._pid = self._conn.info.backend_pid
+            return held
+
+    def _holder(self):
+        """رقم جلسة الخادم التي تحمل القفل الآن (None إذا لم يحمله أحد)"""
+        with self._lock:
+            row = self._conn.execute('''
+                SELECT pid FROM pg_locks
+                WHERE locktype = 'advisory' AND granted AND objsubid = 1
+                  AND ((classid::bigint << 32) | objid::bigint) = %s
+            ''', (self.lock_id,)).fetchone()
+        return row[0] if row else None
+
+    def _acquire_advisory(self):
+        while True:
+            try:
+                if self._try_advisory():
+                    self.backoff.reset()
+                    return
+                print("⏳ Another instance holds the leader lock; waiting on standby...")
+                # انتظار على الخادم بدون استطلاع؛ يعود فور إفلات القفل
+                self._conn.execute('SELECT pg_advisory_lock(%s)', (self.lock_id,))
+                self._pid = self._conn.info.backend_pid
+                self.backoff.reset()
+                return
+            except psycopg.Error as e:
+                self._close_connection()
+                delay = self.backoff.next_delay()
+                print(f"⚠️ Leader lock connection failed, retrying in {delay:.0f}s: {e}")
+                time.sleep(delay)
+
+    def _acquire_file(self):
+        self._file = open(self.lock_file, 'a')
+        if fcntl is None:
+            print("⚠️ File locks not supported on this platform; running without leader election")
+            return
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"⏳ Another instance holds {self.lock_file}; waiting on standby...")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+
+    def check(self):
+        """هل ما زال هذا المثيل القائد؟
+
+        انقطاع اتصال القفل لا يعني أن مثيلاً آخر أخذه (قد تكون القاعدة متوقفة للجميع)،
+        فتبقى القيادة وتُعاد محاولة أخذ القفل؛ تُترك فقط إذا أكد الخادم أن جلسة أخرى
+        غير جلستنا القديمة تحمله.
+        """
+        if self.stats['method'] != 'advisory_lock':
+            return self.is_leader
+        try:
+            with self._lock:
+                if self._conn is None or self._conn.closed:
+                    raise psycopg.OperationalError('leader lock connection is closed')
+                self._conn.execute('SELECT 1')
+            return True
+        except psycopg.Error as e:
+            print(f"⚠️ Leader lock connection lost: {e}")
+            self._close_connection()
+
+        try:
+            if self._try_advisory():
+                self.backoff.reset()
+                print("✅ Leader lock re-acquired")
+                return True
+            holder = self._holder()
+        except psycopg.Error as e:
+            self._close_connection()
+            print(f"⚠️ Leader lock reconnect failed, keeping leadership and retrying: {e}")
+            return True
+
+        if holder is None or holder == self._pid:
+            # جلستنا القديمة لم ينتبه الخادم لانقطاعها بعد (أو أُفلت القفل للتو)
+            print("⚠️ Leader lock still held by our previous session; retrying")
+            self._close_connection()
+            return True
+        self._close_connection()
+        self.stats['is_leader'] = False
+        return False
+
+    async def watch(self, on_lost):
+        """فحص دوري داخل حلقة البوت؛ on_lost() عند التأكد من أن مثيلاً آخر أخذ القيادة"""
+        delay = self.check_interval
+        while True:
+            await asyncio.sleep(delay)
+            if not await asyncio.to_thread(self.check):
+                print("❌ Leader lock taken by another instance; stopping update polling")
+                on_lost()
+                return
+            # اتصال القفل ما زال مقطوعاً: إعادة المحاولة بتأخير أُسي
+            delay = self.check_interval if self._conn is not None else self.backoff.next_delay()
+
+    def start_watch(self, on_lost):
+        """تشغيل watch كمهمة في حلقة الأحداث الحالية"""
+        if self.is_leader and self._watcher is None:
+            self._watcher = asyncio.get_running_loop().create_task(self.watch(on_lost))
+
+    def _close_connection(self):
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+
+    def release(self):
+        """إفلات القفل فوراً حتى يبدأ المثيل التالي دون انتظار انتهاء الجلسة"""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        if self._conn is not None:
+            try:
+                with self._lock:
+                    self._conn.execute('SELECT pg_advisory_unlock(%s)', (self.lock_id,))
+            except psycopg.Error:
+                pass
+            self._close_connection()
+        if self._file is not None:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        if self.stats['is_leader']:
+            print("ℹ️ Leader lock released")
+        self.stats['is_leader'] = False
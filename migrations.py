@@ -0,0 +1,337 @@
+from datetime import datetime, timezone
+
+from archive import POSTGRES_ARCHIVE_DDL, SQLITE_ARCHIVE_DDL, add_months, partition_orders
+from counters import POSTGRES_COUNTERS_DDL, POSTGRES_COUNTERS_TRIGGERS, REBUILD_ARCHIVED_COUNTERS, SQLITE_COUNTERS_DDL
+from journal import POSTGRES_JOURNAL_DDL, POSTGRES_JOURNAL_INDEX, SQLITE_JOURNAL_DDL
+from rollups import POSTGRES_ROLLUP_DDL, POSTGRES_ROLLUP_TRIGGERS, SQLITE_ROLLUP_DDL
+from outbox import OUTBOX_DDL, OUTBOX_INDEX
+from sessions import SESSION_DDL
+from search import (POSTGRES_SEARCH_DDL, POSTGRES_SEARCH_INDEX, POSTGRES_SEARCH_REBUILD, SQLITE_SEARCH_DDL,
+                    SQLITE_SEARCH_REBUILD)
+
+# ================= SCHEMA MIGRATIONS =================
+# كل ترحيل يُنفذ مرة واحدة في معاملة خاصة به ويُسجل رقمه في schema_version.
+# الخطوة إما نص SQL أو دالة تستقبل (cursor) للحالات التي تحتاج فحصاً قبل التنفيذ.
+
+
+def add_column(table, column, definition):
+    """إضافة عمود إذا لم يكن موجوداً (SQLite لا يدعم ADD COLUMN IF NOT EXISTS)"""
+    def step(cursor):
+        cursor.execute(f"SELECT name FROM pragma_table_info('{table}')")
+        if column not in {row['name'] for row in cursor.fetchall()}:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return step
+
+
+# القوائم والترقيم: WHERE merchant_id [AND status] ORDER BY created_at DESC, id DESC
+HOT_INDEXES = [
+    '''
+    CREATE INDEX IF NOT EXISTS idx_orders_merchant_created
+    ON orders (merchant_id, created_at DESC, id DESC)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_orders_merchant_status_created
+    ON orders (merchant_id, status, created_at DESC, id DESC)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_orders_merchant_category_created
+    ON orders (merchant_id, category, created_at DESC)
+    ''',
+]
+
+# كل ما يُعرّف على orders نفسه ويُعاد إنشاؤه بعد تحويله إلى جدول مقسم
+POSTGRES_ORDERS_REBUILD = [
+    *HOT_INDEXES,
+    POSTGRES_SEARCH_INDEX,
+    POSTGRES_JOURNAL_INDEX,
+    *POSTGRES_COUNTERS_TRIGGERS,
+    *POSTGRES_ROLLUP_TRIGGERS,
+]
+
+MIGRATIONS = [
+    {
+        'version': 1,
+        'name': 'base tables',
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS orders (
+                id SERIAL PRIMARY KEY,
+                category VARCHAR(20) NOT NULL,
+                product TEXT NOT NULL,
+                customer_name TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                address TEXT NOT NULL,
+                quantity TEXT NOT NULL,
+                size TEXT,
+                language VARCHAR(5) DEFAULT 'ar',
+                status VARCHAR(20) DEFAULT 'new',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                merchant_id INTEGER DEFAULT 1
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS merchants (
+                id SERIAL PRIMARY KEY,
+                telegram_id BIGINT UNIQUE,
+                username VARCHAR(100),
+                business_name TEXT,
+                plan VARCHAR(20) DEFAULT 'trial',
+                subscription_end DATE,
+                settings JSONB DEFAULT '{}',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                id SERIAL PRIMARY KEY,
+                merchant_id INTEGER,
+                date DATE DEFAULT CURRENT_DATE,
+                total_orders INTEGER DEFAULT 0,
+                completed_orders INTEGER DEFAULT 0,
+                total_revenue DECIMAL(10, 2) DEFAULT 0,
+                UNIQUE(merchant_id, date)
+            )
+            ''',
+            # جداول merchants القديمة في OrderlyBot أُنشئت بدون هذين العمودين
+            "ALTER TABLE merchants ADD COLUMN IF NOT EXISTS subscription_end DATE",
+            "ALTER TABLE merchants ADD COLUMN IF NOT EXISTS settings JSONB DEFAULT '{}'",
+            '''
+            INSERT INTO merchants (id, telegram_id, username, business_name, plan)
+            VALUES (1, 5812937391, 'admin', 'OrderlyBot Admin', 'pro')
+            ON CONFLICT (id) DO NOTHING
+            ''',
+        ],
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                category TEXT NOT NULL,
+                product TEXT NOT NULL,
+                customer_name TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                address TEXT NOT NULL,
+                quantity TEXT NOT NULL,
+                size TEXT,
+                language TEXT DEFAULT 'ar',
+                status TEXT DEFAULT 'new',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                merchant_id INTEGER DEFAULT 1
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS merchants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                telegram_id INTEGER UNIQUE,
+                username TEXT,
+                business_name TEXT,
+                plan TEXT DEFAULT 'trial',
+                subscription_end DATE,
+                settings TEXT DEFAULT '{}',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                merchant_id INTEGER,
+                date DATE DEFAULT CURRENT_DATE,
+                total_orders INTEGER DEFAULT 0,
+                completed_orders INTEGER DEFAULT 0,
+                total_revenue DECIMAL(10, 2) DEFAULT 0,
+                UNIQUE(merchant_id, date)
+            )
+            ''',
+            add_column('orders', 'merchant_id', 'INTEGER DEFAULT 1'),
+            add_column('merchants', 'subscription_end', 'DATE'),
+            add_column('merchants', 'settings', "TEXT DEFAULT '{}'"),
+            '''
+            INSERT OR IGNORE INTO merchants (id, telegram_id, username, business_name, plan)
+            VALUES (1, 5812937391, 'admin', 'OrderlyBot Admin', 'pro')
+            ''',
+        ],
+    },
+    {
+        'version': 2,
+        'name': 'order search index',
+        'postgresql': POSTGRES_SEARCH_DDL,
+        'sqlite': SQLITE_SEARCH_DDL,
+    },
+    {
+        'version': 3,
+        'name': 'hot query indexes',
+        'postgresql': HOT_INDEXES,
+        'sqlite': HOT_INDEXES,
+    },
+    {
+        'version': 4,
+        'name': 'order counters',
+        'postgresql': POSTGRES_COUNTERS_DDL,
+        'sqlite': SQLITE_COUNTERS_DDL,
+    },
+    {
+        'version': 5,
+        'name': 'order journal',
+        'postgresql': POSTGRES_JOURNAL_DDL,
+        'sqlite': SQLITE_JOURNAL_DDL,
+    },
+    {
+        'version': 6,
+        'name': 'order rollups',
+        'postgresql': POSTGRES_ROLLUP_DDL,
+        'sqlite': SQLITE_ROLLUP_DDL,
+    },
+    {
+        'version': 7,
+        'name': 'order partitions and archive',
+        'postgresql': [partition_orders(POSTGRES_ORDERS_REBUILD), *POSTGRES_ARCHIVE_DDL],
+        'sqlite': SQLITE_ARCHIVE_DDL,
+    },
+    {
+        'version': 8,
+        'name': 'bot sessions',
+        'postgresql': SESSION_DDL['postgresql'],
+        'sqlite': SESSION_DDL['sqlite'],
+    },
+    {
+        'version': 9,
+        'name': 'admin outbox',
+        'postgresql': [*OUTBOX_DDL['postgresql'], OUTBOX_INDEX],
+        'sqlite': [*OUTBOX_DDL['sqlite'], OUTBOX_INDEX],
+    },
+    {
+        'version': 10,
+        'name': 'archived order counters',
+        # الأرشفة من مثيل آخر تنتظر حتى تنتهي إعادة العد
+        'postgresql': ['LOCK TABLE orders_archive IN SHARE MODE', *REBUILD_ARCHIVED_COUNTERS],
+        'sqlite': REBUILD_ARCHIVED_COUNTERS,
+    },
+    {
+        'version': 11,
+        'name': 'national phone search keys',
+        'postgresql': POSTGRES_SEARCH_REBUILD,
+        'sqlite': SQLITE_SEARCH_REBUILD,
+    },
+]
+
+LATEST_VERSION = MIGRATIONS[-1]['version']
+
+# مفتاح قفل استشاري حتى لا ينفذ مثيلان الترحيلات معاً أثناء النشر
+MIGRATION_LOCK_ID = 7351001
+
+
+def _sql(engine, query):
+    return query.replace('%s', engine.placeholder)
+
+
+def current_version(engine):
+    """رقم آخر ترحيل مطبق (0 إذا لم يوجد جدول schema_version)"""
+    try:
+        with engine.cursor() as cursor:
+            cursor.execute('SELECT MAX(version) AS version FROM schema_version')
+            return cursor.fetchone()['version'] or 0
+    except Exception:
+        return 0
+
+
+def migrate(engine):
+    """تطبيق الترحيلات الناقصة؛ لا ينفذ أي DDL إذا كان المخطط محدثاً"""
+    version = current_version(engine)
+    if version >= LATEST_VERSION:
+        print(f"✅ Database schema up to date (v{version})")
+        return version
+
+    with engine.cursor() as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    for migration in MIGRATIONS:
+        with engine.cursor() as cursor:
+            if engine.dialect == 'postgresql':
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_ID,))
+            cursor.execute(_sql(engine, 'SELECT 1 FROM schema_version WHERE version = %s'),
+                           (migration['version'],))
+            if cursor.fetchone():
+                continue
+
+            for step in migration[engine.dialect]:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+
+            cursor.execute(_sql(engine, 'INSERT INTO schema_version (version, name) VALUES (%s, %s)'),
+                           (migration['version'], migration['name']))
+        print(f"✅ Applied migration v{migration['version']}: {migration['name']}")
+
+    return LATEST_VERSION
+
+
+# ================= QUERY PLAN CHECK =================
+# الاستعلامات الساخنة التي يجب أن تستخدم الفهارس أعلاه؛ النطاقات الزمنية داخل
+# الشهر الحالي لأن أقسامه موجودة دائماً (create_partitions)
+_today = datetime.now(timezone.utc).date()
+HOT_QUERIES = {
+    'orders by status': (
+        "SELECT * FROM orders WHERE merchant_id = 1 AND status = 'new' "
+        "ORDER BY created_at DESC, id DESC LIMIT 20"
+    ),
+    'orders keyset page': (
+        "SELECT * FROM orders WHERE merchant_id = 1 "
+        f"AND created_at >= '{_today.replace(day=1)}' AND created_at < '{add_months(_today, 1)}' "
+        f"AND created_at <= '{_today} 10:00:00' AND (created_at, id) < ('{_today} 10:00:00', 100) "
+        "ORDER BY created_at DESC, id DESC LIMIT 20"
+    ),
+    'orders by category': (
+        "SELECT * FROM orders WHERE merchant_id = 1 AND category = 'food' "
+        "ORDER BY created_at DESC LIMIT 20"
+    ),
+    'new orders count': "SELECT COUNT(*) FROM orders WHERE merchant_id = 1 AND status = 'new'",
+    'orders today (local day range)': (
+        "SELECT COUNT(*) FROM orders WHERE merchant_id = 1 "
+        f"AND created_at >= '{_today} 00:00:00' AND created_at < '{_today} 21:00:00'"
+    ),
+}
+
+
+# استعلامات بنطاق created_at صريح: في PostgreSQL يجب ألا تقرأ القسم الافتراضي
+PRUNED_QUERIES = ('orders keyset page', 'orders today (local day range)')
+
+
+def check_query_plans(engine):
+    """التحقق من أن الاستعلامات الساخنة تستخدم فهرساً؛ يرجع {الاسم: (يستخدم فهرساً, الخطة)}"""
+    results = {}
+    for name, query in HOT_QUERIES.items():
+        with engine.cursor() as cursor:
+            if engine.dialect == 'postgresql':
+                # الجداول الصغيرة تُقرأ تسلسلياً؛ نتحقق أن الفهرس قابل للاستخدام
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + query)
+                plan = '\n'.join(row['QUERY PLAN'] for row in cursor.fetchall())
+                uses_index = 'Index' in plan
+                if name in PRUNED_QUERIES:
+                    uses_index = uses_index and 'orders_default' not in plan
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query)
+                plan = '\n'.join(row['detail'] for row in cursor.fetchall())
+                uses_index = 'USING INDEX' in plan or 'USING COVERING INDEX' in plan
+        results[name] = (uses_index, plan)
+    return results
+
+
+if __name__ == '__main__':
+    from db_engine import DatabaseEngine
+    from search import register_sqlite_functions
+
+    engine = DatabaseEngine(sqlite_configure=register_sqlite_functions).open()
+    migrate(engine)
+    failed = False
+    for name, (uses_index, plan) in check_query_plans(engine).items():
+        print(f"{'✅' if uses_index else '❌'} {name}\n    {plan.replace(chr(10), chr(10) + '    ')}")
+        failed = failed or not uses_index
+    engine.close()
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,100 @@
+import asyncio
+import os
+
+from db_engine import pool_exhausted
+
+# ================= WRITER CONFIGURATION =================
+ORDER_BATCH_MAX = int(os.getenv("ORDER_BATCH_MAX", 50))
+ORDER_BATCH_WAIT = float(os.getenv("ORDER_BATCH_WAIT_MS", 10)) / 1000
+
+
+class OrderWriter:
+    """تجميع الطلبات المتزامنة في دفعات INSERT واحدة مع commit واحد لكل دفعة"""
+
+    def __init__(self, insert_batch, max_batch=ORDER_BATCH_MAX, max_wait=ORDER_BATCH_WAIT):
+        # insert_batch: دالة async تستقبل قائمة طلبات وترجع أرقامها بنفس الترتيب
+        self.insert_batch = insert_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = {'batches': 0, 'orders': 0, 'largest_batch': 0, 'failed_batches': 0}
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        """تشغيل حلقة الكتابة داخل حلقة الأحداث الحالية"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """كتابة ما تبقى في الطابور ثم الإيقاف"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, order_data):
+        """إضافة طلب إلى الدفعة التالية وانتظار رقمه"""
+        if self._task is None:
+            ids = await self.insert_batch([order_data])
+            return ids[0] if ids else None
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((order_data, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        orders = [order for order, _ in batch]
+        try:
+            ids = await self.insert_batch(orders)
+        except Exception as e:
+            print(f"❌ Batch insert of {len(batch)} orders failed: {e}")
+            self.stats['failed_batches'] += 1
+            # إعادة المحاولة طلباً طلباً حتى لا يُفشل طلب واحد سيئ الدفعة كلها؛
+            # إلا إذا كان المجمع ممتلئاً فكل محاولة ستنتظر المهلة نفسها
+            ids = [None] * len(orders) if pool_exhausted(e) else await self._insert_each(orders)
+
+        self.stats['batches'] += 1
+        self.stats['orders'] += len(batch)
+        self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+
+        for (_, future), order_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(order_id)
+
+    async def _insert_each(self, orders):
+        """كل طلب في INSERT خاص به؛ None مكان ما فشل"""
+        ids = []
+        for order in orders:
+            try:
+                ids.extend(await self.insert_batch([order]))
+            except Exception as e:
+                print(f"❌ Error saving order: {e}")
+                ids.append(None)
+        return ids
@@ -0,0 +1,364 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from queries import compile_sql, cursor_dialect
+from timezones import TIMESTAMP_FORMAT
+
+# ================= OUTBOX CONFIGURATION =================
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 20))
+# الصفوف المحجوزة لا يأخذها مرسل آخر قبل انتهاء هذه المدة (إذا توقف أثناء الإرسال)
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", 60))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", 5))
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", 600))
+# فوق هذا المعدل (طلب/دقيقة) تُجمع الإشعارات في رسائل ملخص كل OUTBOX_DIGEST_INTERVAL ثانية
+OUTBOX_DIGEST_RATE = float(os.getenv("OUTBOX_DIGEST_RATE", 12))
+OUTBOX_DIGEST_INTERVAL = float(os.getenv("OUTBOX_DIGEST_INTERVAL", 60))
+OUTBOX_DIGEST_MAX = int(os.getenv("OUTBOX_DIGEST_MAX", 500))
+
+# حد Telegram بوحدات UTF-16 (الإيموجي مثل 🍕 وحدتان)
+TELEGRAM_MESSAGE_LIMIT = 4096
+# مساحة محجوزة لترقيم الأجزاء "(12/34)"
+DIGEST_PART_RESERVE = 16
+
+# ================= ADMIN NOTIFICATION OUTBOX =================
+# إشعار الأدمن بطلب جديد يُكتب في admin_outbox داخل معاملة إدخال الطلب نفسها،
+# فيُرد على العميل فور الـ commit. مرسل في حلقة البوت يسحب الصفوف المستحقة
+# ويرسلها، ويعيد المحاولة بتأخير أُسي حتى تُسلّم، فلا يضيع إشعار بإعادة التشغيل.
+
+OUTBOX_DDL = {
+    'postgresql': [
+        '''
+        CREATE TABLE IF NOT EXISTS admin_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            order_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            delivered_at TIMESTAMP,
+            last_error TEXT
+        )
+        ''',
+    ],
+    'sqlite': [
+        '''
+        CREATE TABLE IF NOT EXISTS admin_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            order_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            delivered_at TIMESTAMP,
+            last_error TEXT
+        )
+        ''',
+    ],
+}
+
+OUTBOX_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_admin_outbox_pending
+    ON admin_outbox (next_attempt_at) WHERE delivered_at IS NULL
+'''
+
+OUTBOX_INSERT_SQL = 'INSERT INTO admin_outbox (chat_id, order_id) VALUES (%s, %s)'
+
+# حجز دفعة مستحقة بتأجيل موعدها مدة الحجز؛ SKIP LOCKED يمنع مثيلين من أخذ نفس الصف
+CLAIM_SQL = {
+    'postgresql': '''
+        UPDATE admin_outbox SET next_attempt_at = %s, attempts = attempts + 1
+        WHERE id IN (
+            SELECT id FROM admin_outbox
+            WHERE delivered_at IS NULL AND next_attempt_at <= %s
+            ORDER BY id LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, chat_id, order_id, attempts
+    ''',
+    'sqlite': '''
+        UPDATE admin_outbox SET next_attempt_at = %s, attempts = attempts + 1
+        WHERE id IN (
+            SELECT id FROM admin_outbox
+            WHERE delivered_at IS NULL AND next_attempt_at <= %s
+            ORDER BY id LIMIT %s
+        )
+        RETURNING id, chat_id, order_id, attempts
+    ''',
+}
+
+OUTBOX_ORDER_COLUMNS = ('id, category, product, customer_name, phone, address, quantity, size, language, '
+                        'status, created_at')
+
+
+def outbox_rows(orders, order_ids):
+    """صفوف admin_outbox للطلبات التي تطلب إشعاراً (notify_chat_id)"""
+    return [
+        (order['notify_chat_id'], order_id)
+        for order, order_id in zip(orders, order_ids)
+        if order_id is not None and order.get('notify_chat_id')
+    ]
+
+
+def enqueue_notifications(cursor, orders, order_ids):
+    """كتابة الإشعارات بنفس معاملة إدخال الطلبات"""
+    rows = outbox_rows(orders, order_ids)
+    if rows:
+        cursor.executemany(compile_sql(OUTBOX_INSERT_SQL, cursor_dialect(cursor)), rows)
+
+
+def utf16_len(text):
+    """طول النص كما يحسبه Telegram"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def truncate_utf16(text, limit):
+    """قص النص إلى limit وحدة UTF-16 دون كسر زوج بديل (surrogate pair)"""
+    data = text.encode('utf-16-le')
+    if len(data) <= limit * 2:
+        return text
+    return data[:limit * 2].decode('utf-16-le', errors='ignore')
+
+
+def split_digest(summary, entries, limit=TELEGRAM_MESSAGE_LIMIT):
+    """تقسيم الملخص على رسائل لا تتجاوز limit دون قطع سطر طلب
+
+    entries: [(outbox_id, سطر)]؛ يرجع [(نص، معرفات الصفوف في الرسالة)]. الملخص في
+    الرسالة الأولى، ولكل رسالة ترقيم (1/3) في أولها. الأطوال بوحدات UTF-16 وتُقاس
+    على النص النهائي (بيانات العميل تُهرب قبل الاستدعاء).
+    """
+    limit -= DIGEST_PART_RESERVE
+    summary = truncate_utf16(summary, limit)
+    parts, lines, ids, size = [], [summary], [], utf16_len(summary)
+    for outbox_id, line in entries:
+        line = truncate_utf16(line, limit)
+        length = utf16_len(line)
+        if ids and size + 1 + length > limit:
+            parts.append((lines, ids))
+            lines, ids, size = [], [], 0
+        lines.append(line)
+        ids.append(outbox_id)
+        size += 1 + length
+    parts.append((lines, ids))
+    if len(parts) == 1:
+        return [('\n'.join(parts[0][0]), parts[0][1])]
+    return [(f"({index}/{len(parts)})\n" + '\n'.join(lines), ids)
+            for index, (lines, ids) in enumerate(parts, 1)]
+
+
+def _utc(offset=0):
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset)).strftime(TIMESTAMP_FORMAT)
+
+
+class OutboxDispatcher:
+    """مهمة في حلقة البوت ترسل إشعارات admin_outbox مع إعادة المحاولة
+
+    تحت OUTBOX_DIGEST_RATE يُرسل كل طلب في رسالة؛ فوقه تُجمع الطلبات المستحقة لكل
+    محادثة في ملخص دوري، فيبقى عدد الرسائل شبه ثابت مهما زاد عدد الطلبات. العودة
+    للإرسال الفردي عند نزول المعدل تحت نصف الحد.
+    """
+
+    def __init__(self, engine, render, render_digest=None, interval=OUTBOX_POLL_INTERVAL,
+                 batch_size=OUTBOX_BATCH_SIZE, lease=OUTBOX_LEASE, retry_base=OUTBOX_RETRY_BASE,
+                 retry_max=OUTBOX_RETRY_MAX, digest_rate=OUTBOX_DIGEST_RATE,
+                 digest_interval=OUTBOX_DIGEST_INTERVAL, digest_max=OUTBOX_DIGEST_MAX):
+        self.engine = engine
+        # render(order) -> نص الإشعار
+        self.render = render
+        # render_digest(orders) -> (نص الملخص، سطر لكل طلب)؛ بدونه لا يُفعّل وضع الملخص
+        self.render_digest = render_digest
+        self.send = None
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lease = lease
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.digest_rate = digest_rate
+        self.digest_interval = digest_interval
+        self.digest_max = digest_max
+        self.stats = {'delivered': 0, 'failed_attempts': 0, 'skipped': 0, 'last_error': None,
+                      'mode': 'single', 'rate_per_minute': 0, 'digests': 0, 'digest_messages': 0}
+        # (وقت الحجز، عدد الصفوف) لحساب معدل الطلبات في آخر نافذة
+        self._claims = deque()
+        self._next_digest = 0
+        self._wakeup = None
+        self._task = None
+
+    def start(self, send):
+        """send(chat_id, text): coroutine الإرسال (يُحدد عند التشغيل لأنه يحتاج bot)"""
+        if self._task is None:
+            self.send = send
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """إرسال فوري بعد commit طلب جديد بدلاً من انتظار الدورة التالية"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                while await self.dispatch() >= self.batch_size:
+                    pass
+            except Exception as e:
+                self.stats['last_error'] = str(e).strip()[:200]
+                print(f"⚠️ Outbox dispatch failed: {self.stats['last_error']}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _sources(self):
+        # بعد العودة من SQLite قد تبقى إشعارات معلقة في القاعدة المحلية
+        sources = [self.engine.cursor]
+        if self.engine.local_pool is not None and not self.engine.degraded:
+            sources.append(self.engine.local_cursor)
+        return sources
+
+    def _claim(self, open_cursor, limit):
+        with open_cursor() as cursor:
+            dialect = cursor_dialect(cursor)
+            cursor.execute(compile_sql(CLAIM_SQL[dialect], dialect),
+                           (_utc(self.lease), _utc(), limit))
+            claimed = sorted(cursor.fetchall(), key=lambda row: row['id'])
+            if not claimed:
+                return [], {}
+            order_ids = list({row['order_id'] for row in claimed})
+            cursor.execute(compile_sql(
+                f"SELECT {OUTBOX_ORDER_COLUMNS} FROM orders WHERE id IN ({', '.join(['%s'] * len(order_ids))})",
+                dialect), order_ids)
+            return claimed, {order['id']: order for order in cursor.fetchall()}
+
+    def _complete(self, open_cursor, delivered, failed):
+        with open_cursor() as cursor:
+            dialect = cursor_dialect(cursor)
+            if delivered:
+                cursor.executemany(compile_sql('UPDATE admin_outbox SET delivered_at = %s WHERE id = %s', dialect),
+                                   [(_utc(), outbox_id) for outbox_id in delivered])
+            if failed:
+                cursor.executemany(compile_sql(
+                    'UPDATE admin_outbox SET next_attempt_at = %s, last_error = %s WHERE id = %s', dialect
+                ), failed)
+
+    def retry_delay(self, attempts):
+        return min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+
+    @property
+    def digest_mode(self):
+        return self.stats['mode'] == 'digest'
+
+    def _update_mode(self, now):
+        """معدل الطلبات في نافذة بطول دورتي ملخص، مع فارق بين حدي الدخول والخروج"""
+        window = 2 * self.digest_interval
+        while self._claims and self._claims[0][0] < now - window:
+            self._claims.popleft()
+        rate = sum(count for _, count in self._claims) * 60 / window
+        self.stats['rate_per_minute'] = round(rate, 1)
+        if self.render_digest is None:
+            return
+        if not self.digest_mode and rate >= self.digest_rate:
+            self.stats['mode'] = 'digest'
+            self._next_digest = now + self.digest_interval
+            print(f"ℹ️ Admin notifications switched to digests ({rate:.0f} orders/min)")
+        elif self.digest_mode and rate < self.digest_rate / 2:
+            self.stats['mode'] = 'single'
+            print(f"ℹ️ Admin notifications switched back to one message per order ({rate:.0f} orders/min)")
+
+    def _failed(self, row, error):
+        self.stats['failed_attempts'] += 1
+        self.stats['last_error'] = error
+        return (_utc(self.retry_delay(row['attempts'])), error, row['id'])
+
+    async def _send_each(self, claimed, orders):
+        delivered, failed = [], []
+        for row in claimed:
+            try:
+                await self.send(row['chat_id'], self.render(orders[row['order_id']]))
+                delivered.append(row['id'])
+                self.stats['delivered'] += 1
+            except Exception as e:
+                error = str(e).strip()[:200]
+                failed.append(self._failed(row, error))
+                print(f"⚠️ Admin notification for order #{row['order_id']} failed "
+                      f"(attempt {row['attempts']}): {error}")
+        return delivered, failed
+
+    async def _send_digests(self, claimed, orders):
+        """ملخص واحد (مقسم عند حد الرسالة) لكل محادثة"""
+        by_chat = {}
+        for row in claimed:
+            by_chat.setdefault(row['chat_id'], []).append(row)
+
+        delivered, failed = [], []
+        for chat_id, rows in by_chat.items():
+            if len(rows) == 1:
+                sent, errors = await self._send_each(rows, orders)
+                delivered += sent
+                failed += errors
+                continue
+
+            summary, lines = self.render_digest([orders[row['order_id']] for row in rows])
+            rows_by_id = {row['id']: row for row in rows}
+            for text, ids in split_digest(summary, [(row['id'], line) for row, line in zip(rows, lines)]):
+                try:
+                    await self.send(chat_id, text)
+                    delivered += ids
+                    self.stats['delivered'] += len(ids)
+                    self.stats['digest_messages'] += 1
+                except Exception as e:
+                    error = str(e).strip()[:200]
+                    failed += [self._failed(rows_by_id[outbox_id], error) for outbox_id in ids]
+                    print(f"⚠️ Admin digest of {len(ids)} orders failed: {error}")
+            self.stats['digests'] += 1
+        return delivered, failed
+
+    async def dispatch(self):
+        """دورة واحدة لكل مصدر؛ يرجع عدد الصفوف التي حُجزت"""
+        now = time.monotonic()
+        self._update_mode(now)
+        if self.digest_mode and now < self._next_digest:
+            return 0
+        limit = self.digest_max if self.digest_mode else self.batch_size
+
+        total = 0
+        for open_cursor in self._sources():
+            claimed, orders = await asyncio.to_thread(self._claim, open_cursor, limit)
+            total += len(claimed)
+            self._claims.append((now, len(claimed)))
+
+            # الطلب حُذف قبل الإرسال
+            skipped = [row['id'] for row in claimed if row['order_id'] not in orders]
+            self.stats['skipped'] += len(skipped)
+            claimed = [row for row in claimed if row['order_id'] in orders]
+
+            if self.digest_mode:
+                delivered, failed = await self._send_digests(claimed, orders)
+            else:
+                delivered, failed = await self._send_each(claimed, orders)
+            delivered += skipped
+            if delivered or failed:
+                await asyncio.to_thread(self._complete, open_cursor, delivered, failed)
+
+        if self.digest_mode and total < limit:
+            self._next_digest = now + self.digest_interval
+        return total
+
+    def pending(self):
+        """عدد الإشعارات التي لم تُسلّم بعد"""
+        with self.engine.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) AS count FROM admin_outbox WHERE delivered_at IS NULL')
+            return cursor.fetchone()['count']
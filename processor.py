@@ -0,0 +1,116 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# ================= UPDATE PROCESSING CONFIGURATION =================
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))
+# حد التحديثات المعلقة كلها (قيد التنفيذ + المنتظرة في طوابير المحادثات)
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", 256))
+# متوسط متحرك للتأخير: وزن آخر تحديث
+LAG_SMOOTHING = 0.1
+
+# ================= PER-CHAT UPDATE PROCESSOR =================
+# التحديثات تُعالج بالتوازي على UPDATE_WORKERS عامل، لكن تحديثات المحادثة الواحدة
+# بالتتابع وبترتيب وصولها: رسالتان من نفس العميل لا تتسابقان على خطوات الطلب في
+# user_data، وكتابة بطيئة لعميل لا تؤخر غيره. التحديث ينتظر دور محادثته أولاً ثم
+# عاملاً حراً، فلا تحجز محادثة مزدحمة كل العمال وهي تنتظر نفسها.
+
+
+class ChatLane:
+    """طابور محادثة واحدة: قفل FIFO وأوقات وصول التحديثات المنتظرة"""
+
+    __slots__ = ('lock', 'arrivals')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.arrivals = deque()
+
+
+def chat_key(update):
+    """مفتاح الترتيب: المحادثة، أو المستخدم إذا لم تكن هناك محادثة (inline)"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """معالجة متوازية بين المحادثات ومتتابعة داخل كل محادثة"""
+
+    def __init__(self, workers=UPDATE_WORKERS, max_pending=UPDATE_MAX_PENDING):
+        super().__init__(max_concurrent_updates=max(workers, max_pending))
+        self.workers = workers
+        self._workers = None
+        self._lanes = {}
+        self._running = 0
+        self.stats = {'processed': 0, 'errors': 0, 'max_lag_ms': 0, 'avg_lag_ms': 0}
+
+    async def initialize(self):
+        if self._workers is None:
+            self._workers = asyncio.Semaphore(self.workers)
+
+    async def shutdown(self):
+        pass
+
+    async def do_process_update(self, update, coroutine):
+        key = chat_key(update)
+        if key is None:
+            await self._run(coroutine, time.monotonic())
+            return
+
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = ChatLane()
+        arrived = time.monotonic()
+        lane.arrivals.append(arrived)
+        try:
+            async with lane.lock:
+                lane.arrivals.popleft()
+                await self._run(coroutine, arrived)
+        finally:
+            if not lane.arrivals and not lane.lock.locked():
+                self._lanes.pop(key, None)
+
+    async def _run(self, coroutine, arrived):
+        async with self._workers:
+            lag_ms = (time.monotonic() - arrived) * 1000
+            self.stats['max_lag_ms'] = max(self.stats['max_lag_ms'], round(lag_ms))
+            self.stats['avg_lag_ms'] = round(
+                self.stats['avg_lag_ms'] + LAG_SMOOTHING * (lag_ms - self.stats['avg_lag_ms']), 1)
+            self._running += 1
+            try:
+                await coroutine
+                self.stats['processed'] += 1
+            except Exception:
+                # Application يعالج أخطاء المعالجات بنفسه؛ هذا لما يفلت منه فقط
+                self.stats['errors'] += 1
+                raise
+            finally:
+                self._running -= 1
+
+    def info(self, top=5):
+        """حالة الطوابير: المحادثات الأطول انتظاراً وعمر أقدم تحديث فيها"""
+        now = time.monotonic()
+        # يُستدعى من خيط Flask؛ نسخ قبل المرور لأن حلقة البوت تعدل الطوابير
+        waiting = []
+        for key, lane in list(self._lanes.items()):
+            arrivals = list(lane.arrivals)
+            if arrivals:
+                waiting.append((key, len(arrivals), round((now - arrivals[0]) * 1000)))
+        waiting.sort(key=lambda item: -item[2])
+        return {
+            **self.stats,
+            'workers': self.workers,
+            'running': self._running,
+            'chats': len(self._lanes),
+            'queued': sum(queued for _, queued, _ in waiting),
+            'lagging_chats': [{'chat_id': key, 'queued': queued, 'oldest_ms': lag}
+                              for key, queued, lag in waiting[:top]],
+        }
@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+import time
+
+from counters import COUNTER_STATS_SQL
+
+# ================= QUERY REGISTRY =================
+# الاستعلامات الثابتة تُسجل باسمها مرة واحدة وتُترجم لكل لهجة عند التسجيل.
+# على PostgreSQL تُنفذ كـ prepared statements على الخادم (prepare=True) فلا
+# يُعاد تحليلها وتخطيطها في كل استدعاء.
+
+
+def compile_sql(query, dialect):
+    """تحويل العلامات %s إلى ? لـ SQLite"""
+    return query if dialect == 'postgresql' else query.replace('%s', '?')
+
+
+def cursor_dialect(cursor):
+    """لهجة المؤشر نفسه (لا المحرك) حتى يبقى صحيحاً أثناء تبديل المجمع"""
+    return 'sqlite' if isinstance(cursor, sqlite3.Cursor) else 'postgresql'
+
+
+class QueryRegistry:
+    """سجل الاستعلامات المسماة مع عدد الاستدعاءات وزمنها لكل استعلام"""
+
+    def __init__(self):
+        self._queries = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, query):
+        """query: نص واحد بعلامات %s أو قاموس {اللهجة: النص} عند اختلاف الصياغة"""
+        if isinstance(query, str):
+            query = {'postgresql': query, 'sqlite': query}
+        self._queries[name] = {dialect: compile_sql(sql, dialect) for dialect, sql in query.items()}
+        self._stats[name] = {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+    def sql(self, name, dialect):
+        return self._queries[name][dialect]
+
+    def _record(self, name, started, failed):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self._stats[name]
+            stats['calls'] += 1
+            stats['errors'] += failed
+            stats['total_ms'] += elapsed
+            stats['max_ms'] = max(stats['max_ms'], elapsed)
+
+    def execute(self, cursor, name, params=()):
+        """تنفيذ استعلام مسمى على مؤشر متزامن"""
+        dialect = cursor_dialect(cursor)
+        query = self._queries[name][dialect]
+        started = time.perf_counter()
+        failed = True
+        try:
+            if dialect == 'postgresql':
+                cursor.execute(query, params, prepare=True)
+            else:
+                cursor.execute(query, params)
+            failed = False
+        finally:
+            self._record(name, started, failed)
+        return cursor
+
+    async def execute_async(self, cursor, name, params=()):
+        """تنفيذ استعلام مسمى على مؤشر psycopg غير متزامن"""
+        started = time.perf_counter()
+        failed = True
+        try:
+            await cursor.execute(self._queries[name]['postgresql'], params, prepare=True)
+            failed = False
+        finally:
+            self._record(name, started, failed)
+        return cursor
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'avg_ms': round(stats['total_ms'] / stats['calls'], 3) if stats['calls'] else None,
+                    'max_ms': round(stats['max_ms'], 3),
+                }
+                for name, stats in self._stats.items()
+            }
+
+
+QUERIES = QueryRegistry()
+
+# ===== الطلبات =====
+QUERIES.register('insert_order', '''
+    INSERT INTO orders
+    (category, product, customer_name, phone, address, quantity, size, language, merchant_id)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    RETURNING id
+''')
+
+QUERIES.register('orders_by_merchant', '''
+    SELECT * FROM orders
+    WHERE merchant_id = %s
+    ORDER BY created_at DESC
+    LIMIT %s
+''')
+
+QUERIES.register('get_order', 'SELECT * FROM orders WHERE id = %s AND merchant_id = %s')
+
+QUERIES.register('update_order_status', '''
+    UPDATE orders
+    SET status = %s
+    WHERE id = %s AND merchant_id = %s
+''')
+
+QUERIES.register('delete_order', 'DELETE FROM orders WHERE id = %s AND merchant_id = %s')
+
+# ===== التجار =====
+QUERIES.register('get_merchant', 'SELECT * FROM merchants WHERE id = %s')
+
+# ===== الإحصائيات =====
+QUERIES.register('order_stats', COUNTER_STATS_SQL)
+
+# نطاق [بداية، نهاية) بتوقيت UTC محسوب من يوم التاجر المحلي (timezones.day_range)
+QUERIES.register('orders_in_range', '''
+    SELECT COUNT(*) AS count FROM orders
+    WHERE merchant_id = %s AND created_at >= %s AND created_at < %s
+''')
+
+# ===== التقارير (من جداول rollups) =====
+QUERIES.register('rollup_daily_totals', '''
+    SELECT
+        day AS date,
+        SUM(count) AS total_orders,
+        SUM(CASE WHEN value = 'completed' THEN count ELSE 0 END) AS completed_orders
+    FROM order_rollups_daily
+    WHERE merchant_id = %s AND dimension = 'status' AND day >= %s
+    GROUP BY day
+    ORDER BY day
+''')
+
+QUERIES.register('rollup_top_values', '''
+    SELECT value, SUM(count) AS count
+    FROM order_rollups_daily
+    WHERE merchant_id = %s AND dimension = %s AND day >= %s
+    GROUP BY value
+    ORDER BY count DESC
+    LIMIT %s
+''')
@@ -0,0 +1,347 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from queries import QUERIES, compile_sql
+from timezones import TIMESTAMP_FORMAT, date_range, local_date, local_today
+
+# ================= ROLLUP CONFIGURATION =================
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", 60))
+# التقارير تطوي التغييرات بنفسها فقط إذا مر هذا الوقت منذ آخر تحديث
+ROLLUP_MAX_AGE = float(os.getenv("ROLLUP_MAX_AGE", 30))
+ROLLUP_LOCK_ID = 7351002
+ROLLUP_DIMENSIONS = ('status', 'category', 'product')
+
+# ================= ORDER ROLLUPS =================
+# مشغلات على orders تسجل الساعات التي تغيرت في order_rollup_dirty. المهمة تحجز
+# صفوف السجل بـ DELETE ... RETURNING في أول المعاملة، تعيد حساب تلك الساعات فقط من
+# الطلبات (نطاق على created_at)، ثم الأيام المحلية التي تحويها من الجداول الساعية.
+# صف يُكتب بعد الحجز يبقى للدورة التالية (ترتيب id في PostgreSQL ليس ترتيب الـ commit،
+# فلا تصلح علامة مائية). التقارير تقرأ الجداول المجمعة فقط.
+# اليوم المحلي في منطقة فرقها ليس ساعات كاملة (طهران +03:30، الهند +05:30) لا يتكون من
+# ساعات UTC كاملة، فيُحسب مباشرة من الطلبات بنطاقه الدقيق بدلاً من جمع الساعات.
+
+ROLLUP_TABLES = {
+    'postgresql': [
+        '''
+        CREATE TABLE IF NOT EXISTS order_rollup_dirty (
+            id BIGSERIAL PRIMARY KEY,
+            merchant_id INTEGER NOT NULL,
+            hour TIMESTAMP NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS order_rollups_hourly (
+            merchant_id INTEGER NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            dimension VARCHAR(20) NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (merchant_id, bucket, dimension, value)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS order_rollups_daily (
+            merchant_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            dimension VARCHAR(20) NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (merchant_id, day, dimension, value)
+        )
+        ''',
+    ],
+    'sqlite': [
+        '''
+        CREATE TABLE IF NOT EXISTS order_rollup_dirty (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            merchant_id INTEGER NOT NULL,
+            hour TIMESTAMP NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS order_rollups_hourly (
+            merchant_id INTEGER NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (merchant_id, bucket, dimension, value)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS order_rollups_daily (
+            merchant_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (merchant_id, day, dimension, value)
+        )
+        ''',
+    ],
+}
+
+# أكثر الفئات/المنتجات خلال فترة: (merchant_id, dimension, day)
+ROLLUP_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_order_rollups_daily_dimension
+    ON order_rollups_daily (merchant_id, dimension, day)
+'''
+
+
+def _pg_dirty_function(name, tables):
+    inserts = '\n'.join(
+        f"INSERT INTO order_rollup_dirty (merchant_id, hour) "
+        f"SELECT DISTINCT merchant_id, date_trunc('hour', created_at) FROM {table};"
+        for table in tables
+    )
+    return f'''
+        CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            {inserts}
+            RETURN NULL;
+        END
+        $$
+    '''
+
+
+POSTGRES_ROLLUP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS orders_rollup_insert ON orders',
+    'DROP TRIGGER IF EXISTS orders_rollup_update ON orders',
+    'DROP TRIGGER IF EXISTS orders_rollup_delete ON orders',
+    '''
+        CREATE TRIGGER orders_rollup_insert AFTER INSERT ON orders
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION orderly_rollup_insert()
+    ''',
+    '''
+        CREATE TRIGGER orders_rollup_update AFTER UPDATE ON orders
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION orderly_rollup_update()
+    ''',
+    '''
+        CREATE TRIGGER orders_rollup_delete AFTER DELETE ON orders
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION orderly_rollup_delete()
+    ''',
+]
+
+POSTGRES_ROLLUP_DDL = [
+    *ROLLUP_TABLES['postgresql'],
+    ROLLUP_INDEX,
+    _pg_dirty_function('orderly_rollup_insert', ['new_rows']),
+    _pg_dirty_function('orderly_rollup_update', ['old_rows', 'new_rows']),
+    _pg_dirty_function('orderly_rollup_delete', ['old_rows']),
+    *POSTGRES_ROLLUP_TRIGGERS,
+    # كل الساعات الموجودة تُحسب في أول تشغيل
+    '''
+        INSERT INTO order_rollup_dirty (merchant_id, hour)
+        SELECT DISTINCT merchant_id, date_trunc('hour', created_at) FROM orders
+    ''',
+]
+
+
+def _sqlite_dirty(row):
+    return (f"INSERT INTO order_rollup_dirty (merchant_id, hour) "
+            f"VALUES ({row}.merchant_id, strftime('%Y-%m-%d %H:00:00', {row}.created_at));")
+
+
+SQLITE_ROLLUP_DDL = [
+    *ROLLUP_TABLES['sqlite'],
+    ROLLUP_INDEX,
+    f'''
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_insert AFTER INSERT ON orders BEGIN
+            {_sqlite_dirty('new')}
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_update
+        AFTER UPDATE OF status, category, product, merchant_id, created_at ON orders BEGIN
+            {_sqlite_dirty('old')}
+            {_sqlite_dirty('new')}
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_delete AFTER DELETE ON orders BEGIN
+            {_sqlite_dirty('old')}
+        END
+    ''',
+    '''
+        INSERT INTO order_rollup_dirty (merchant_id, hour)
+        SELECT DISTINCT merchant_id, strftime('%Y-%m-%d %H:00:00', created_at) FROM orders
+    ''',
+]
+
+# القيمة الثابتة في SELECT تحتاج تحويل نوع صريح في PostgreSQL (لا يستنتجها من العمود)
+_CASTS = {
+    'postgresql': {'timestamp': '%s::timestamp', 'date': '%s::date'},
+    'sqlite': {'timestamp': '?', 'date': '?'},
+}
+
+
+def rebuild_hour_sql(dialect):
+    """إعادة حساب ساعة واحدة من الطلبات والأرشيف: (bucket, merchant_id, start, end) لكل بُعد"""
+    casts = _CASTS[dialect]
+    return compile_sql(
+        'INSERT INTO order_rollups_hourly (merchant_id, bucket, dimension, value, count) '
+        + ' UNION ALL '.join(
+            f"SELECT merchant_id, {casts['timestamp']}, '{dimension}', {dimension}, COUNT(*) FROM orders_all "
+            f"WHERE merchant_id = %s AND created_at >= %s AND created_at < %s GROUP BY merchant_id, {dimension}"
+            for dimension in ROLLUP_DIMENSIONS
+        ),
+        dialect,
+    )
+
+
+def rebuild_day_sql(dialect):
+    """إعادة حساب يوم محلي من الجداول الساعية: (day, merchant_id, start, end)"""
+    return compile_sql(f'''
+        INSERT INTO order_rollups_daily (merchant_id, day, dimension, value, count)
+        SELECT merchant_id, {_CASTS[dialect]['date']}, dimension, value, SUM(count) FROM order_rollups_hourly
+        WHERE merchant_id = %s AND bucket >= %s AND bucket < %s
+        GROUP BY merchant_id, dimension, value
+    ''', dialect)
+
+
+def rebuild_day_from_orders_sql(dialect):
+    """إعادة حساب يوم محلي حدوده ليست على ساعة كاملة من الطلبات: (day, merchant_id, start, end) لكل بُعد"""
+    casts = _CASTS[dialect]
+    return compile_sql(
+        'INSERT INTO order_rollups_daily (merchant_id, day, dimension, value, count) '
+        + ' UNION ALL '.join(
+            f"SELECT merchant_id, {casts['date']}, '{dimension}', {dimension}, COUNT(*) FROM orders_all "
+            f"WHERE merchant_id = %s AND created_at >= %s AND created_at < %s GROUP BY merchant_id, {dimension}"
+            for dimension in ROLLUP_DIMENSIONS
+        ),
+        dialect,
+    )
+
+
+def whole_hours(start, end):
+    """هل حدود اليوم (UTC) على بداية ساعة فيكفي جمع الساعات؟"""
+    return start.endswith(':00:00') and end.endswith(':00:00')
+
+
+class OrderRollups:
+    """تجميعات ساعية ويومية للطلبات تُحدّث تدريجياً بعلامة مائية"""
+
+    def __init__(self, engine, timezones, interval=ROLLUP_INTERVAL, max_age=ROLLUP_MAX_AGE):
+        self.engine = engine
+        self.timezones = timezones
+        self.interval = interval
+        self.max_age = max_age
+        self.stats = {'runs': 0, 'hours': 0, 'days': 0, 'claimed': 0, 'last_run': None}
+        self._lock = threading.Lock()
+        self._refreshed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sql(self, query):
+        return compile_sql(query, self.engine.dialect)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='order-rollups', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Rollup refresh failed: {e}")
+
+    def refresh(self):
+        """طي التغييرات المسجلة حتى الآن؛ يرجع عدد الساعات المعاد حسابها"""
+        with self._lock:
+            return self._refresh()
+
+    def refresh_if_stale(self):
+        """للتقارير: تحديث فقط إذا تجاوز عمر التجميعات max_age ولم يكن تحديث آخر جارياً"""
+        if time.monotonic() - self._refreshed < self.max_age:
+            return 0
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            return self._refresh()
+        finally:
+            self._lock.release()
+
+    def _refresh(self):
+        # المناطق الزمنية تُقرأ قبل فتح المعاملة (قد تحتاج اتصالاً آخر)
+        with self.engine.cursor() as cursor:
+            cursor.execute('SELECT DISTINCT merchant_id FROM order_rollup_dirty')
+            merchant_ids = [row['merchant_id'] for row in cursor.fetchall()]
+        if not merchant_ids:
+            self._refreshed = time.monotonic()
+            return 0
+        zones = {merchant_id: self.timezones.get(merchant_id) for merchant_id in merchant_ids}
+
+        with self.engine.cursor() as cursor:
+            if self.engine.dialect == 'postgresql':
+                cursor.execute('SELECT pg_try_advisory_xact_lock(%s) AS locked', (ROLLUP_LOCK_ID,))
+                if not cursor.fetchone()['locked']:
+                    return 0
+
+            # الحجز والطي في نفس المعاملة: إذا فشل الطي تعود الصفوف مع الـ rollback
+            cursor.execute('DELETE FROM order_rollup_dirty RETURNING merchant_id, hour')
+            claimed = cursor.fetchall()
+            hours = {(row['merchant_id'], row['hour']) for row in claimed}
+
+            days = set()
+            for merchant_id, hour in sorted(hours):
+                if merchant_id not in zones:
+                    # تاجر ظهر بعد قراءة المناطق
+                    zones[merchant_id] = self.timezones.get(merchant_id)
+                if isinstance(hour, str):
+                    hour = datetime.strptime(hour, TIMESTAMP_FORMAT)
+                start = hour.strftime(TIMESTAMP_FORMAT)
+                end = (hour + timedelta(hours=1)).strftime(TIMESTAMP_FORMAT)
+                cursor.execute(self._sql('DELETE FROM order_rollups_hourly WHERE merchant_id = %s AND bucket = %s'),
+                               (merchant_id, start))
+                cursor.execute(rebuild_hour_sql(self.engine.dialect),
+                               [start, merchant_id, start, end] * len(ROLLUP_DIMENSIONS))
+                # ساعة UTC قد تقع على يومين محليين في منطقة بفرق نصف ساعة
+                days.add((merchant_id, local_date(zones[merchant_id], hour)))
+                days.add((merchant_id, local_date(zones[merchant_id], hour + timedelta(minutes=59))))
+
+            for merchant_id, day in days:
+                start, end = date_range(zones[merchant_id], day, day)
+                cursor.execute(self._sql('DELETE FROM order_rollups_daily WHERE merchant_id = %s AND day = %s'),
+                               (merchant_id, day.isoformat()))
+                if whole_hours(start, end):
+                    cursor.execute(rebuild_day_sql(self.engine.dialect), (day.isoformat(), merchant_id, start, end))
+                else:
+                    cursor.execute(rebuild_day_from_orders_sql(self.engine.dialect),
+                                   [day.isoformat(), merchant_id, start, end] * len(ROLLUP_DIMENSIONS))
+
+        self._refreshed = time.monotonic()
+        self.stats['runs'] += 1
+        self.stats['hours'] += len(hours)
+        self.stats['days'] += len(days)
+        self.stats['claimed'] += len(claimed)
+        self.stats['last_run'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        return len(hours)
+
+    # ===== READS =====
+
+    def _since(self, merchant_id, days):
+        return (local_today(self.timezones.get(merchant_id)) - timedelta(days=days - 1)).isoformat()
+
+    def daily(self, merchant_id, days=7):
+        """[{date, total_orders, completed_orders}] لآخر days أيام محلية"""
+        since = self._since(merchant_id, days)
+        with self.engine.cursor() as cursor:
+            QUERIES.execute(cursor, 'rollup_daily_totals', (merchant_id, since))
+            return cursor.fetchall()
+
+    def top(self, merchant_id, dimension, days=30, limit=10):
+        """[{value, count}] لأكثر قيم البعد خلال آخر days أيام"""
+        since = self._since(merchant_id, days)
+        with self.engine.cursor() as cursor:
+            QUERIES.execute(cursor, 'rollup_top_values', (merchant_id, dimension, since, limit))
+            return cursor.fetchall()
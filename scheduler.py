@@ -0,0 +1,217 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import timedelta
+
+import telegram.error
+from telegram.ext import BaseRateLimiter
+
+# ================= SEND SCHEDULER CONFIGURATION =================
+# حدود Telegram: ~30 رسالة/ثانية للبوت كله، ~1/ثانية لكل محادثة، 20/دقيقة للمجموعات
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 30))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 1))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", 3))
+SEND_GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", 20 / 60))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))
+
+# ================= OUTBOUND SEND SCHEDULER =================
+# كل طلب من ExtBot موجه لمحادثة (send_message، reply_text، edit_message_text...) يمر
+# عبر BaseRateLimiter: ينتظر في طابور حسب أولويته حتى يتوفر رمز في دلو المحادثة
+# والدلو العام، ثم يُرسل. عند RetryAfter يتوقف الإرسال كله المدة المطلوبة ويعود
+# الطلب إلى مكانه في الطابور. الطلبات بدون chat_id (getUpdates، answerCallbackQuery،
+# set_webhook) تمر مباشرة.
+
+# الأولوية عبر rate_limit_args={'priority': ...}؛ الافتراضي رد على العميل
+PRIORITIES = ('customer', 'admin', 'report')
+ADMIN_PRIORITY = {'priority': 'admin'}
+REPORT_PRIORITY = {'priority': 'report'}
+
+
+class TokenBucket:
+    """دلو رموز: rate رمز في الثانية بسعة capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """الثواني حتى يتوفر رمز (0 إذا كان متوفراً)"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class PendingSend:
+    __slots__ = ('chat_id', 'future', 'queued_at')
+
+    def __init__(self, chat_id, future):
+        self.chat_id = chat_id
+        self.future = future
+        self.queued_at = time.monotonic()
+
+
+class SendScheduler(BaseRateLimiter):
+    """جدولة الطلبات الصادرة إلى Bot API بدلاء رموز وأولويات"""
+
+    def __init__(self, global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST,
+                 group_rate=SEND_GROUP_RATE, max_retries=SEND_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.stats = {'sent': 0, 'retry_after': 0, 'failed': 0, 'max_depth': 0, 'max_wait_ms': 0,
+                      'paused_until': None}
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._buckets = {}
+        self._paused_until = 0
+        self._wakeup = None
+        self._task = None
+
+    async def initialize(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # ما بقي في الطابور يُرسل مباشرة بدلاً من أن يعلق
+        for queue in self._queues.values():
+            while queue:
+                pending = queue.popleft()
+                if not pending.future.done():
+                    pending.future.set_result(None)
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def depth(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    # ===== الطابور =====
+
+    async def _turn(self, chat_id, priority, front=False):
+        """انتظار دور الطلب؛ front يعيده إلى مقدمة طابوره بعد RetryAfter"""
+        pending = PendingSend(chat_id, asyncio.get_running_loop().create_future())
+        queue = self._queues[priority]
+        if front:
+            queue.appendleft(pending)
+        else:
+            queue.append(pending)
+        self.stats['max_depth'] = max(self.stats['max_depth'], self.depth())
+        self._wakeup.set()
+        try:
+            await pending.future
+        except asyncio.CancelledError:
+            if pending in queue:
+                queue.remove(pending)
+            raise
+
+    def _next(self, now):
+        """أول طلب بأعلى أولوية تسمح محادثته بالإرسال؛ وإلا مدة الانتظار حتى يتغير ذلك"""
+        wait = self.global_bucket.wait_time(now)
+        if wait:
+            return None, wait
+        wait = None
+        for queue in self._queues.values():
+            for pending in queue:
+                if pending.future.done():
+                    continue
+                chat_wait = self._bucket(pending.chat_id).wait_time(now)
+                if not chat_wait:
+                    queue.remove(pending)
+                    return pending, 0
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+        return None, wait
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            pending, wait = self._next(now)
+            if pending is not None:
+                self.global_bucket.take(now)
+                self._bucket(pending.chat_id).take(now)
+                waited_ms = round((now - pending.queued_at) * 1000)
+                self.stats['max_wait_ms'] = max(self.stats['max_wait_ms'], waited_ms)
+                pending.future.set_result(None)
+                continue
+
+            self._wakeup.clear()
+            if not wait:
+                # الدلاء الممتلئة لمحادثات لم تعد ترسل لا حاجة لها
+                self._buckets = {chat_id: bucket for chat_id, bucket in self._buckets.items()
+                                 if not bucket.idle(now)}
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    # ===== BaseRateLimiter =====
+
+    def _pause(self, error):
+        retry_after = error.retry_after
+        if isinstance(retry_after, timedelta):
+            retry_after = retry_after.total_seconds()
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self.stats['retry_after'] += 1
+        self.stats['paused_until'] = time.strftime('%H:%M:%S', time.localtime(time.time() + retry_after))
+        print(f"⚠️ Telegram flood control: pausing sends for {retry_after:.0f}s")
+        self._wakeup.set()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None or self._task is None:
+            return await callback(*args, **kwargs)
+
+        priority = (rate_limit_args or {}).get('priority', 'customer')
+        if priority not in self._queues:
+            priority = 'customer'
+
+        for attempt in range(self.max_retries + 1):
+            await self._turn(chat_id, priority, front=attempt > 0)
+            try:
+                result = await callback(*args, **kwargs)
+                self.stats['sent'] += 1
+                return result
+            except telegram.error.RetryAfter as e:
+                self._pause(e)
+                if attempt == self.max_retries:
+                    self.stats['failed'] += 1
+                    raise
+
+    def info(self):
+        return {**self.stats, 'queued': {priority: len(queue) for priority, queue in self._queues.items()},
+                'depth': self.depth(), 'chats': len(self._buckets)}
@@ -0,0 +1,147 @@
+import re
+
+# ================= ARABIC NORMALIZATION =================
+# نفس جداول التحويل تُستخدم في Python (SQLite) وفي دالة PostgreSQL
+# حتى تتطابق مفاتيح البحث المخزنة مع النص المبحوث عنه
+
+# التشكيل والتطويل تُحذف
+ARABIC_MARKS = ''.join(chr(c) for c in range(0x064B, 0x0653)) + 'ٰـ'
+
+# أشكال الألف والياء والتاء المربوطة والأرقام العربية/الفارسية
+ARABIC_FOLD = {
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ة': 'ه',
+    'ؤ': 'و',
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+    **{chr(0x06F0 + d): str(d) for d in range(10)},
+}
+
+_FOLD_TABLE = str.maketrans({**ARABIC_FOLD, **{mark: None for mark in ARABIC_MARKS}})
+_NON_DIGITS = re.compile(r'[^0-9]')
+_PHONE_TERM = re.compile(r'^[0-9\s+\-()]+$')
+
+# مفتاح الهاتف بالصيغة الوطنية: بدون 00/+ ورمز الدولة (فلسطين 970 و 972) وبدون الصفر
+# الأول، فـ 0599123456 و +970599123456 و 00970 599-123-456 كلها 599123456.
+# نفس التعبير يُستخدم في Python وفي دالة PostgreSQL.
+PHONE_PREFIX_PATTERN = '^(?:00)?(?:970|972)(?=[0-9]{7})'
+_PHONE_PREFIX = re.compile(PHONE_PREFIX_PATTERN)
+
+
+def normalize_text(text):
+    """توحيد النص العربي للبحث: حذف التشكيل وتوحيد الألف/الياء والأرقام"""
+    return (text or '').translate(_FOLD_TABLE).lower()
+
+
+def normalize_phone(phone):
+    """أرقام الهاتف فقط بعد توحيد الأرقام العربية"""
+    return _NON_DIGITS.sub('', normalize_text(phone))
+
+
+def phone_key(phone):
+    """رقم الهاتف بالصيغة الوطنية الموحدة للبحث"""
+    return _PHONE_PREFIX.sub('', normalize_phone(phone), count=1).lstrip('0')
+
+
+def search_key(customer_name, product, phone):
+    """مفتاح البحث المخزن لكل طلب (الاسم + المنتج + الهاتف بالصيغة الوطنية)"""
+    return f"{normalize_text(customer_name)} {normalize_text(product)} {phone_key(phone)}"
+
+
+def search_pattern(term):
+    """نمط LIKE للبحث عن نص داخل مفتاح البحث"""
+    term = normalize_text(term.strip()).replace('%', '').replace('_', '')
+    if _PHONE_TERM.match(term):
+        # نفس تحويل الرقم المخزن: 0599... و +970599... و 00970... و 0599-... سواء
+        term = phone_key(term) or '0'
+    return f"%{term}%"
+
+
+# ================= POSTGRESQL =================
+def _sql_literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+POSTGRES_SEARCH_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_orders_search_trgm ON orders
+    USING GIN (orderly_search_key(customer_name, product, phone) gin_trgm_ops)
+'''
+
+POSTGRES_SEARCH_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'''
+        CREATE OR REPLACE FUNCTION orderly_normalize(t TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT lower(translate(
+                regexp_replace(COALESCE(t, ''), {_sql_literal('[' + ARABIC_MARKS + ']')}, '', 'g'),
+                {_sql_literal(''.join(ARABIC_FOLD.keys()))},
+                {_sql_literal(''.join(ARABIC_FOLD.values()))}
+            ))
+        $$
+    ''',
+    f'''
+        CREATE OR REPLACE FUNCTION orderly_phone_key(phone TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT ltrim(regexp_replace(regexp_replace(orderly_normalize(phone), '[^0-9]', '', 'g'),
+                                        {_sql_literal(PHONE_PREFIX_PATTERN)}, ''), '0')
+        $$
+    ''',
+    '''
+        CREATE OR REPLACE FUNCTION orderly_search_key(name TEXT, product TEXT, phone TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT orderly_normalize(name) || ' ' || orderly_normalize(product) || ' '
+                || orderly_phone_key(phone)
+        $$
+    ''',
+    POSTGRES_SEARCH_INDEX,
+]
+
+# إعادة بناء المفاتيح بعد تغيير صيغتها: الفهرس مبني على نتيجة الدالة القديمة
+POSTGRES_SEARCH_REBUILD = [
+    *POSTGRES_SEARCH_DDL[1:-1],
+    'DROP INDEX IF EXISTS idx_orders_search_trgm',
+    POSTGRES_SEARCH_INDEX,
+]
+
+POSTGRES_SEARCH_FILTER = ' AND orderly_search_key(customer_name, product, phone) LIKE %s'
+
+
+# ================= SQLITE (FTS5) =================
+def register_sqlite_functions(conn):
+    """تسجيل دالة مفتاح البحث على كل اتصال SQLite (تستخدمها المشغلات)"""
+    conn.create_function('orderly_search_key', 3, search_key, deterministic=True)
+
+
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(search_key, tokenize='trigram')",
+    '''
+        CREATE TRIGGER IF NOT EXISTS orders_fts_insert AFTER INSERT ON orders BEGIN
+            INSERT INTO orders_fts(rowid, search_key)
+            VALUES (new.id, orderly_search_key(new.customer_name, new.product, new.phone));
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS orders_fts_delete AFTER DELETE ON orders BEGIN
+            DELETE FROM orders_fts WHERE rowid = old.id;
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS orders_fts_update AFTER UPDATE OF customer_name, product, phone ON orders BEGIN
+            UPDATE orders_fts SET search_key = orderly_search_key(new.customer_name, new.product, new.phone)
+            WHERE rowid = new.id;
+        END
+    ''',
+    # فهرسة الطلبات الموجودة قبل إنشاء الجدول
+    '''
+        INSERT INTO orders_fts(rowid, search_key)
+        SELECT id, orderly_search_key(customer_name, product, phone) FROM orders
+        WHERE id NOT IN (SELECT rowid FROM orders_fts)
+    ''',
+]
+
+SQLITE_SEARCH_REBUILD = [
+    'DELETE FROM orders_fts',
+    SQLITE_SEARCH_DDL[-1],
+]
+
+SQLITE_SEARCH_FILTER = ' AND id IN (SELECT rowid FROM orders_fts WHERE search_key LIKE ?)'
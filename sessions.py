@@ -0,0 +1,274 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from queries import compile_sql
+from timezones import TIMESTAMP_FORMAT
+
+# ================= SESSION CONFIGURATION =================
+SESSION_TTL = float(os.getenv("SESSION_TTL", 86400))
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", 15))
+SESSION_EVICT_INTERVAL = float(os.getenv("SESSION_EVICT_INTERVAL", 300))
+
+# ================= CONVERSATION SESSIONS =================
+# حالة محادثة الطلب (context.user_data) لكل عميل في سجل بـ __slots__ بدلاً من dict،
+# تُحفظ في bot_sessions كصف واحد (JSON مضغوط بالحقول غير الفارغة فقط) على دفعات كل
+# SESSION_FLUSH_INTERVAL ثانية، فيكمل العميل طلبه بعد إعادة التشغيل. الجلسات الفارغة
+# والتي لم تتغير منذ SESSION_TTL تُحذف من الذاكرة ومن الجدول.
+
+SESSION_FIELDS = ('lang', 'category', 'product', 'step', 'name', 'phone', 'address', 'quantity', 'size')
+
+SESSION_DDL = {
+    'postgresql': [
+        '''
+        CREATE TABLE IF NOT EXISTS bot_sessions (
+            user_id BIGINT PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at TIMESTAMP NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_bot_sessions_updated ON bot_sessions (updated_at)',
+    ],
+    'sqlite': [
+        '''
+        CREATE TABLE IF NOT EXISTS bot_sessions (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at TIMESTAMP NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_bot_sessions_updated ON bot_sessions (updated_at)',
+    ],
+}
+
+UPSERT_SESSION_SQL = '''
+    INSERT INTO bot_sessions (user_id, data, updated_at) VALUES (%s, %s, %s)
+    ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+'''
+
+
+def _timestamp(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+class Session:
+    """جلسة طلب واحدة بواجهة dict المستخدمة في المعالجات (user_data[...], get, clear)"""
+
+    __slots__ = SESSION_FIELDS + ('touched',)
+
+    def __init__(self, **values):
+        for field in SESSION_FIELDS:
+            setattr(self, field, values.get(field))
+        self.touched = time.time()
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None) if key in SESSION_FIELDS else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in SESSION_FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+        self.touched = time.time()
+
+    def __contains__(self, key):
+        return key in SESSION_FIELDS and getattr(self, key) is not None
+
+    def __len__(self):
+        return sum(getattr(self, field) is not None for field in SESSION_FIELDS)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in SESSION_FIELDS else None
+        return default if value is None else value
+
+    def clear(self):
+        for field in SESSION_FIELDS:
+            setattr(self, field, None)
+        self.touched = time.time()
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in SESSION_FIELDS if getattr(self, field) is not None}
+
+    def dumps(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, data, touched):
+        session = cls(**json.loads(data))
+        session.touched = touched
+        return session
+
+
+class SessionPersistence(BasePersistence):
+    """حفظ user_data فقط في bot_sessions؛ الكتابات تُجمع وتُنفذ في معاملة واحدة"""
+
+    def __init__(self, engine, ttl=SESSION_TTL, update_interval=SESSION_FLUSH_INTERVAL,
+                 evict_interval=SESSION_EVICT_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.engine = engine
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        self.stats = {'loaded': 0, 'flushes': 0, 'written': 0, 'dropped': 0, 'evicted': 0, 'last_error': None}
+        self._pending = {}
+        self._dropped = set()
+        self._flush_task = None
+        self._evictor = None
+
+    def _sql(self, query):
+        return compile_sql(query, self.engine.dialect)
+
+    # ===== التحميل =====
+
+    def _load(self):
+        cutoff = _timestamp(time.time() - self.ttl)
+        with self.engine.cursor() as cursor:
+            cursor.execute(self._sql('SELECT user_id, data, updated_at FROM bot_sessions WHERE updated_at >= %s'),
+                           (cutoff,))
+            return {
+                row['user_id']: Session.loads(row['data'], row['updated_at'].replace(tzinfo=timezone.utc).timestamp())
+                for row in cursor.fetchall()
+            }
+
+    async def get_user_data(self):
+        try:
+            sessions = await asyncio.to_thread(self._load)
+        except Exception as e:
+            print(f"❌ Error loading bot sessions: {e}")
+            return {}
+        self.stats['loaded'] = len(sessions)
+        print(f"✅ Restored {len(sessions)} conversation sessions")
+        return sessions
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    # ===== الكتابة على دفعات =====
+
+    async def update_user_data(self, user_id, data):
+        if not data:
+            # طلب اكتمل (clear) أو لم يبدأ: لا حاجة لصف
+            await self.drop_user_data(user_id)
+            return
+        self._pending[user_id] = data
+        self._dropped.discard(user_id)
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id):
+        self._pending.pop(user_id, None)
+        self._dropped.add(user_id)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        # Application يستدعي update_user_data لكل المستخدمين المتغيرين معاً؛ الكتابة
+        # تُؤجل حتى ينتهي كل ذلك ثم تُنفذ دفعة واحدة
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        await asyncio.sleep(0)
+        await self.flush()
+
+    def _write(self, sessions, dropped):
+        with self.engine.cursor() as cursor:
+            if sessions:
+                cursor.executemany(self._sql(UPSERT_SESSION_SQL), [
+                    (user_id, session.dumps(), _timestamp(session.touched))
+                    for user_id, session in sessions.items()
+                ])
+            if dropped:
+                cursor.executemany(self._sql('DELETE FROM bot_sessions WHERE user_id = %s'),
+                                   [(user_id,) for user_id in dropped])
+
+    async def flush(self):
+        sessions, self._pending = self._pending, {}
+        dropped, self._dropped = self._dropped, set()
+        if not sessions and not dropped:
+            return
+        try:
+            await asyncio.to_thread(self._write, sessions, dropped)
+            self.stats['flushes'] += 1
+            self.stats['written'] += len(sessions)
+            self.stats['dropped'] += len(dropped)
+        except Exception as e:
+            self.stats['last_error'] = str(e).strip()[:200]
+            print(f"⚠️ Session flush failed, will retry: {self.stats['last_error']}")
+            # إعادة ما لم يُكتب دون تغطية تحديث أحدث وصل أثناء المحاولة
+            for user_id, session in sessions.items():
+                self._pending.setdefault(user_id, session)
+            self._dropped |= dropped - set(self._pending)
+
+    # ===== الإخلاء =====
+
+    def start_eviction(self, application):
+        """مهمة دورية في حلقة البوت تحذف الجلسات الفارغة والقديمة"""
+        if self._evictor is None:
+            self._evictor = asyncio.get_running_loop().create_task(self._evict_loop(application))
+
+    async def _evict_loop(self, application):
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            try:
+                await self.evict(application)
+            except Exception as e:
+                print(f"⚠️ Session eviction failed: {e}")
+
+    def _delete_stale(self, cutoff):
+        with self.engine.cursor() as cursor:
+            cursor.execute(self._sql('DELETE FROM bot_sessions WHERE updated_at < %s'), (_timestamp(cutoff),))
+
+    async def evict(self, application):
+        cutoff = time.time() - self.ttl
+        stale = [user_id for user_id, session in application.user_data.items()
+                 if not session or session.touched < cutoff]
+        for user_id in stale:
+            application.drop_user_data(user_id)
+        self.stats['evicted'] += len(stale)
+        # صفوف لم تُحمّل في الذاكرة أصلاً
+        await asyncio.to_thread(self._delete_stale, cutoff)
+
+    def info(self):
+        return {**self.stats, 'pending': len(self._pending)}
+
+    # ===== بيانات غير محفوظة =====
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
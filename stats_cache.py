@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+# ================= CACHE CONFIGURATION =================
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", 5))
+
+
+class StatsCache:
+    """كاش داخل العملية للإحصائيات مع مدة صلاحية وإبطال عند الكتابة"""
+
+    def __init__(self, ttl=STATS_CACHE_TTL, max_entries=None):
+        self.ttl = ttl
+        # حد أعلى للمدخلات (الأقدم استخداماً يُحذف أولاً)؛ None = بدون حد
+        self.max_entries = max_entries
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        # يزداد مع كل إبطال حتى لا يُخزن تحميل بدأ قبل الكتابة قيمة قديمة
+        self._generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def get(self, key):
+        """(True, القيمة) إذا كانت صالحة، وإلا (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._stats['hits'] += 1
+                if self.max_entries is not None:
+                    # ترتيب القاموس = ترتيب الاستخدام
+                    self._entries[key] = self._entries.pop(key)
+                return True, entry[1]
+            self._stats['misses'] += 1
+            return False, None
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, generation=None, ttl=None):
+        """تخزين قيمة؛ تُتجاهل إذا حدث إبطال منذ generation"""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            if self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        """حذف المنتهية أولاً، ثم الأقدم استخداماً حتى الحد"""
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry[0] <= now]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+            self._stats['evictions'] += 1
+
+    def get_or_load(self, key, loader, ttl=None):
+        """قراءة من الكاش أو تحميل مرة واحدة فقط مهما تعدد الطالبون المتزامنون"""
+        hit, value = self.get(key)
+        if hit:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # ربما حمّلها خيط آخر أثناء الانتظار
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+            generation = self.generation()
+            value = loader()
+            self.set(key, value, generation=generation, ttl=ttl)
+            return value
+
+    def invalidate(self):
+        """إبطال كل الإحصائيات بعد أي كتابة على الطلبات"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            total = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'entries': len(self._entries),
+                'hit_ratio': round(self._stats['hits'] / total, 3) if total else None,
+                'ttl': self.ttl,
+            }
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# الاختبارات على SQLite فقط؛ OrderlyBot يفتح قاعدته عند الاستيراد
+os.environ.pop('DATABASE_URL', None)
+os.environ.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(), 'orders.db'))
+os.environ.setdefault('BOT_TOKEN', 'test')
+
+from db_engine import DatabaseEngine  # noqa: E402
+from migrations import migrate  # noqa: E402
+from search import register_sqlite_functions  # noqa: E402
+
+ORDER_INSERT = '''
+    INSERT INTO orders (category, product, customer_name, phone, address, quantity, size, language,
+                        merchant_id, status, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """قاعدة SQLite جديدة بكل الترحيلات"""
+    engine = DatabaseEngine(dsn='', sqlite_path=str(tmp_path / 'orders.db'),
+                            sqlite_configure=register_sqlite_functions).open()
+    migrate(engine)
+    yield engine
+    engine.close()
+
+
+def insert_order(cursor, created_at, status='new', category='food', product='🍕 Pizza', merchant_id=1):
+    cursor.execute(ORDER_INSERT, (category, product, 'Ahmad', '0599123456', 'Gaza, Omar St.', '1', '', 'ar',
+                                  merchant_id, status, created_at))
+    return cursor.lastrowid
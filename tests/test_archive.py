@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+from archive import OrderArchiver
+from conftest import insert_order
+from OrderlyBot import Database
+from timezones import TIMESTAMP_FORMAT
+
+
+def days_ago(days):
+    return (datetime.utcnow() - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+
+
+def test_listing_totals_exclude_archived_orders(engine):
+    with engine.cursor() as cursor:
+        for _ in range(3):
+            insert_order(cursor, days_ago(200), status='completed')
+        insert_order(cursor, days_ago(200), status='new')
+        insert_order(cursor, days_ago(1), status='completed')
+
+    assert OrderArchiver(engine, after_days=90).run_once() == 3
+
+    db = Database(engine)
+    stats = db.get_order_stats(1)
+    # الإحصائيات تشمل الأرشيف، والقوائم وأعدادها لا
+    assert stats['total'] == 5
+    assert stats['archived'] == 3
+    assert db.count_orders() == 2
+    assert db.count_orders('completed') == 1
+    assert db.count_orders('new') == 1
+    assert len(db.get_orders_page(per_page=20)['orders']) == db.count_orders()
+    assert len(db.get_orders_page('completed', per_page=20)['orders']) == db.count_orders('completed')
+
+
+def test_archived_counters_are_rebuilt_by_migration(engine):
+    with engine.cursor() as cursor:
+        insert_order(cursor, days_ago(200), status='cancelled')
+    OrderArchiver(engine, after_days=90).run_once()
+    with engine.cursor() as cursor:
+        cursor.execute("DELETE FROM order_counters WHERE dimension = 'archived'")
+        cursor.execute('DELETE FROM schema_version WHERE version >= 10')
+
+    from migrations import migrate
+    migrate(engine)
+    assert Database(engine).count_orders('cancelled') == 0
+
+
+def test_listing_window_starts_at_oldest_order(engine):
+    with engine.cursor() as cursor:
+        insert_order(cursor, days_ago(400))
+        insert_order(cursor, days_ago(2))
+
+    db = Database(engine)
+    first, until = db.listing_window(1)
+    assert days_ago(401) < first <= days_ago(400)
+    assert until > days_ago(0)
+    assert len(db.get_orders_page(per_page=20)['orders']) == 2
+
+
+def test_archiving_invalidates_cached_counts_and_window(engine):
+    with engine.cursor() as cursor:
+        insert_order(cursor, days_ago(200), status='completed')
+        insert_order(cursor, days_ago(1), status='completed')
+    db = Database(engine)
+    assert db.count_orders() == 2
+    assert db.listing_window(1)[0] <= days_ago(200)
+
+    OrderArchiver(engine, after_days=90, on_archived=db.cache.invalidate).run_once()
+    assert db.count_orders() == 1
+    assert db.listing_window(1)[0] > days_ago(2)
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+from OrderlyBot import AsyncDatabase, Database
+
+ORDER = {'category': 'food', 'product': '🍕 Pizza', 'name': 'Ahmad', 'phone': '0599123456',
+         'address': 'Gaza, Omar St.', 'quantity': '2', 'size': '', 'lang': 'ar'}
+
+
+def run(adb, scenario):
+    async def wrapped():
+        await adb.open()
+        try:
+            return await scenario()
+        finally:
+            await adb.close()
+    return asyncio.run(wrapped())
+
+
+def test_sqlite_fallback_is_not_native(engine):
+    adb = AsyncDatabase(Database(engine))
+    assert run(adb, lambda: asyncio.sleep(0)) is None
+    assert not adb.engine.native
+
+
+def test_async_path_saves_and_reads_orders(engine):
+    adb = AsyncDatabase(Database(engine))
+
+    async def scenario():
+        order_id = await adb.add_order(ORDER)
+        ids = await adb.add_orders([ORDER, ORDER])
+        orders = await adb.get_orders_by_merchant(1)
+        page = await adb.get_orders_page(per_page=2)
+        stats = await adb.get_order_stats(1)
+        return order_id, ids, orders, page, stats
+
+    order_id, ids, orders, page, stats = run(adb, scenario)
+    assert ids == [order_id + 1, order_id + 2]
+    assert [order['id'] for order in orders] == [order_id + 2, order_id + 1, order_id]
+    assert [order['id'] for order in page['orders']] == [order_id + 2, order_id + 1]
+    assert page['next_cursor'] and page['prev_cursor'] is None
+    assert (stats['total'], stats['new'], stats['today']) == (3, 3, 3)
+
+
+def test_sqlite_calls_run_off_the_event_loop(engine, monkeypatch):
+    db = Database(engine)
+    adb = AsyncDatabase(db)
+    threads = []
+    add_order = db.add_order
+
+    def recording_add_order(order_data):
+        threads.append(threading.get_ident())
+        return add_order(order_data)
+    monkeypatch.setattr(db, 'add_order', recording_add_order)
+
+    async def scenario():
+        await adb.add_order(ORDER)
+        return threading.get_ident()
+
+    loop_thread = run(adb, scenario)
+    assert threads and threads[0] != loop_thread
@@ -0,0 +1,84 @@
+import pytest
+
+import OrderlyBot
+from conftest import insert_order
+from OrderlyBot import Database
+
+
+@pytest.fixture
+def db(engine):
+    db = Database(engine)
+    with engine.cursor() as cursor:
+        for status in ('new', 'new', 'processing', 'completed'):
+            insert_order(cursor, '2026-01-01 12:00:00', status=status)
+        # طلب تاجر آخر لا تلمسه العمليات الجماعية
+        insert_order(cursor, '2026-01-01 12:00:00', merchant_id=2)
+    return db
+
+
+def statuses(engine):
+    with engine.cursor() as cursor:
+        cursor.execute('SELECT id, status FROM orders ORDER BY id')
+        return {row['id']: row['status'] for row in cursor.fetchall()}
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(OrderlyBot, 'db', db)
+    client = OrderlyBot.admin_app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['_user_id'] = '1'
+        flask_session['_fresh'] = True
+    return client
+
+
+def test_bulk_status_returns_only_changed_orders(db, engine):
+    assert db.update_orders_status([1, '2', 3, 3, 4, 5, 99], 'completed') == [1, 2, 3]
+    assert statuses(engine) == {1: 'completed', 2: 'completed', 3: 'completed', 4: 'completed', 5: 'new'}
+
+
+def test_bulk_delete_returns_deleted_orders(db, engine):
+    assert db.delete_orders([2, 4, 5, 99]) == [2, 4]
+    assert sorted(statuses(engine)) == [1, 3, 5]
+    assert db.delete_orders([]) == []
+
+
+def test_large_selection_goes_through_temp_table(db, engine, monkeypatch):
+    monkeypatch.setattr(OrderlyBot, 'BULK_TEMP_TABLE_MIN', 2)
+    assert db.update_orders_status([1, 2, 3], 'cancelled') == [1, 2, 3]
+    assert db.delete_orders([1, 2, 5]) == [1, 2]
+    assert sorted(statuses(engine)) == [3, 4, 5]
+
+
+def test_bulk_writes_invalidate_stats(db):
+    assert db.get_order_stats(1)['new'] == 2
+    db.update_orders_status([1], 'completed')
+    assert db.get_order_stats(1)['new'] == 1
+    db.delete_orders([2])
+    assert db.get_order_stats(1)['new'] == 0
+
+
+def test_bulk_status_endpoint(client, engine):
+    response = client.post('/api/orders/bulk/status', json={'order_ids': [1, 2], 'status': 'processing'})
+    assert response.status_code == 200
+    assert response.get_json()['updated_ids'] == [1, 2]
+    assert statuses(engine)[1] == 'processing'
+
+
+def test_bulk_delete_endpoint(client, engine):
+    response = client.post('/api/orders/bulk/delete', json={'order_ids': [3, 4]})
+    assert response.status_code == 200
+    assert response.get_json()['deleted_count'] == 2
+    assert sorted(statuses(engine)) == [1, 2, 5]
+
+
+@pytest.mark.parametrize('path, body', [
+    ('/api/orders/bulk/status', {'order_ids': [1], 'status': 'shipped'}),
+    ('/api/orders/bulk/status', {'order_ids': [], 'status': 'completed'}),
+    ('/api/orders/bulk/status', {'order_ids': ['1x'], 'status': 'completed'}),
+    ('/api/orders/bulk/delete', {'order_ids': '12'}),
+    ('/api/orders/bulk/delete', {'order_ids': [None]}),
+])
+def test_bulk_endpoints_reject_invalid_input(client, engine, path, body):
+    assert client.post(path, json=body).status_code == 400
+    assert len(statuses(engine)) == 5
@@ -0,0 +1,73 @@
+import pytest
+
+from conversation import (CATEGORIES, ORDER_FIELDS, ORDER_FLOW, benchmark, phone_field, quantity_field,
+                          text_field)
+from sessions import Session
+
+ANSWERS = {'name': "Ahmad", 'phone': "0599123456", 'address': "Gaza, Omar St.", 'quantity': "2", 'size': "L"}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('3', '3'), ('٣', '3'), ('۱۲', '12'), (' 007 ', '7'), ('999', '999'),
+    ('0', None), ('1000', None), ('-1', None), ('2.5', None), ('', None), ('two', None),
+    ('²', None), ('①', None), ('3²', None),
+])
+def test_quantity_field(text, expected):
+    assert quantity_field(text) == expected
+
+
+@pytest.mark.parametrize('text, valid', [
+    ('0599123456', True), ('+970 599 123 456', True), ('٠٥٩٩١٢٣٤٥٦', True), ('12345', False), ('call me', False),
+])
+def test_phone_field(text, valid):
+    assert (phone_field(text) is not None) == valid
+
+
+def test_text_field_collapses_whitespace_and_bounds_length():
+    validate = text_field(10, min_length=3)
+    assert validate('  Omar   St ') == 'Omar St'
+    assert validate('ab') is None
+    assert validate('x' * 11) is None
+
+
+def test_every_category_step_has_a_field():
+    for category, spec in CATEGORIES.items():
+        assert set(spec['steps']) <= set(ORDER_FIELDS)
+        assert ORDER_FLOW.first_step[category] == spec['steps'][0]
+        chain = [ORDER_FLOW.first_step[category]]
+        while ORDER_FLOW.transitions[(category, chain[-1])].next_field:
+            chain.append(ORDER_FLOW.transitions[(category, chain[-1])].next_field)
+        assert tuple(chain) == spec['steps']
+
+
+@pytest.mark.parametrize('category', list(CATEGORIES))
+def test_flow_collects_every_step(category):
+    session = Session(lang='en', category=category)
+    prompt = ORDER_FLOW.choose_product(session, CATEGORIES[category]['products'][0])
+    assert prompt == ORDER_FIELDS[CATEGORIES[category]['steps'][0]]['prompt']['en']
+
+    done = False
+    while not done:
+        _, done = ORDER_FLOW.advance(session, ANSWERS[session['step']])
+    assert session['step'] == 'done'
+    assert all(session[field] == ANSWERS[field] for field in CATEGORIES[category]['steps'])
+
+
+def test_invalid_answer_repeats_step():
+    session = Session(lang='ar', category='food')
+    ORDER_FLOW.choose_product(session, CATEGORIES['food']['products'][0])
+    session['step'] = 'quantity'
+    reply, done = ORDER_FLOW.advance(session, '①')
+    assert reply == ORDER_FIELDS['quantity']['invalid']['ar']
+    assert not done and session['step'] == 'quantity'
+
+
+def test_unknown_product_or_step_is_ignored():
+    session = Session(lang='ar', category='food')
+    assert ORDER_FLOW.choose_product(session, '👖 Jeans') is None
+    assert ORDER_FLOW.advance(Session(lang='ar'), 'hello') is None
+
+
+def test_benchmark_runs(capsys):
+    benchmark(orders=20)
+    assert 'transitions' in capsys.readouterr().out
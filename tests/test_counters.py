@@ -0,0 +1,60 @@
+from conftest import insert_order
+
+ACTUAL_COUNTS = '''
+    SELECT merchant_id, 'status' AS dimension, status AS value, COUNT(*) AS count FROM orders
+    GROUP BY merchant_id, status
+    UNION ALL
+    SELECT merchant_id, 'category', category, COUNT(*) FROM orders GROUP BY merchant_id, category
+'''
+
+
+def counters(engine):
+    with engine.cursor() as cursor:
+        cursor.execute("SELECT merchant_id, dimension, value, count FROM order_counters "
+                       "WHERE dimension IN ('status', 'category') AND count <> 0")
+        return {(row['merchant_id'], row['dimension'], row['value']): row['count'] for row in cursor.fetchall()}
+
+
+def actual(engine):
+    with engine.cursor() as cursor:
+        cursor.execute(ACTUAL_COUNTS)
+        return {(row['merchant_id'], row['dimension'], row['value']): row['count'] for row in cursor.fetchall()}
+
+
+def daily(engine):
+    with engine.cursor() as cursor:
+        cursor.execute('SELECT date, total_orders, completed_orders FROM daily_stats '
+                       'WHERE total_orders <> 0 ORDER BY date')
+        return [(str(row['date']), row['total_orders'], row['completed_orders']) for row in cursor.fetchall()]
+
+
+def test_counters_follow_inserts_updates_and_deletes(engine):
+    with engine.cursor() as cursor:
+        first = insert_order(cursor, '2026-03-01 10:00:00')
+        insert_order(cursor, '2026-03-01 11:00:00', category='clothes')
+        insert_order(cursor, '2026-03-02 09:00:00', merchant_id=2)
+    assert counters(engine) == actual(engine)
+    assert counters(engine)[(1, 'status', 'new')] == 2
+
+    with engine.cursor() as cursor:
+        cursor.execute("UPDATE orders SET status = 'completed' WHERE id = ?", (first,))
+    assert counters(engine) == actual(engine)
+    assert daily(engine) == [('2026-03-01', 2, 1), ('2026-03-02', 1, 0)]
+
+    with engine.cursor() as cursor:
+        cursor.execute('DELETE FROM orders WHERE id = ?', (first,))
+    assert counters(engine) == actual(engine)
+    assert (1, 'status', 'completed') not in counters(engine)
+    assert daily(engine) == [('2026-03-01', 1, 0), ('2026-03-02', 1, 0)]
+
+
+def test_counters_roll_back_with_the_write(engine):
+    with engine.cursor() as cursor:
+        insert_order(cursor, '2026-03-01 10:00:00')
+    try:
+        with engine.cursor() as cursor:
+            insert_order(cursor, '2026-03-01 11:00:00')
+            raise RuntimeError('abort')
+    except RuntimeError:
+        pass
+    assert counters(engine) == actual(engine) == {(1, 'status', 'new'): 1, (1, 'category', 'food'): 1}
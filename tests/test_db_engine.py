@@ -0,0 +1,139 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import psycopg
+import pytest
+from psycopg_pool import PoolTimeout
+
+import db_engine
+from db_engine import DatabaseUnavailable, SQLitePool, pool_exhausted, primary_unavailable
+from order_writer import OrderWriter
+
+
+@pytest.fixture
+def primary(engine, monkeypatch):
+    """قاطع المحرك يعمل كما على PostgreSQL، والفحص المستقل ينجح"""
+    monkeypatch.setattr(engine, 'dialect', 'postgresql')
+    monkeypatch.setattr(engine, 'dsn', 'postgresql://primary')
+    monkeypatch.setattr(db_engine, 'probe', lambda dsn, timeout: None)
+    return engine
+
+
+@pytest.fixture
+def dead_primary(primary, monkeypatch):
+    def refused(dsn, timeout):
+        raise psycopg.OperationalError('connection refused')
+    monkeypatch.setattr(db_engine, 'probe', refused)
+    return primary
+
+
+def fail_with(engine, error, times, raised=None):
+    for _ in range(times):
+        with pytest.raises(raised or type(error)):
+            with engine._guard():
+                raise error
+
+
+def half_open(engine):
+    engine.breaker.state = 'open'
+    engine.breaker._retry_at = 0
+
+
+def test_saturated_pool_does_not_open_breaker(primary):
+    fail_with(primary, PoolTimeout('pool exhausted'), primary.breaker.failures + 2)
+    assert primary.breaker.state == 'closed'
+
+
+def test_pool_timeout_from_dead_server_opens_breaker(dead_primary):
+    fail_with(dead_primary, PoolTimeout('pool exhausted'), dead_primary.breaker.failures,
+              raised=DatabaseUnavailable)
+    assert dead_primary.breaker.state == 'open'
+    # بعدها يُرفض الطلب فوراً بدل انتظار مهلة المجمع
+    with pytest.raises(DatabaseUnavailable):
+        with dead_primary._guard():
+            pass
+
+
+def test_half_open_pool_timeout_releases_probe(primary):
+    half_open(primary)
+    fail_with(primary, PoolTimeout('pool exhausted'), 1)
+    assert primary.breaker.state == 'half_open'
+    # الطلب التالي يفحص من جديد بدل أن يُرفض إلى الأبد
+    with primary._guard():
+        pass
+    assert primary.breaker.state == 'closed'
+
+
+def test_half_open_pool_timeout_from_dead_server_reopens(dead_primary):
+    half_open(dead_primary)
+    fail_with(dead_primary, PoolTimeout('pool exhausted'), 1, raised=DatabaseUnavailable)
+    assert dead_primary.breaker.state == 'open'
+    assert not dead_primary.breaker._probing
+
+
+def test_connection_errors_open_breaker(primary):
+    fail_with(primary, psycopg.OperationalError('server closed the connection'), primary.breaker.failures)
+    assert primary.breaker.state == 'open'
+
+
+def test_pool_timeout_is_not_an_outage():
+    assert pool_exhausted(PoolTimeout('pool exhausted'))
+    assert not primary_unavailable(PoolTimeout('pool exhausted'))
+    assert primary_unavailable(psycopg.OperationalError('connection refused'))
+
+
+def test_writer_does_not_retry_each_order_when_pool_is_exhausted():
+    calls = []
+
+    async def insert_batch(orders):
+        calls.append(len(orders))
+        raise PoolTimeout('pool exhausted')
+
+    async def scenario():
+        writer = OrderWriter(insert_batch, max_wait=0.05)
+        writer.start()
+        ids = await asyncio.gather(*(writer.submit({'n': n}) for n in range(3)))
+        await writer.stop()
+        return ids
+
+    assert asyncio.run(scenario()) == [None, None, None]
+    assert calls == [3]
+
+
+def test_sqlite_pool_never_grows_past_max_size(tmp_path):
+    created = []
+
+    def slow_configure(conn):
+        created.append(conn)
+        time.sleep(0.02)
+
+    pool = SQLitePool(str(tmp_path / 'pool.db'), min_size=0, max_size=3, timeout=2, configure=slow_configure)
+    barrier = threading.Barrier(12)
+
+    def borrow():
+        barrier.wait()
+        conn = pool.getconn()
+        time.sleep(0.05)
+        pool.putconn(conn)
+
+    threads = [threading.Thread(target=borrow) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 3
+    assert pool.get_stats()['pool_size'] == 3
+    pool.close()
+
+
+def test_sqlite_pool_releases_slot_when_connect_fails(tmp_path):
+    def broken(conn):
+        raise sqlite3.OperationalError('cannot configure')
+
+    pool = SQLitePool(str(tmp_path / 'pool.db'), min_size=0, max_size=1, configure=broken)
+    for _ in range(2):
+        with pytest.raises(sqlite3.OperationalError):
+            pool.getconn(timeout=0.1)
+    assert pool.get_stats()['pool_size'] == 0
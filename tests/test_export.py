@@ -0,0 +1,38 @@
+import csv
+import io
+import zipfile
+from datetime import datetime
+
+from export import csv_cell, stream_csv, stream_xlsx
+
+ORDER = {'id': 7, 'customer_name': '=HYPERLINK("http://evil","x")', 'phone': '+970599123456',
+         'product': '@SUM(A1)', 'category': 'food', 'quantity': '-2', 'address': 'Gaza, Omar St.',
+         'status': 'new', 'created_at': datetime(2026, 3, 1, 10, 0)}
+
+
+def test_csv_cell_neutralizes_formulas():
+    for value in ('=1+1', '+1', '-1', '@A1', '\t=1', '\r=1'):
+        assert csv_cell(value) == "'" + value
+    assert csv_cell('أحمد') == 'أحمد'
+    assert csv_cell(7) == 7
+
+
+def test_csv_export_has_no_formula_cells():
+    data = b''.join(stream_csv([[ORDER], [ORDER]])).decode('utf-8-sig')
+    rows = list(csv.reader(io.StringIO(data)))
+    assert len(rows) == 3
+    for row in rows[1:]:
+        assert row[0] == '7'
+        assert row[1] == '\'=HYPERLINK("http://evil","x")'
+        assert row[2] == "'+970599123456"
+        assert row[3] == "'@SUM(A1)"
+        assert row[6] == 'Gaza, Omar St.'
+        assert not any(cell.startswith(('=', '+', '-', '@')) for cell in row)
+
+
+def test_xlsx_export_writes_text_cells_only():
+    data = b''.join(stream_xlsx([[ORDER]]))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+    assert '<f>' not in sheet
+    assert '<c t="inlineStr"><is><t xml:space="preserve">=HYPERLINK("' in sheet
@@ -0,0 +1,104 @@
+import asyncio
+from contextlib import contextmanager
+
+import pytest
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+from db_engine import DatabaseUnavailable
+from journal import JournalReconciler
+from OrderlyBot import AsyncDatabase, Database
+from order_writer import OrderWriter
+
+ORDER = {'category': 'food', 'product': '🍕 Pizza', 'name': 'Ahmad', 'phone': '0599123456',
+         'address': 'Gaza, Omar St.', 'quantity': '2', 'size': '', 'lang': 'ar', 'notify_chat_id': 1}
+
+
+@pytest.fixture
+def outage(engine, tmp_path, monkeypatch):
+    """محرك يعمل على PostgreSQL ثم يفتح قاطعه أثناء التشغيل"""
+    monkeypatch.setattr(engine, 'dsn', 'postgresql://primary')
+    monkeypatch.setattr(engine, 'dialect', 'postgresql')
+    monkeypatch.setattr(engine, 'sqlite_path', str(tmp_path / 'local.db'))
+    monkeypatch.setattr(engine, 'local_pool', None)
+
+    @contextmanager
+    def unavailable():
+        raise DatabaseUnavailable('circuit open')
+        yield
+    monkeypatch.setattr(engine, 'cursor', unavailable)
+    return engine
+
+
+def test_runtime_outage_journals_orders_locally(outage):
+    db = Database(outage)
+    ids = db.add_orders([ORDER, ORDER])
+    order_id = db.add_order(ORDER)
+
+    assert len(ids) == 2 and order_id is not None
+    assert outage.local_pool is not None
+    assert JournalReconciler(outage).pending() == 3
+    with outage.local_cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) AS count FROM admin_outbox WHERE delivered_at IS NULL')
+        assert cursor.fetchone()['count'] == 3
+
+
+def test_data_errors_are_not_journaled(outage, monkeypatch):
+    @contextmanager
+    def broken():
+        raise ValueError('bad data')
+        yield
+    monkeypatch.setattr(outage, 'cursor', broken)
+    with pytest.raises(ValueError):
+        Database(outage).add_orders([ORDER])
+    assert outage.local_pool is None
+
+
+def test_sqlite_only_deployment_does_not_journal(engine):
+    db = Database(engine)
+    db.add_orders([ORDER])
+    with engine.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) AS count FROM order_journal')
+        assert cursor.fetchone()['count'] == 0
+
+
+@pytest.fixture
+def dead_pool(engine, tmp_path, monkeypatch):
+    """مجمع psycopg_pool حقيقي إلى منفذ لا يرد: getconn ينتهي بـ PoolTimeout كما في انقطاع فعلي"""
+    dsn = 'host=127.0.0.1 port=1 connect_timeout=1'
+    pool = ConnectionPool(dsn, min_size=0, max_size=1, timeout=0.3, open=True)
+    monkeypatch.setattr(engine, 'dsn', dsn)
+    monkeypatch.setattr(engine, 'dialect', 'postgresql')
+    monkeypatch.setattr(engine, 'pool', pool)
+    monkeypatch.setattr(engine, 'timeout', 0.3)
+    monkeypatch.setattr(engine, 'sqlite_path', str(tmp_path / 'local.db'))
+    monkeypatch.setattr(engine, 'local_pool', None)
+    yield engine
+    pool.close()
+
+
+def test_pool_timeout_from_dead_primary_journals_orders(dead_pool):
+    db = Database(dead_pool)
+    ids = db.add_orders([ORDER, ORDER])
+
+    assert len(ids) == 2
+    assert dead_pool.local_pool is not None
+    assert JournalReconciler(dead_pool).pending() == 2
+
+
+def test_async_writer_journals_on_dead_primary(dead_pool):
+    adb = AsyncDatabase(Database(dead_pool))
+
+    async def scenario():
+        # المسار الأصلي غير المتزامن بمجمع حقيقي لا يصل إلى الخادم
+        adb.engine.pool = AsyncConnectionPool(dead_pool.dsn, min_size=0, max_size=1, timeout=0.3, open=False)
+        await adb.engine.pool.open()
+        writer = OrderWriter(adb.add_orders)
+        writer.start()
+        ids = await asyncio.gather(writer.submit(ORDER), writer.submit(ORDER))
+        await writer.stop()
+        await adb.engine.pool.close()
+        return ids
+
+    ids = asyncio.run(scenario())
+    assert None not in ids
+    assert JournalReconciler(dead_pool).pending() == 2
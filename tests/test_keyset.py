@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from conftest import insert_order
+from OrderlyBot import Database
+from timezones import TIMESTAMP_FORMAT
+
+
+def fill(engine, count=25):
+    """طلبات بأوقات متناقصة، كل ثلاثة منها بنفس created_at حتى يحسم id الترتيب"""
+    start = datetime.utcnow() - timedelta(days=1)
+    with engine.cursor() as cursor:
+        for n in range(count):
+            created_at = (start - timedelta(minutes=n // 3)).strftime(TIMESTAMP_FORMAT)
+            insert_order(cursor, created_at, status='completed' if n % 2 else 'new')
+    with engine.cursor() as cursor:
+        cursor.execute('SELECT id, status FROM orders ORDER BY created_at DESC, id DESC')
+        return cursor.fetchall()
+
+
+def page_ids(page):
+    return [order['id'] for order in page['orders']]
+
+
+def test_next_pages_cover_every_order_once(engine):
+    expected = [row['id'] for row in fill(engine)]
+    db = Database(engine)
+
+    seen, cursor = [], None
+    while True:
+        page = db.get_orders_page(per_page=10, next_cursor=cursor)
+        seen.extend(page_ids(page))
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_prev_cursor_returns_previous_page(engine):
+    fill(engine)
+    db = Database(engine)
+    first = db.get_orders_page(per_page=10)
+    second = db.get_orders_page(per_page=10, next_cursor=first['next_cursor'])
+    back = db.get_orders_page(per_page=10, prev_cursor=second['prev_cursor'])
+    assert first['prev_cursor'] is None
+    assert page_ids(back) == page_ids(first)
+    assert back['prev_cursor'] is None
+    assert back['next_cursor'] is not None
+
+
+def test_status_filter_pages(engine):
+    expected = [row['id'] for row in fill(engine) if row['status'] == 'new']
+    db = Database(engine)
+    first = db.get_orders_page('new', per_page=8)
+    second = db.get_orders_page('new', per_page=8, next_cursor=first['next_cursor'])
+    assert page_ids(first) + page_ids(second) == expected
+    assert second['next_cursor'] is None
+
+
+def test_invalid_cursor_falls_back_to_first_page(engine):
+    fill(engine)
+    db = Database(engine)
+    assert page_ids(db.get_orders_page(per_page=5, next_cursor='bogus')) == \
+        page_ids(db.get_orders_page(per_page=5))
+
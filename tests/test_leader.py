@@ -0,0 +1,112 @@
+import asyncio
+from types import SimpleNamespace
+
+import psycopg
+import pytest
+
+from db_engine import Backoff
+from leader import LeaderElection
+
+
+class FakeServer:
+    """خادم وهمي يحمل قفلاً استشارياً واحداً"""
+
+    def __init__(self):
+        self.up = True
+        self.holder = None
+        self.pids = iter(range(100, 200))
+
+    def connect(self):
+        if not self.up:
+            raise psycopg.OperationalError('connection refused')
+        return FakeConnection(self, next(self.pids))
+
+
+class FakeConnection:
+    def __init__(self, server, pid):
+        self.server = server
+        self.info = SimpleNamespace(backend_pid=pid)
+        self.closed = False
+
+    def execute(self, query, params=()):
+        if self.closed or not self.server.up:
+            raise psycopg.OperationalError('server closed the connection unexpectedly')
+        pid = self.info.backend_pid
+        if 'pg_try_advisory_lock' in query:
+            if self.server.holder in (None, pid):
+                self.server.holder = pid
+            return SimpleNamespace(fetchone=lambda: (self.server.holder == pid,))
+        if 'pg_locks' in query:
+            holder = self.server.holder
+            return SimpleNamespace(fetchone=lambda: (holder,) if holder else None)
+        if 'pg_advisory_unlock' in query and self.server.holder == pid:
+            self.server.holder = None
+        return SimpleNamespace(fetchone=lambda: (1,))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+@pytest.fixture
+def leader(server, monkeypatch):
+    election = LeaderElection(SimpleNamespace(dialect='postgresql', dsn='postgresql://primary'),
+                              check_interval=0.01)
+    election.backoff = Backoff(base=0.01, maximum=0.01)
+    monkeypatch.setattr(election, '_connect', server.connect)
+    election.acquire()
+    return election
+
+
+def session_dies(server, leader):
+    """انقطاع جلسة القائد: الخادم يفلت قفلها"""
+    leader._conn.closed = True
+    server.holder = None
+
+
+def test_outage_keeps_leadership_and_reacquires(server, leader):
+    session_dies(server, leader)
+    server.up = False
+    assert leader.check() and leader.check()
+    assert leader.is_leader
+
+    server.up = True
+    assert leader.check()
+    assert server.holder == leader._pid
+    assert leader.check()
+
+
+def test_leadership_lost_only_when_another_session_holds_lock(server, leader):
+    session_dies(server, leader)
+    server.holder = 999
+    assert not leader.check()
+    assert not leader.is_leader
+
+
+def test_previous_session_still_holding_lock_is_not_a_loss(server, leader):
+    old_pid = leader._pid
+    leader._conn.closed = True
+    assert server.holder == old_pid
+    assert leader.check()
+    assert leader.is_leader
+
+
+def test_watch_survives_outage_and_stops_on_takeover(server, leader):
+    lost = []
+
+    async def scenario():
+        leader.start_watch(lambda: lost.append(True))
+        session_dies(server, leader)
+        server.up = False
+        await asyncio.sleep(0.1)
+        assert not lost
+        server.up = True
+        server.holder = 999
+        await asyncio.wait_for(leader._watcher, 1)
+
+    asyncio.run(scenario())
+    assert lost == [True]
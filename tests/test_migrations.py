@@ -0,0 +1,20 @@
+from migrations import LATEST_VERSION, MIGRATIONS, check_query_plans, current_version, migrate
+
+
+def test_all_migrations_recorded_once(engine):
+    assert current_version(engine) == LATEST_VERSION
+    with engine.cursor() as cursor:
+        cursor.execute('SELECT version FROM schema_version ORDER BY version')
+        assert [row['version'] for row in cursor.fetchall()] == [m['version'] for m in MIGRATIONS]
+
+
+def test_migrate_is_a_no_op_when_up_to_date(engine):
+    assert migrate(engine) == LATEST_VERSION
+    with engine.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) AS count FROM schema_version')
+        assert cursor.fetchone()['count'] == len(MIGRATIONS)
+
+
+def test_hot_queries_use_indexes(engine):
+    for name, (uses_index, plan) in check_query_plans(engine).items():
+        assert uses_index, f'{name}: {plan}'
@@ -0,0 +1,46 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import OrderlyBot
+from scheduler import REPORT_PRIORITY
+from stats_cache import StatsCache
+
+
+def test_page_cache_is_bounded():
+    cache = StatsCache(ttl=60, max_entries=3)
+    for page in range(10):
+        cache.set(('chat', 'message', 'all', page), page)
+    assert cache.stats()['entries'] == 3
+    assert cache.get(('chat', 'message', 'all', 0)) == (False, None)
+    assert cache.get(('chat', 'message', 'all', 9)) == (True, 9)
+
+
+def test_page_cache_evicts_least_recently_used():
+    cache = StatsCache(ttl=60, max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('a') == (True, 1)
+    assert cache.get('b') == (False, None)
+
+
+def test_page_edit_uses_report_priority(monkeypatch):
+    view = ("📋 page", MagicMock())
+    monkeypatch.setattr(OrderlyBot, 'load_myorders_page', AsyncMock(return_value=view))
+    monkeypatch.setattr(OrderlyBot, 'myorders_pages', StatsCache(ttl=60, max_entries=10))
+
+    update = MagicMock()
+    update.effective_user.id = OrderlyBot.ADMIN_ID
+    query = update.callback_query
+    query.data = 'mo|all|2|n|2026-01-01T12:00:00|5'
+    query.answer = AsyncMock()
+    query.message.chat.id = OrderlyBot.ADMIN_ID
+    query.message.message_id = 7
+    context = MagicMock()
+    context.bot.edit_message_text = AsyncMock()
+
+    asyncio.run(OrderlyBot.myorders_callback(update, context))
+    kwargs = context.bot.edit_message_text.call_args.kwargs
+    assert kwargs['rate_limit_args'] == REPORT_PRIORITY
+    assert (kwargs['chat_id'], kwargs['message_id'], kwargs['text']) == (OrderlyBot.ADMIN_ID, 7, "📋 page")
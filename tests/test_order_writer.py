@@ -0,0 +1,70 @@
+import asyncio
+
+from OrderlyBot import AsyncDatabase, Database
+from order_writer import OrderWriter
+
+
+class FakeStore:
+    """insert_batch يسجل الدفعات ويرفض الطلبات المعلمة bad"""
+
+    def __init__(self):
+        self.batches = []
+        self.next_id = 1
+
+    async def insert_batch(self, orders):
+        self.batches.append(len(orders))
+        if any(order.get('bad') for order in orders):
+            raise ValueError('bad order')
+        ids = list(range(self.next_id, self.next_id + len(orders)))
+        self.next_id += len(orders)
+        return ids
+
+
+def submit_all(writer, orders):
+    async def scenario():
+        writer.start()
+        ids = await asyncio.gather(*(writer.submit(order) for order in orders))
+        await writer.stop()
+        return ids
+    return asyncio.run(scenario())
+
+
+def test_concurrent_orders_share_one_batch():
+    store = FakeStore()
+    writer = OrderWriter(store.insert_batch, max_wait=0.05)
+    assert submit_all(writer, [{'n': n} for n in range(5)]) == [1, 2, 3, 4, 5]
+    assert store.batches == [5]
+    assert writer.stats == {'batches': 1, 'orders': 5, 'largest_batch': 5, 'failed_batches': 0}
+
+
+def test_batches_are_capped_at_max_batch():
+    store = FakeStore()
+    writer = OrderWriter(store.insert_batch, max_batch=2, max_wait=0.05)
+    assert submit_all(writer, [{'n': n} for n in range(5)]) == [1, 2, 3, 4, 5]
+    assert store.batches == [2, 2, 1]
+
+
+def test_bad_order_does_not_fail_the_batch():
+    store = FakeStore()
+    writer = OrderWriter(store.insert_batch, max_wait=0.05)
+    ids = submit_all(writer, [{'n': 0}, {'bad': True}, {'n': 2}])
+    assert ids == [1, None, 2]
+    # الدفعة فشلت ثم أُعيد كل طلب وحده
+    assert store.batches == [3, 1, 1, 1]
+    assert writer.stats['failed_batches'] == 1
+
+
+def test_submit_without_running_writer_inserts_directly():
+    store = FakeStore()
+    writer = OrderWriter(store.insert_batch)
+    assert asyncio.run(writer.submit({'n': 0})) == 1
+    assert store.batches == [1]
+
+
+def test_writer_saves_orders_through_async_database(engine):
+    order = {'category': 'food', 'product': '🍕 Pizza', 'name': 'Ahmad', 'phone': '0599123456',
+             'address': 'Gaza, Omar St.', 'quantity': '2', 'size': '', 'lang': 'ar'}
+    ids = submit_all(OrderWriter(AsyncDatabase(Database(engine)).add_orders, max_wait=0.05), [order] * 3)
+    with engine.cursor() as cursor:
+        cursor.execute('SELECT id FROM orders ORDER BY id')
+        assert [row['id'] for row in cursor.fetchall()] == ids
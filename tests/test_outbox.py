@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from OrderlyBot import admin_digest_message
+from outbox import TELEGRAM_MESSAGE_LIMIT, split_digest, truncate_utf16, utf16_len
+
+PRODUCTS = ["🍕 Pizza", "👕 T-Shirt", "🥗 Salad"]
+
+
+def digest_orders(count):
+    return [{
+        'id': index,
+        'category': 'food' if index % 2 else 'clothing',
+        'product': PRODUCTS[index % 3],
+        'customer_name': f"عميل_{index} 🍔",
+        'phone': '0599123456',
+        'address': 'غزة، شارع عمر المختار 🏠 بناية ' + str(index) * 3,
+        'quantity': str(index % 5 + 1),
+        'size': 'L' if index % 3 == 0 else '',
+        'language': 'ar',
+        'status': 'new',
+        'created_at': datetime(2026, 1, 1, 12, 0),
+    } for index in range(1, count + 1)]
+
+
+def test_digest_parts_fit_telegram_limit_in_utf16():
+    orders = digest_orders(199)
+    summary, lines = admin_digest_message(orders)
+    parts = split_digest(summary, list(zip(range(1, 200), lines)))
+
+    assert len(parts) > 1
+    for text, _ in parts:
+        assert utf16_len(text) <= TELEGRAM_MESSAGE_LIMIT
+    # كل صف في جزء واحد فقط وبالترتيب، والملخص في الجزء الأول
+    assert [outbox_id for _, ids in parts for outbox_id in ids] == list(range(1, 200))
+    assert parts[0][0].startswith(f"(1/{len(parts)})\n📦")
+
+
+def test_digest_escapes_customer_markdown():
+    summary, lines = admin_digest_message(digest_orders(2))
+    assert 'عميل\\_1' in lines[0]
+
+
+def test_single_part_has_no_numbering():
+    parts = split_digest("📦 summary", [(1, "🍕 one"), (2, "👕 two")])
+    assert parts == [("📦 summary\n🍕 one\n👕 two", [1, 2])]
+
+
+def test_overlong_line_is_truncated_without_splitting_emoji():
+    line = "🍕" * 3000
+    parts = split_digest("S", [(1, line)])
+    for text, _ in parts:
+        assert utf16_len(text) <= TELEGRAM_MESSAGE_LIMIT
+        text.encode('utf-8')
+    assert truncate_utf16("a🍕", 2) == "a"
+
+
+def test_digest_keeps_legacy_quantity_text():
+    orders = digest_orders(3)
+    for order in orders:
+        order['product'] = PRODUCTS[0]
+    orders[0]['quantity'] = 'نصف_كيلو'
+    orders[1]['quantity'] = None
+    orders[2]['quantity'] = '4'
+
+    summary, lines = admin_digest_message(orders)
+    assert '🍕 Pizza × 4 + نصف\\_كيلو' in summary
+    assert len(lines) == 3
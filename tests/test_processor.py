@@ -0,0 +1,60 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from telegram import Update
+
+from processor import ChatOrderedUpdateProcessor
+
+
+def update_from(chat_id):
+    update = MagicMock(spec=Update)
+    update.effective_chat.id = chat_id
+    return update
+
+
+async def process(processor, updates):
+    """تشغيل (chat_id، الوسم، مدة النوم) معاً؛ يرجع سجل البدء والانتهاء ومعالجة متزامنة قصوى"""
+    log = []
+    running = {'now': 0, 'max': 0}
+
+    async def handler(label, delay):
+        log.append(('start', label))
+        running['now'] += 1
+        running['max'] = max(running['max'], running['now'])
+        await asyncio.sleep(delay)
+        running['now'] -= 1
+        log.append(('end', label))
+
+    await processor.initialize()
+    await asyncio.gather(*(processor.do_process_update(update_from(chat_id), handler(label, delay))
+                           for chat_id, label, delay in updates))
+    return log, running['max']
+
+
+def test_same_chat_updates_run_in_arrival_order():
+    processor = ChatOrderedUpdateProcessor(workers=4)
+    log, _ = asyncio.run(process(processor, [(1, 'first', 0.05), (1, 'second', 0), (1, 'third', 0)]))
+    assert log == [('start', 'first'), ('end', 'first'), ('start', 'second'), ('end', 'second'),
+                   ('start', 'third'), ('end', 'third')]
+    assert processor.info()['chats'] == 0
+    assert processor.stats['processed'] == 3
+
+
+def test_different_chats_run_in_parallel():
+    processor = ChatOrderedUpdateProcessor(workers=4)
+    log, concurrent = asyncio.run(process(processor, [(1, 'a', 0.05), (2, 'b', 0.05), (3, 'c', 0.05)]))
+    assert concurrent == 3
+    assert log[:3] == [('start', 'a'), ('start', 'b'), ('start', 'c')]
+
+
+def test_workers_bound_concurrency():
+    processor = ChatOrderedUpdateProcessor(workers=2)
+    _, concurrent = asyncio.run(process(processor, [(chat, chat, 0.02) for chat in range(6)]))
+    assert concurrent == 2
+
+
+def test_slow_chat_does_not_delay_others():
+    processor = ChatOrderedUpdateProcessor(workers=4)
+    log, _ = asyncio.run(process(processor, [(1, 'slow', 0.1), (1, 'queued', 0), (2, 'other', 0)]))
+    assert log.index(('end', 'other')) < log.index(('end', 'slow'))
+    assert log.index(('start', 'queued')) > log.index(('end', 'slow'))
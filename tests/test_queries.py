@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from queries import QUERIES, QueryRegistry, compile_sql, cursor_dialect
+
+
+def test_compile_sql_only_rewrites_for_sqlite():
+    query = 'SELECT * FROM orders WHERE id = %s AND merchant_id = %s'
+    assert compile_sql(query, 'postgresql') == query
+    assert compile_sql(query, 'sqlite') == 'SELECT * FROM orders WHERE id = ? AND merchant_id = ?'
+
+
+def test_dialect_specific_queries_are_compiled_per_dialect():
+    registry = QueryRegistry()
+    registry.register('now', {'postgresql': 'SELECT now() + %s', 'sqlite': "SELECT datetime('now', %s)"})
+    assert registry.sql('now', 'postgresql') == 'SELECT now() + %s'
+    assert registry.sql('now', 'sqlite') == "SELECT datetime('now', ?)"
+
+
+@pytest.mark.parametrize('name', sorted(QUERIES.stats()))
+def test_every_named_query_compiles_on_sqlite(engine, name):
+    sql = QUERIES.sql(name, 'sqlite')
+    with engine.cursor() as cursor:
+        assert cursor_dialect(cursor) == 'sqlite'
+        # EXPLAIN يحلل الاستعلام ويخططه على المخطط الفعلي دون تنفيذه
+        cursor.execute('EXPLAIN ' + sql, [None] * sql.count('?'))
+
+
+def test_execute_records_calls_and_errors(engine):
+    registry = QueryRegistry()
+    registry.register('count', 'SELECT COUNT(*) AS count FROM orders WHERE merchant_id = %s')
+    registry.register('broken', 'SELECT * FROM missing_table WHERE id = %s')
+    with engine.cursor() as cursor:
+        assert registry.execute(cursor, 'count', (1,)).fetchone()['count'] == 0
+        registry.execute(cursor, 'count', (2,))
+    with pytest.raises(Exception):
+        with engine.cursor() as cursor:
+            registry.execute(cursor, 'broken', (1,))
+
+    stats = registry.stats()
+    assert (stats['count']['calls'], stats['count']['errors']) == (2, 0)
+    assert stats['count']['avg_ms'] is not None
+    assert (stats['broken']['calls'], stats['broken']['errors']) == (1, 1)
+
+
+def test_async_execute_uses_prepared_statements():
+    class FakeAsyncCursor:
+        calls = []
+
+        async def execute(self, query, params, prepare=False):
+            self.calls.append((query, params, prepare))
+
+    registry = QueryRegistry()
+    registry.register('get_order', 'SELECT * FROM orders WHERE id = %s')
+    asyncio.run(registry.execute_async(FakeAsyncCursor(), 'get_order', (7,)))
+    assert FakeAsyncCursor.calls == [('SELECT * FROM orders WHERE id = %s', (7,), True)]
+    assert registry.stats()['get_order']['calls'] == 1
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import insert_order
+from rollups import OrderRollups
+from timezones import TIMESTAMP_FORMAT, MerchantTimezones, local_today
+
+
+@pytest.fixture
+def rollups(engine):
+    return OrderRollups(engine, MerchantTimezones(lambda merchant_id: None))
+
+
+def today_row(rollups):
+    rows = rollups.daily(1, days=1)
+    return rows[0] if rows else {'total_orders': 0, 'completed_orders': 0}
+
+
+def dirty_rows(engine):
+    with engine.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) AS count FROM order_rollup_dirty')
+        return cursor.fetchone()['count']
+
+
+def now_utc(engine):
+    with engine.cursor() as cursor:
+        cursor.execute("SELECT strftime('%Y-%m-%d %H:%M:%S', 'now') AS now")
+        return cursor.fetchone()['now']
+
+
+def test_refresh_folds_claimed_hours(engine, rollups):
+    now = now_utc(engine)
+    with engine.cursor() as cursor:
+        order_ids = [insert_order(cursor, now) for _ in range(3)]
+    assert rollups.refresh() == 1
+    assert dirty_rows(engine) == 0
+    assert today_row(rollups)['total_orders'] == 3
+
+    # لا تغييرات جديدة: لا شيء يُعاد حسابه
+    assert rollups.refresh() == 0
+
+    with engine.cursor() as cursor:
+        cursor.execute("UPDATE orders SET status = 'completed' WHERE id = ?", (order_ids[0],))
+    rollups.refresh()
+    row = today_row(rollups)
+    assert (row['total_orders'], row['completed_orders']) == (3, 1)
+    assert rollups.daily(1, days=1)[0]['date'] == local_today(rollups.timezones.get(1))
+
+
+def test_failed_refresh_keeps_dirty_rows(engine, rollups, monkeypatch):
+    with engine.cursor() as cursor:
+        insert_order(cursor, now_utc(engine))
+    pending = dirty_rows(engine)
+
+    def broken(dialect):
+        raise RuntimeError('rebuild failed')
+    monkeypatch.setattr('rollups.rebuild_hour_sql', broken)
+    with pytest.raises(RuntimeError):
+        rollups.refresh()
+    # الحجز بـ DELETE ... RETURNING يعود مع الـ rollback
+    assert dirty_rows(engine) == pending
+
+    monkeypatch.undo()
+    rollups.refresh()
+    assert today_row(rollups)['total_orders'] == 1
+
+
+def test_refresh_if_stale_is_throttled(engine, rollups):
+    rollups.max_age = 3600
+    rollups.refresh()
+    with engine.cursor() as cursor:
+        insert_order(cursor, now_utc(engine))
+    assert rollups.refresh_if_stale() == 0
+    assert today_row(rollups)['total_orders'] == 0
+
+    rollups.max_age = 0
+    assert rollups.refresh_if_stale() == 1
+    assert today_row(rollups)['total_orders'] == 1
+
+
+@pytest.mark.parametrize('zone', ['Asia/Kolkata', 'Asia/Tehran'])
+def test_half_hour_zone_splits_utc_hour_at_local_midnight(engine, zone):
+    rollups = OrderRollups(engine, MerchantTimezones(lambda merchant_id: {'settings': {'timezone': zone}}))
+    tz = rollups.timezones.get(1)
+    midnight = datetime(2026, 3, 2, tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+    with engine.cursor() as cursor:
+        insert_order(cursor, (midnight - timedelta(minutes=20)).strftime(TIMESTAMP_FORMAT))
+        insert_order(cursor, (midnight + timedelta(minutes=10)).strftime(TIMESTAMP_FORMAT))
+    rollups.refresh()
+
+    with engine.cursor() as cursor:
+        cursor.execute("SELECT day, count FROM order_rollups_daily WHERE dimension = 'status' ORDER BY day")
+        assert [(str(row['day']), row['count']) for row in cursor.fetchall()] == \
+            [('2026-03-01', 1), ('2026-03-02', 1)]
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import telegram.error
+
+from scheduler import ADMIN_PRIORITY, REPORT_PRIORITY, SendScheduler, TokenBucket
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2, capacity=1)
+    now = bucket.updated
+    assert bucket.wait_time(now) == 0
+    bucket.take(now)
+    assert bucket.wait_time(now) == 0.5
+    assert bucket.wait_time(now + 0.5) == 0
+    assert bucket.idle(now + 10)
+
+
+def run_sends(scheduler, sends, hold=0.05):
+    """إرسال (الوسم، chat_id، الأولوية) أثناء توقف الجدولة ثم إرجاع ترتيب التنفيذ"""
+    order = []
+
+    async def send(label, chat_id, rate_limit_args):
+        async def callback():
+            order.append(label)
+            return label
+        return await scheduler.process_request(callback, (), {}, 'sendMessage', {'chat_id': chat_id},
+                                               rate_limit_args)
+
+    async def scenario():
+        await scheduler.initialize()
+        scheduler._paused_until = time.monotonic() + hold
+        results = await asyncio.gather(*(send(*item) for item in sends))
+        await scheduler.shutdown()
+        return results
+
+    results = asyncio.run(scenario())
+    assert results == [label for label, _, _ in sends]
+    return order
+
+
+def test_higher_priority_sends_first():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=1000, chat_burst=1000)
+    order = run_sends(scheduler, [
+        ('report', 1, REPORT_PRIORITY),
+        ('admin', 2, ADMIN_PRIORITY),
+        ('customer', 3, None),
+        ('customer 2', 4, {'priority': 'unknown'}),
+    ])
+    assert order == ['customer', 'customer 2', 'admin', 'report']
+
+
+def test_busy_chat_does_not_block_other_chats():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=20, chat_burst=1)
+    order = run_sends(scheduler, [('a1', 1, None), ('a2', 1, None), ('b1', 2, None)], hold=0)
+    assert order == ['a1', 'b1', 'a2']
+
+
+def test_retry_after_pauses_and_retries():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=1000, chat_burst=1000, max_retries=2)
+    attempts = []
+
+    async def callback():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise telegram.error.RetryAfter(0.05)
+        return 'sent'
+
+    async def scenario():
+        await scheduler.initialize()
+        result = await scheduler.process_request(callback, (), {}, 'sendMessage', {'chat_id': 1}, None)
+        await scheduler.shutdown()
+        return result
+
+    assert asyncio.run(scenario()) == 'sent'
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.04
+    assert scheduler.stats['retry_after'] == 1
+    assert scheduler.stats['sent'] == 1
+
+
+def test_requests_without_chat_bypass_queue():
+    scheduler = SendScheduler()
+
+    async def callback():
+        return 'updates'
+
+    async def scenario():
+        await scheduler.initialize()
+        scheduler._paused_until = time.monotonic() + 60
+        result = await asyncio.wait_for(
+            scheduler.process_request(callback, (), {}, 'getUpdates', {}, None), 1)
+        await scheduler.shutdown()
+        return result
+
+    assert asyncio.run(scenario()) == 'updates'
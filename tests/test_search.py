@@ -0,0 +1,59 @@
+import pytest
+
+from conftest import ORDER_INSERT
+from OrderlyBot import Database
+from search import normalize_text, phone_key, search_key, search_pattern
+
+PHONE_FORMS = ['0599123456', '+970599123456', '00970599123456', '+972599123456', '0599-123-456',
+               '0599 123 456', '+970 (599) 123 456', '٠٥٩٩١٢٣٤٥٦']
+
+
+@pytest.mark.parametrize('phone', PHONE_FORMS)
+def test_phone_forms_share_one_key(phone):
+    assert phone_key(phone) == '599123456'
+    assert search_pattern(phone) == '%599123456%'
+
+
+def test_short_numbers_keep_their_digits():
+    # رمز الدولة يُحذف فقط إذا تبعه رقم كامل
+    assert phone_key('9705') == '9705'
+    assert search_pattern('0599') == '%599%'
+    assert search_pattern('0') == '%0%'
+
+
+def test_text_terms_are_folded():
+    assert normalize_text('أحمد') == normalize_text('احمد') == 'احمد'
+    assert normalize_text('مُحَمَّد') == 'محمد'
+    assert search_pattern(' 50%_off ') == '%50off%'
+    assert search_key('أحمد', 'Pizza', '+970 599 123 456') == 'احمد pizza 599123456'
+
+
+@pytest.fixture
+def db(engine):
+    with engine.cursor() as cursor:
+        for name, phone, product in [('أحمد علي', '0599123456', '🍕 Pizza'),
+                                     ('Sara', '+970 562 000 111', 'فستان أحمر'),
+                                     ('Omar', '0597777777', 'Shoes')]:
+            cursor.execute(ORDER_INSERT, ('food', product, name, phone, 'Gaza', '1', '', 'ar', 1, 'new',
+                                          '2026-03-01 10:00:00'))
+    return Database(engine)
+
+
+def found(db, term):
+    return sorted(order['customer_name'] for order in db.get_orders_page(search_term=term)['orders'])
+
+
+@pytest.mark.parametrize('phone', PHONE_FORMS)
+def test_search_matches_stored_phone_in_any_form(db, phone):
+    assert found(db, phone) == ['أحمد علي']
+
+
+def test_search_matches_international_stored_phone(db):
+    assert found(db, '0562000111') == ['Sara']
+    assert found(db, '562 000') == ['Sara']
+
+
+def test_search_by_folded_name_and_product(db):
+    assert found(db, 'احمد') == ['أحمد علي']
+    assert found(db, 'فستان احمر') == ['Sara']
+    assert found(db, 'pizza') == ['أحمد علي']
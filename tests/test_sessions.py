@@ -0,0 +1,111 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from sessions import Session, SessionPersistence
+
+
+class FakeApplication:
+    def __init__(self, user_data):
+        self.user_data = user_data
+
+    def drop_user_data(self, user_id):
+        del self.user_data[user_id]
+
+
+def rows(engine):
+    with engine.cursor() as cursor:
+        cursor.execute('SELECT user_id, data FROM bot_sessions ORDER BY user_id')
+        return {row['user_id']: row['data'] for row in cursor.fetchall()}
+
+
+def test_session_behaves_like_user_data():
+    session = Session()
+    session['lang'] = 'ar'
+    assert session['lang'] == 'ar' and session.get('name', '-') == '-'
+    assert 'lang' in session and 'name' not in session and len(session) == 1
+    with pytest.raises(KeyError):
+        session['name']
+    with pytest.raises(KeyError):
+        session['unknown'] = 1
+    session.clear()
+    assert not session
+
+
+def test_session_is_stored_compactly():
+    session = Session(lang='ar', product='🍕 Pizza', step='phone')
+    assert not hasattr(session, '__dict__')
+    assert session.dumps() == '{"lang":"ar","product":"🍕 Pizza","step":"phone"}'
+
+
+def test_sessions_survive_a_restart(engine):
+    persistence = SessionPersistence(engine)
+
+    async def scenario():
+        await persistence.update_user_data(1, Session(lang='en', step='name'))
+        await persistence.update_user_data(2, Session(lang='ar', name='أحمد'))
+        await persistence.flush()
+        return await SessionPersistence(engine).get_user_data()
+
+    restored = asyncio.run(scenario())
+    assert {user_id: session.to_dict() for user_id, session in restored.items()} == {
+        1: {'lang': 'en', 'step': 'name'},
+        2: {'lang': 'ar', 'name': 'أحمد'},
+    }
+    assert persistence.stats['flushes'] == 1 and persistence.stats['written'] == 2
+
+
+def test_finished_order_drops_the_row(engine):
+    persistence = SessionPersistence(engine)
+
+    async def scenario():
+        session = Session(lang='ar')
+        await persistence.update_user_data(1, session)
+        await persistence.flush()
+        session.clear()
+        await persistence.update_user_data(1, session)
+        await persistence.flush()
+
+    asyncio.run(scenario())
+    assert rows(engine) == {}
+
+
+def test_eviction_removes_stale_sessions(engine):
+    persistence = SessionPersistence(engine, ttl=60)
+    stale = Session(lang='ar')
+    stale.touched = time.time() - 120
+    application = FakeApplication({1: stale, 2: Session(), 3: Session(lang='en')})
+
+    async def scenario():
+        for user_id, session in application.user_data.items():
+            await persistence.update_user_data(user_id, session)
+        await persistence.flush()
+        await persistence.evict(application)
+
+    asyncio.run(scenario())
+    assert list(application.user_data) == [3]
+    assert list(rows(engine)) == [3]
+    assert persistence.stats['evicted'] == 2
+
+
+def test_failed_flush_is_retried(engine, monkeypatch):
+    persistence = SessionPersistence(engine)
+
+    @contextmanager
+    def unavailable():
+        raise ConnectionError('database down')
+        yield
+
+    async def scenario():
+        await persistence.update_user_data(1, Session(lang='ar'))
+        monkeypatch.setattr(engine, 'cursor', unavailable)
+        await persistence.flush()
+        assert persistence.info()['pending'] == 1
+        monkeypatch.undo()
+        await persistence.flush()
+
+    asyncio.run(scenario())
+    assert list(rows(engine)) == [1]
+    assert persistence.stats['last_error'] == 'database down'
@@ -0,0 +1,91 @@
+import threading
+import time
+
+from conftest import insert_order
+from OrderlyBot import Database
+from stats_cache import StatsCache
+
+ORDER = {'category': 'food', 'product': '🍕 Pizza', 'name': 'Ahmad', 'phone': '0599123456',
+         'address': 'Gaza, Omar St.', 'quantity': '2', 'size': '', 'lang': 'ar'}
+
+
+def test_get_or_load_caches_until_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    cache = StatsCache(ttl=5)
+    loads = []
+
+    def loader():
+        loads.append(now[0])
+        return len(loads)
+
+    assert cache.get_or_load('stats', loader) == 1
+    now[0] += 4
+    assert cache.get_or_load('stats', loader) == 1
+    now[0] += 2
+    assert cache.get_or_load('stats', loader) == 2
+    assert loads == [100.0, 106.0]
+
+
+def test_concurrent_misses_load_once():
+    cache = StatsCache(ttl=60)
+    loads = []
+    barrier = threading.Barrier(8)
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.05)
+        return 'stats'
+
+    def read():
+        barrier.wait()
+        assert cache.get_or_load('stats', loader) == 'stats'
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+
+
+def test_load_started_before_invalidation_is_not_cached():
+    cache = StatsCache(ttl=60)
+
+    def loader():
+        # كتابة تحدث أثناء التحميل
+        cache.invalidate()
+        return 'stale'
+
+    assert cache.get_or_load('stats', loader) == 'stale'
+    assert cache.get('stats') == (False, None)
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_database_writes_invalidate_stats(engine):
+    db = Database(engine)
+    assert db.get_order_stats(1)['total'] == 0
+
+    order_id = db.add_order(ORDER)
+    assert db.get_order_stats(1)['new'] == 1
+
+    db.update_order_status(order_id, 'completed')
+    stats = db.get_order_stats(1)
+    assert (stats['new'], stats['completed']) == (0, 1)
+
+    db.add_orders([ORDER, ORDER])
+    assert db.get_order_stats(1)['total'] == 3
+
+    db.delete_order(order_id)
+    assert db.get_order_stats(1)['total'] == 2
+
+
+def test_stats_are_served_from_cache_between_writes(engine):
+    db = Database(engine)
+    db.add_order(ORDER)
+    assert db.get_order_stats(1)['total'] == 1
+    # كتابة لا تمر عبر Database لا تظهر قبل انتهاء المدة
+    with engine.cursor() as cursor:
+        insert_order(cursor, '2026-01-01 12:00:00')
+    assert db.get_order_stats(1)['total'] == 1
+    assert db.cache.stats()['hits'] >= 1
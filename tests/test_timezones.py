@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from conftest import insert_order
+from OrderlyBot import Database
+from timezones import (DEFAULT_TIMEZONE, TIMESTAMP_FORMAT, MerchantTimezones, date_range, day_range, local_date,
+                       parse_timezone)
+
+GAZA = ZoneInfo('Asia/Gaza')
+LOS_ANGELES = ZoneInfo('America/Los_Angeles')
+
+
+def test_parse_timezone_from_settings():
+    assert parse_timezone('{"timezone": "Asia/Gaza"}') == GAZA
+    assert parse_timezone({'timezone': 'America/Los_Angeles'}) == LOS_ANGELES
+    assert parse_timezone(None) == ZoneInfo(DEFAULT_TIMEZONE)
+    assert parse_timezone('not json') == ZoneInfo(DEFAULT_TIMEZONE)
+    assert parse_timezone({'timezone': 'Mars/Olympus'}) == ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def test_date_range_is_local_midnight_in_utc():
+    assert date_range(GAZA, date(2026, 1, 10), date(2026, 1, 10)) == ('2026-01-09 22:00:00', '2026-01-10 22:00:00')
+    # يوم التحويل إلى التوقيت الصيفي في لوس أنجلوس 23 ساعة فقط
+    assert date_range(LOS_ANGELES, date(2026, 3, 8), date(2026, 3, 8)) == ('2026-03-08 08:00:00',
+                                                                           '2026-03-09 07:00:00')
+
+
+def test_day_range_follows_the_merchant_day():
+    now = datetime(2026, 1, 10, 23, 30, tzinfo=timezone.utc)
+    # 23:30 UTC هو 01:30 من اليوم التالي في غزة و 15:30 من اليوم نفسه في لوس أنجلوس
+    assert day_range(GAZA, now=now) == ('2026-01-10 22:00:00', '2026-01-11 22:00:00')
+    assert day_range(LOS_ANGELES, now=now) == ('2026-01-10 08:00:00', '2026-01-11 08:00:00')
+    assert day_range(GAZA, days=7, now=now) == ('2026-01-04 22:00:00', '2026-01-11 22:00:00')
+
+
+def test_local_date_of_stored_utc_timestamp():
+    stored = datetime(2026, 1, 10, 23, 30)
+    assert local_date(GAZA, stored) == date(2026, 1, 11)
+    assert local_date(LOS_ANGELES, stored) == date(2026, 1, 10)
+
+
+def test_merchant_timezones_are_cached_until_invalidated():
+    loads = []
+
+    def load_merchant(merchant_id):
+        loads.append(merchant_id)
+        return {'settings': {'timezone': 'Asia/Gaza'}}
+
+    timezones = MerchantTimezones(load_merchant, ttl=60)
+    assert timezones.get(1) == timezones.get(1) == GAZA
+    assert loads == [1]
+    timezones.invalidate(1)
+    timezones.get(1)
+    assert loads == [1, 1]
+
+
+def test_today_stats_use_the_merchant_local_day(engine):
+    with engine.cursor() as cursor:
+        cursor.execute('UPDATE merchants SET settings = ? WHERE id = 1', ('{"timezone": "America/Los_Angeles"}',))
+        start, _ = day_range(LOS_ANGELES)
+        midnight = datetime.strptime(start, TIMESTAMP_FORMAT)
+        insert_order(cursor, (midnight - timedelta(minutes=1)).strftime(TIMESTAMP_FORMAT))
+        insert_order(cursor, (midnight + timedelta(minutes=1)).strftime(TIMESTAMP_FORMAT))
+
+    stats = Database(engine).get_order_stats(1)
+    assert (stats['total'], stats['today']) == (2, 1)
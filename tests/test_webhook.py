@@ -0,0 +1,24 @@
+import asyncio
+import os
+import signal
+from unittest.mock import AsyncMock, MagicMock
+
+from webhook import UpdateReceiver, run_webhook
+
+
+def test_sigterm_runs_full_shutdown_sequence():
+    calls = []
+    application = MagicMock()
+    for name in ('initialize', 'start', 'stop', 'shutdown'):
+        setattr(application, name, AsyncMock(side_effect=lambda name=name: calls.append(name)))
+    for name in ('post_init', 'post_stop', 'post_shutdown'):
+        setattr(application, name, AsyncMock(side_effect=lambda app, name=name: calls.append(name)))
+    receiver = UpdateReceiver(secret='secret')
+
+    async def main():
+        asyncio.get_running_loop().call_later(0.05, os.kill, os.getpid(), signal.SIGTERM)
+        await run_webhook(application, receiver, url='')
+
+    asyncio.run(main())
+    assert calls == ['initialize', 'post_init', 'start', 'stop', 'post_stop', 'shutdown', 'post_shutdown']
+    assert not receiver.ready
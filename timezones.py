@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# ================= MERCHANT TIMEZONES =================
+# created_at يُخزن بتوقيت UTC. "اليوم" و"الأسبوع" يُحسبان بتوقيت التاجر
+# (merchants.settings -> timezone) ثم يُحوّلان إلى نطاق [بداية، نهاية) بتوقيت UTC
+# حتى تبقى الشروط على created_at مباشرة ويُستخدم فهرسه.
+
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Asia/Riyadh")
+TIMEZONE_CACHE_TTL = float(os.getenv("TIMEZONE_CACHE_TTL", 300))
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_timezone(settings):
+    """منطقة التاجر الزمنية من settings (JSONB في PostgreSQL ونص JSON في SQLite)"""
+    if isinstance(settings, str):
+        try:
+            settings = json.loads(settings)
+        except ValueError:
+            settings = {}
+    name = (settings or {}).get('timezone') or DEFAULT_TIMEZONE
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        print(f"⚠️ Unknown merchant timezone {name!r}, using {DEFAULT_TIMEZONE}")
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def _utc_timestamp(moment):
+    return moment.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def local_today(tz, now=None):
+    """تاريخ اليوم بتوقيت التاجر"""
+    return (now or datetime.now(timezone.utc)).astimezone(tz).date()
+
+
+def local_date(tz, utc_moment):
+    """اليوم المحلي لوقت UTC مخزن بدون منطقة"""
+    return utc_moment.replace(tzinfo=timezone.utc).astimezone(tz).date()
+
+
+def date_range(tz, first_day, last_day):
+    """نطاق نصف مفتوح [بداية first_day، بداية اليوم التالي لـ last_day) بتوقيت UTC"""
+    start = datetime.combine(first_day, datetime.min.time(), tz)
+    end = datetime.combine(last_day + timedelta(days=1), datetime.min.time(), tz)
+    return _utc_timestamp(start), _utc_timestamp(end)
+
+
+def day_range(tz, days=1, now=None):
+    """نطاق نصف مفتوح لآخر days أيام محلية (اليوم ضمنها) بتوقيت UTC"""
+    today = local_today(tz, now)
+    return date_range(tz, today - timedelta(days=days - 1), today)
+
+
+class MerchantTimezones:
+    """كاش صغير لمنطقة كل تاجر حتى لا تُقرأ settings مع كل إحصائية"""
+
+    def __init__(self, load_merchant, ttl=TIMEZONE_CACHE_TTL):
+        # load_merchant(merchant_id): يرجع صف التاجر أو None
+        self.load_merchant = load_merchant
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, merchant_id):
+        with self._lock:
+            entry = self._entries.get(merchant_id)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+
+        merchant = self.load_merchant(merchant_id)
+        tz = parse_timezone(merchant['settings'] if merchant else None)
+        with self._lock:
+            self._entries[merchant_id] = (time.monotonic() + self.ttl, tz)
+        return tz
+
+    def invalidate(self, merchant_id=None):
+        with self._lock:
+            if merchant_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(merchant_id, None)
@@ -0,0 +1,124 @@
+import asyncio
+import hmac
+import os
+import secrets
+import signal
+
+from telegram import Update
+
+# ================= WEBHOOK CONFIGURATION =================
+# BOT_MODE=polling (الافتراضي) أو webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# الرابط العام للخدمة؛ Render يعرّف RENDER_EXTERNAL_URL تلقائياً
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+# يُرسل مع set_webhook ويعيده Telegram في ترويسة كل طلب؛ عشوائي إذا لم يُحدد
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_QUEUE_TIMEOUT = float(os.getenv("WEBHOOK_QUEUE_TIMEOUT", 5))
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# ================= UPDATE RECEIVER =================
+# مسار Flask (خيط WSGI) يستقبل التحديث ويضعه في update_queue الخاص بـ Application
+# داخل حلقة أحداث البوت، فتُعالج التحديثات بنفس المعالجات كما في polling.
+
+
+class UpdateReceiver:
+    """جسر بين مسار الـ webhook في Flask وطابور تحديثات البوت"""
+
+    def __init__(self, secret=WEBHOOK_SECRET, queue_timeout=WEBHOOK_QUEUE_TIMEOUT):
+        self.secret = secret
+        self.queue_timeout = queue_timeout
+        self.application = None
+        self.loop = None
+        self.stats = {'received': 0, 'queued': 0, 'rejected': 0, 'invalid': 0}
+
+    @property
+    def ready(self):
+        return self.application is not None
+
+    def attach(self, application, loop):
+        self.application = application
+        self.loop = loop
+
+    def detach(self):
+        self.application = None
+        self.loop = None
+
+    def check_secret(self, token):
+        """مقارنة بزمن ثابت مع السر المرسل في الترويسة"""
+        self.stats['received'] += 1
+        if not token or not hmac.compare_digest(token, self.secret):
+            self.stats['rejected'] += 1
+            return False
+        return True
+
+    def submit(self, data):
+        """تحويل JSON إلى Update ووضعه في الطابور؛ يرجع False إذا كان غير صالح"""
+        try:
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            print(f"⚠️ Invalid webhook update: {e}")
+            update = None
+        if update is None:
+            self.stats['invalid'] += 1
+            return False
+
+        future = asyncio.run_coroutine_threadsafe(self.application.update_queue.put(update), self.loop)
+        future.result(timeout=self.queue_timeout)
+        self.stats['queued'] += 1
+        return True
+
+
+async def run_webhook(application, receiver, url=WEBHOOK_URL, path=WEBHOOK_PATH):
+    """تشغيل Application بدون polling؛ التحديثات تصل عبر receiver
+
+    بدون url لا يُسجل webhook عند Telegram (للتجربة المحلية بإرسال JSON مسجل).
+    SIGTERM (إعادة النشر على Render) و SIGINT يوقفانه بنفس تسلسل run_polling:
+    stop ثم post_stop ثم shutdown ثم post_shutdown، فتُكتب الطلبات المعلقة وتُحفظ الجلسات.
+    """
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    handled = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+            handled.append(sig)
+        except (NotImplementedError, RuntimeError):
+            # Windows أو خارج الخيط الرئيسي
+            pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+
+        if url:
+            await application.bot.set_webhook(
+                url=url.rstrip('/') + path,
+                secret_token=receiver.secret,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,
+            )
+            print(f"✅ Webhook registered at {url.rstrip('/')}{path}")
+        else:
+            print(f"ℹ️ WEBHOOK_URL not set; post updates to {path} with the {SECRET_HEADER} header")
+
+        await application.start()
+        receiver.attach(application, loop)
+        try:
+            await stop_event.wait()
+            print("🛑 Stop signal received; shutting down the bot...")
+        finally:
+            receiver.detach()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    finally:
+        try:
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+        finally:
+            for sig in handled:
+                loop.remove_signal_handler(sig)